@@ -0,0 +1,172 @@
+'''
+End-to-end benchmark of m2h on synthetic METS files.
+
+For every file size the phases parse, mapping (build_work_json,
+build_version_json, build_data_object_json), registration and METS write
+are timed separately, followed by a complete m2h run. Optionally a batch of
+files is registered with run_batch. The handle server and the DTR are
+replaced by the local server from mets2handle.local_server, so no network
+access is needed. The results are written as JSON.
+
+Usage:
+    python benchmarks/bench_end_to_end.py [-o results.json] [--scale contributors=10,100,1000]
+        [--batch-files 200 --jobs 4] [--latency 0.02] [--works 2 ...]
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Keep the caches of the benchmark apart from the ones of real runs
+WORK_DIR = tempfile.mkdtemp(prefix='m2h-bench-')
+os.environ['METS2HANDLE_CACHE_DIR'] = os.path.join(WORK_DIR, 'cache')
+os.environ['METS2HANDLE_SNAPSHOT'] = os.path.join(WORK_DIR, 'no-snapshot.pickle')
+
+from lxml import etree as ET
+
+import mets2handle
+from mets2handle import helpers
+from mets2handle.batch import run_batch
+from mets2handle.engine import HandleRecord, register_records
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES, enum_cache
+from mets2handle.local_server import LocalHandleServer
+from mets2handle.mets_index import MetsIndex
+from mets2handle.metstohandle import m2h
+from mets2handle.synthetic import add_size_arguments, sizes_from_args, synthetic_mets, write_corpus
+from mets2handle.xpaths import ns
+
+ENUMS = {
+    KNOWN_ENUM_TYPES['titleType']: ['Original Title', 'Alternative Title'],
+    KNOWN_ENUM_TYPES['creditRole']: ['Director', 'Producer', 'Screenplay'],
+    KNOWN_ENUM_TYPES['genre']: ['Fiction', 'Documentary'],
+    KNOWN_ENUM_TYPES['yearOfReferenceType']: ['Created'],
+    KNOWN_ENUM_TYPES['manifestationType']: ['Restoration', 'Unknown'],
+}
+
+
+def start_server(latency: float) -> LocalHandleServer:
+    server = LocalHandleServer(('127.0.0.1', 0), enums=ENUMS, latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def map_records(xml_tree, prefix: str) -> list[HandleRecord]:
+    """
+    Maps the dmdSecs of a METS to records like m2h does for a new version.
+    """
+    index = MetsIndex(xml_tree)
+    works = [HandleRecord.new('work', prefix, mets2handle.build_work_json(
+        dmdsec, ns, pid_work=None, original_duration=False, related_identifier=False, original_format=False))
+        for dmdsec in index.dmdsecs_of_type('cinematographicWork')]
+    version = HandleRecord.new('version', prefix, None, depends_on=works)
+    data_object = HandleRecord.new('data_object', prefix, None, depends_on=[version])
+    version.payload = mets2handle.build_version_json(
+        index.root, ns, pid_works=[work.pid for work in works],
+        dataobject_pid=[data_object.pid], version_pid=version.pid)
+    data_object.payload = mets2handle.build_data_object_json(
+        index.dmdsecs_of_type('dataObject')[0], ns, data_object.pid, version.pid)
+    return works + [version, data_object]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def bench_file(sizes: dict, credentials: str, repeat: int) -> dict:
+    """
+    Times the phases of m2h for one file of the given sizes (best of repeat).
+    """
+    path = os.path.join(WORK_DIR, 'file.xml')
+    out_file = os.path.join(WORK_DIR, 'file.out.xml')
+    with open(path, 'wb') as f:
+        f.write(synthetic_mets(seed=0, **sizes))
+    connection_details = helpers.read_credentials(credentials)
+    phases = {'parse': [], 'map': [], 'register': [], 'write': [], 'm2h': []}
+    for _ in range(repeat):
+        duration, xml_tree = timed(ET.parse, path, ET.XMLParser(remove_comments=False))
+        phases['parse'].append(duration)
+        duration, records = timed(map_records, xml_tree, connection_details['prefix'])
+        phases['map'].append(duration)
+        duration, _ = timed(register_records, records, connection_details)
+        phases['register'].append(duration)
+        duration, _ = timed(helpers.write_mets, xml_tree, out_file)
+        phases['write'].append(duration)
+        duration, _ = timed(m2h, path, out_file=out_file, credentials=credentials, dumpjsons=False)
+        phases['m2h'].append(duration)
+    return {'sizes': sizes,
+            'bytes': os.path.getsize(path),
+            'records': len(records),
+            'ms': {phase: round(min(durations), 3) for phase, durations in phases.items()},
+            'ms_median': {phase: round(statistics.median(durations), 3) for phase, durations in phases.items()}}
+
+
+def bench_batch(sizes: dict, credentials: str, files: int, jobs: int) -> dict:
+    paths = write_corpus(os.path.join(WORK_DIR, 'corpus'), files, **sizes)
+    duration, report = timed(run_batch, paths, credentials, out_dir=os.path.join(WORK_DIR, 'out'), workers=jobs)
+    return {'sizes': sizes, 'files': files, 'jobs': jobs, 'failed': report['failed'],
+            'seconds': round(duration / 1000, 3), 'files_per_second': round(files / duration * 1000, 2)}
+
+
+def parse_scale(scale: str):
+    name, values = scale.split('=')
+    return name.replace('-', '_'), [int(value) for value in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--out-file', help='Write the results as JSON to this file (default: stdout).')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--scale', help='Size to vary, e.g. contributors=10,100,1000')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency of the local server in seconds.')
+    parser.add_argument('--batch-files', type=int, default=0, help='Files of the batch run (default: no batch).')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes of the batch run.')
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(args.latency)
+    enum_cache.base_url = server.url + '/objects/'
+    enum_cache.seed(ENUMS)
+    credentials = os.path.join(WORK_DIR, 'handle_connection.txt')
+    server.write_credentials(credentials)
+
+    base_sizes = sizes_from_args(args)
+    name, values = parse_scale(args.scale) if args.scale else (None, [None])
+    results = {'python': platform.python_version(),
+               'lxml': '.'.join(map(str, ET.LXML_VERSION)),
+               'platform': platform.platform(),
+               'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+               'latency': args.latency,
+               'files': [],
+               'batch': None}
+    for value in values:
+        sizes = dict(base_sizes, **({name: value} if name else {}))
+        result = bench_file(sizes, credentials, args.repeat)
+        results['files'].append(result)
+        print(f"{json.dumps(sizes)}: {result['bytes']} bytes, "
+              + ', '.join(f'{phase} {ms:.1f} ms' for phase, ms in result['ms'].items()), file=sys.stderr)
+    if args.batch_files:
+        results['batch'] = bench_batch(base_sizes, credentials, args.batch_files, args.jobs)
+        print(f"batch: {results['batch']['files_per_second']} files/s", file=sys.stderr)
+    results['server_requests'] = dict(server.stats)
+    server.shutdown()
+
+    if args.out_file:
+        with open(args.out_file, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
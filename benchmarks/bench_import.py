@@ -0,0 +1,91 @@
+'''
+Import-time benchmark of mets2handle.
+
+Every statement is run in a fresh interpreter with python -X importtime and
+the cumulative import time of the mets2handle modules is reported (best
+of repeat). The run fails if one of the heavy dependencies that are meant to
+be loaded on first use (requests, pycountry, urllib.request, ...) is
+imported by a statement, or if an import takes longer than --max-ms.
+
+Usage:
+    python benchmarks/bench_import.py [-r 5] [--max-ms 50] [-o results.json]
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Statements to time and the modules they must not import
+STATEMENTS = {
+    'package': ('import mets2handle',
+                ('lxml.etree', 'requests', 'pycountry', 'urllib.request', 'asyncio')),
+    'identifier': ('from mets2handle import create_identifier_element',
+                   ('requests', 'pycountry', 'urllib.request', 'asyncio')),
+    'cli': ('import mets2handle.metstohandle',
+            ('requests', 'pycountry', 'urllib.request', 'http.server', 'asyncio')),
+}
+
+CHECK = '''
+import sys
+{statement}
+print(' '.join(name for name in {forbidden!r} if name in sys.modules))
+'''
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(statement: str, forbidden: tuple) -> tuple[float, list[str]]:
+    """
+    Runs statement in a new interpreter and returns the cumulative import
+    time of the mets2handle modules in ms and the forbidden modules loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                              CHECK.format(statement=statement, forbidden=forbidden)],
+                             capture_output=True, text=True, env=env, check=True)
+    microseconds = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Only top level imports of the package, nested ones are included in them
+        if name.strip().startswith('mets2handle') and not name.startswith('  ', 1):
+            microseconds += int(cumulative)
+    loaded = process.stdout.split()
+    return microseconds / 1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--out-file', help='Write the results as JSON to this file (default: stdout).')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Fail if a statement takes longer than this (best of repeat).')
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'statements': {}}
+    failed = False
+    for name, (statement, forbidden) in STATEMENTS.items():
+        timings = []
+        loaded = []
+        for _ in range(args.repeat):
+            ms, loaded = run(statement, forbidden)
+            timings.append(ms)
+        best = min(timings)
+        results['statements'][name] = {'statement': statement, 'ms': round(best, 3), 'forbidden_loaded': loaded}
+        print(f'{statement}: {best:.1f} ms' + (f", loads {', '.join(loaded)}" if loaded else ''), file=sys.stderr)
+        if loaded or (args.max_ms is not None and best > args.max_ms):
+            failed = True
+
+    if args.out_file:
+        with open(args.out_file, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+'''
+Microbenchmark for the mapping of the dmdSecs of a METS to the payloads of
+the work, version and data object records.
+
+Every record is mapped once with the precompiled XPath expressions of
+xpaths.py and once with the same paths evaluated from their strings on
+every call, as the mappers did before. The work record is also mapped in
+two ways: the former path, in which every getter of db_works_to_handle
+searches the dmdSec on its own, and the RecordMapping used by
+build_work_json, which walks the dmdSec once.
+
+The DTR enumerations are seeded with fixed values, so no network access is
+needed.
+
+Usage:
+    python benchmarks/bench_mapping.py [-n <records>] [-c <contributors>]
+'''
+
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from lxml import etree as ET
+
+# Run from a checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mets2handle import db_works_to_handle as works
+from mets2handle import xpaths as xp
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES, enum_cache
+from mets2handle.fingerprints import normalize
+import mets2handle
+
+ns = {"mets": "http://www.loc.gov/METS/", "xlink": "http://www.w3.org/1999/xlink",
+      "xsi": "http://www.w3.org/2001/XMLSchema-instance", "ebucore": "urn:ebu:metadata-schema:ebucore",
+      "dc": "http://purl.org/dc/elements/1.1/"}
+
+ENUMS = {
+    KNOWN_ENUM_TYPES['titleType']: ['Original Title', 'Alternative Title'],
+    KNOWN_ENUM_TYPES['creditRole']: ['Director', 'Producer', 'Screenplay'],
+    KNOWN_ENUM_TYPES['genre']: ['Fiction', 'Documentary'],
+    KNOWN_ENUM_TYPES['yearOfReferenceType']: ['Created'],
+    KNOWN_ENUM_TYPES['manifestationType']: ['Restoration', 'Unknown'],
+}
+
+CONTRIBUTOR = '''
+            <ebucore:contributor>
+              <ebucore:contactDetails contactId="http://d-nb.info/gnd/{i}">
+                <ebucore:name>Family{i}, Given{i}</ebucore:name>
+              </ebucore:contactDetails>
+              <ebucore:role typeLabel="{role}"/>
+            </ebucore:contributor>'''
+
+DMDSEC = '''
+  <mets:dmdSec ID="{id}">
+    <mets:mdWrap MDTYPE="OTHER">
+      <mets:xmlData>
+        <ebucore:ebuCoreMain dateLastModified="2023-05-01Z" timeLastModified="10:00:00Z">
+          <ebucore:coreMetadata>
+            <ebucore:title typeLabel="Original Title">
+              <dc:title>Menschen am Sonntag</dc:title>
+            </ebucore:title>{contributors}
+            <ebucore:identifier formatLabel="local">
+              <dc:identifier>{id}</dc:identifier>
+            </ebucore:identifier>
+            <ebucore:type>
+              <ebucore:genre typeLabel="Fiction"/>
+              <ebucore:objectType typeLabel="Restoration"/>
+            </ebucore:type>
+            <ebucore:date>
+              <ebucore:created startYear="1929" endYear="1930"/>
+              <ebucore:released year="1930"/>
+            </ebucore:date>
+            <ebucore:coverage>
+              <ebucore:spatial>
+                <ebucore:location>
+                  <ebucore:name>Germany</ebucore:name>
+                </ebucore:location>
+              </ebucore:spatial>
+            </ebucore:coverage>
+            <ebucore:description typeLabel="specificCarrierType">
+              <dc:description>DCP</dc:description>
+            </ebucore:description>
+            <ebucore:format>
+              <ebucore:fileSize unit="byte">123456</ebucore:fileSize>
+            </ebucore:format>
+            <ebucore:metadataProvider>
+              <ebucore:organisationDetails organisationId="https://www.deutsche-kinemathek.de">
+                <ebucore:organisationName>Deutsche Kinemathek</ebucore:organisationName>
+              </ebucore:organisationDetails>
+            </ebucore:metadataProvider>
+          </ebucore:coreMetadata>
+        </ebucore:ebuCoreMain>
+      </mets:xmlData>
+    </mets:mdWrap>
+  </mets:dmdSec>'''
+
+
+def synthetic_dmdsec(contributors: int):
+    roles = ['Director', 'cast', 'Producer', 'Screenplay']
+    xml = DMDSEC.format(id='DMD_1', contributors=''.join(
+        CONTRIBUTOR.format(i=i, role=roles[i % len(roles)]) for i in range(contributors)))
+    document = ('<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:ebucore="urn:ebu:metadata-schema:ebucore"'
+                ' xmlns:dc="http://purl.org/dc/elements/1.1/">' + xml + '</mets:mets>')
+    return ET.fromstring(document.encode())[0]
+
+
+def work_with_getters(dmdsec, credit: bool):
+    """
+    The work record as build_work_json built it before the RecordMapping,
+    with its default fields.
+    """
+    values = {'title': works.get_title(dmdsec, ns)}
+    if credit:
+        values['credits'] = works.get_credits(dmdsec, ns)
+    values['cast'] = works.get_cast(dmdsec, ns)
+    values['originalDuration'] = works.get_original_duration(dmdsec, ns)
+    values['source'] = works.get_source(dmdsec, ns)
+    values['lastModified'] = works.get_last_modified(dmdsec, ns)
+    values['productionCompany'] = works.get_production_companies(dmdsec, ns)
+    values['countryOfReference'] = works.get_countries_of_reference(dmdsec, ns)
+    values['yearOfReference'] = works.get_years_of_reference(dmdsec, ns)
+    values['relatedIdentifier'] = works.get_related_identifier(dmdsec, ns)
+    values['originalFormat'] = works.get_original_format(dmdsec, ns)
+    values['genre'] = works.get_genre(dmdsec, ns)
+    return values
+
+
+def uncompiled(path: str):
+    return lambda elem: elem.xpath(path, namespaces=xp.ns)
+
+
+@contextmanager
+def uncompiled_xpaths():
+    """
+    Replaces the expressions of xpaths.py by functions that evaluate their
+    path strings, which lxml parses again on every call.
+    """
+    compiled = {name: value for name, value in vars(xp).items() if isinstance(value, ET.XPath)}
+    attributes = dict(xp.MATERIAL_ATTRIBUTES)
+    try:
+        for name, xpath in compiled.items():
+            setattr(xp, name, uncompiled(xpath.path))
+        for key, xpath in attributes.items():
+            xp.MATERIAL_ATTRIBUTES[key] = uncompiled(xpath.path)
+        yield
+    finally:
+        for name, xpath in compiled.items():
+            setattr(xp, name, xpath)
+        xp.MATERIAL_ATTRIBUTES.update(attributes)
+
+
+def per_record(function, records: int) -> float:
+    start = time.perf_counter()
+    for _ in range(records):
+        function()
+    return (time.perf_counter() - start) / records * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--records', type=int, default=2000)
+    parser.add_argument('-c', '--contributors', type=int, default=20)
+    args = parser.parse_args()
+    enum_cache.seed(ENUMS)
+    dmdsec = synthetic_dmdsec(args.contributors)
+    pid = '21.T11998/0412EF68-FC59-4240-9D5D-EEA25F083873'
+    mappers = {
+        'work getters': lambda: work_with_getters(dmdsec, credit=True),
+        'work': lambda: mets2handle.build_work_json(dmdsec, ns, pid_work=pid, credit=True),
+        'version': lambda: mets2handle.build_version_json(dmdsec, ns, pid_works=[pid], dataobject_pid=[pid],
+                                                          version_pid=pid),
+        'data_object': lambda: mets2handle.build_data_object_json(dmdsec, ns, pid, pid),
+    }
+    # normalize() leaves out the attribution dates, which carry the current time
+    assert normalize(mappers['work getters']()) == normalize(mappers['work']())
+    print(f'{"":12} {"uncompiled":>12} {"compiled":>12}')
+    for name, function in mappers.items():
+        with uncompiled_xpaths():
+            before = function()
+            uncompiled_time = per_record(function, args.records)
+        assert normalize(before) == normalize(function())
+        compiled_time = per_record(function, args.records)
+        print(f'{name:12} {uncompiled_time:9.1f} us {compiled_time:9.1f} us/record '
+              f'({uncompiled_time / compiled_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+Benchmark for resolving the structMap of a METS with many dmdSecs.
+
+Compares the former list based lookup in m2h, which checks every dmdSec
+against lists of DMDIDs, with the MetsIndex.
+
+Usage:
+    python benchmarks/bench_mets_index.py [-n <number_of_dmdsecs>]
+'''
+
+import argparse
+import time
+
+from lxml import etree as ET
+
+from mets2handle.mets_index import MetsIndex
+
+ns = {"mets": "http://www.loc.gov/METS/", "ebucore": "urn:ebu:metadata-schema:ebucore",
+      "dc": "http://purl.org/dc/elements/1.1/"}
+
+
+def synthetic_mets(number_of_dmdsecs: int):
+    """
+    METS with one version, one DataObject and number_of_dmdsecs - 2 works.
+    """
+    root = ET.Element('{http://www.loc.gov/METS/}mets', nsmap={'mets': ns['mets']})
+    struct = ET.Element('{http://www.loc.gov/METS/}structMap')
+    for i in range(number_of_dmdsecs):
+        element_type = 'version' if i == 0 else 'dataObject' if i == 1 else 'cinematographicWork'
+        dmdsec = ET.SubElement(root, '{http://www.loc.gov/METS/}dmdSec', ID=f'DMD_{i}')
+        ET.SubElement(dmdsec, '{http://www.loc.gov/METS/}mdWrap')
+        ET.SubElement(struct, '{http://www.loc.gov/METS/}div', TYPE=element_type, DMDID=f'DMD_{i}')
+    root.append(struct)
+    return ET.ElementTree(root)
+
+
+def resolve_with_lists(xml_tree):
+    struct = xml_tree.find('.//mets:structMap', ns)
+    cinematographic_works, versions, data_objects = [], [], []
+    for div in struct.findall('.//mets:div', ns):
+        element_type = div.get('TYPE')
+        if element_type == 'cinematographicWork':
+            cinematographic_works.append(div.get('DMDID'))
+        elif element_type == 'version':
+            versions.append(div.get('DMDID'))
+        elif element_type == 'dataObject':
+            data_objects.append(div.get('DMDID'))
+    found = []
+    for dmdsec in xml_tree.findall('.//mets:dmdSec', ns):
+        if dmdsec.get('ID') in cinematographic_works:
+            found.append(dmdsec)
+        if dmdsec.get('ID') in versions:
+            found.append(dmdsec)
+        if dmdsec.get('ID') in data_objects:
+            found.append(dmdsec)
+    return found
+
+
+def resolve_with_index(xml_tree):
+    index = MetsIndex(xml_tree)
+    found = index.dmdsecs_of_type('cinematographicWork')
+    found += index.dmdsecs_of_type('version')
+    found += index.dmdsecs_of_type('dataObject')
+    return found
+
+
+def timed(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--dmdsecs', type=int, default=10000)
+    args = parser.parse_args()
+    xml_tree = synthetic_mets(args.dmdsecs)
+    lists_time, lists_found = timed(resolve_with_lists, xml_tree)
+    index_time, index_found = timed(resolve_with_index, xml_tree)
+    assert len(lists_found) == len(index_found) == args.dmdsecs
+    print(f'{args.dmdsecs} dmdSecs: lists {lists_time * 1000:.1f} ms, '
+          f'index {index_time * 1000:.1f} ms ({lists_time / index_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,30 @@
-from .metstohandle import m2h
-from .db_works_to_handle import build_work_json, create_identifier_element
-from .db_version_to_handle import build_version_json
-from .db_data_object_to_handle import build_data_object_json
+'''
+The public functions of the package. They are imported on first access, so
+that importing mets2handle does not load the mapping, lxml or the HTTP
+machinery, see benchmarks/bench_import.py.
+'''
+
+import importlib
+
+# Public names and the modules they are defined in
+_EXPORTS = {
+    'm2h': 'metstohandle',
+    'build_work_json': 'db_works_to_handle',
+    'create_identifier_element': 'db_works_to_handle',
+    'build_version_json': 'db_version_to_handle',
+    'build_data_object_json': 'db_data_object_to_handle',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,361 @@
+'''
+This module implements the batch mode of metstohandle.
+
+A batch registers all METS files of one or more directories, glob patterns
+or manifest files (one path per line). The files are distributed over a
+pool of worker processes. Every worker reads the credentials and fetches
+the DTR enumerations once and keeps them for all files it processes.
+
+DataObjects that are added to a version registered before are registered
+by the workers, but the version records are not updated file by file.
+Their updates are grouped by version PID and every version is fetched and
+written once at the end of the batch, with the DataObjects of all files.
+
+At the end a report with the result of every file is printed and can be written
+to a JSON file.
+
+Usage:
+    metstohandle batch -c <credentials> -P 8 <directory> <glob> ...
+    metstohandle batch -c <credentials> -m <manifest_file>
+    metstohandle batch -c <credentials> -J <journal_file> <directory>
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+from mets2handle.mets_io import SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+
+def collect_mets_files(sources=(), manifests=(), pattern='*.xml') -> list[str]:
+    """
+    Returns the sorted list of METS files given by directories (searched
+    recursively for pattern and its compressed variants, e.g. *.xml.gz),
+    glob patterns, plain paths and manifest files.
+    """
+    files = []
+    for manifest in manifests:
+        with open(manifest, 'r', encoding='utf8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    files.append(line)
+    for source in sources:
+        if os.path.isdir(source):
+            for suffix in ('',) + tuple(SUFFIXES):
+                files.extend(glob.glob(os.path.join(source, '**', pattern + suffix), recursive=True))
+        elif glob.has_magic(source):
+            files.extend(glob.glob(source, recursive=True))
+        else:
+            files.append(source)
+    return sorted(set(files))
+
+
+def out_paths(files: list[str], out_dir: str) -> dict[str, str]:
+    """
+    The output path in out_dir of every file, relative to the directory
+    that contains all files. Files of the same name in different
+    subdirectories do not overwrite each other.
+    """
+    if not files:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(filename)) for filename in files])
+    return {filename: os.path.join(out_dir, os.path.relpath(os.path.abspath(filename), root))
+            for filename in files}
+
+
+def _init_worker(credentials: str):
+    """
+    Warms up the caches of a worker process before it gets its first file.
+    """
+    from mets2handle import helpers
+    from mets2handle.metrics import metrics
+
+    # A forked worker starts with a copy of the registry of the parent. What
+    # it records from here on, including the warm-up, is sent to the parent
+    # with its results
+    metrics.reset()
+    helpers.read_credentials(credentials)
+    try:
+        helpers.warm_up()
+    except OSError as error:
+        logger.warning('BATCH: could not prefetch DTR enums (%s)', error)
+
+
+@lru_cache(maxsize=None)
+def _open_journal(path: str):
+    from mets2handle.journal import BatchJournal
+
+    return BatchJournal(path)
+
+
+def _register_file(filename: str, out_file: str, credentials: str, options: dict,
+                   journal_path: str = None) -> dict:
+    from mets2handle.metrics import metrics
+    from mets2handle.metstohandle import m2h
+
+    start = time.perf_counter()
+    result = {'file': filename, 'ok': True, 'error': None}
+    journal = _open_journal(journal_path).entry(filename) if journal_path else None
+    version_updates = []
+    try:
+        m2h(filename, out_file=out_file, credentials=credentials, journal=journal,
+            version_updates=version_updates, **options)
+        if journal is not None:
+            journal.written(version_updates)
+    except Exception as error:
+        logger.exception('BATCH: registration of %s failed', filename)
+        result['ok'] = False
+        result['error'] = f'{type(error).__name__}: {error}'
+        if journal is not None:
+            journal.failed(result['error'])
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['version_updates'] = version_updates if result['ok'] else []
+    metrics.inc('files', result='ok' if result['ok'] else 'failed')
+    # Everything recorded since the previous result, see _init_worker
+    result['metrics'] = metrics.snapshot(reset=True)
+    return result
+
+
+def coalesce_version_updates(updates: list[dict]) -> dict[str, dict]:
+    """
+    Groups the version updates deferred by m2h by version PID. The
+    DataObjects of all updates of a version are merged in their order, the
+    payload of the last update is kept.
+    """
+    versions = {}
+    for update in updates:
+        merged = versions.setdefault(update['version'], {'data_objects': [], 'payload': None})
+        for pid in update['data_objects']:
+            if pid not in merged['data_objects']:
+                merged['data_objects'].append(pid)
+        merged['payload'] = update['payload']
+    return versions
+
+
+def update_versions(updates: list[dict], credentials: str, refresh: bool = False, fingerprints: str = None,
+                    max_in_flight: int = None, journal=None, ndjson: str = None) -> tuple[list[str], list[dict]]:
+    """
+    Sends the deferred version updates of a batch: every version is fetched
+    once and written once with the DataObjects of all files added. Returns
+    the PIDs of the versions updated and the failures.
+    """
+    from mets2handle import helpers
+    from mets2handle.engine import DEFAULT_MAX_IN_FLIGHT, HandleRecord, register_records
+    from mets2handle.fingerprints import open_store
+    from mets2handle.sinks import open_sinks
+
+    connection_details = helpers.read_credentials(credentials)
+    records = []
+    failures = []
+    for version_pid, merged in coalesce_version_updates(updates).items():
+        try:
+            data_object_pids = helpers.getDAtaObejctPidsFrom_Versionhandle(
+                version_pid, connection_details['url'], connection_details['user'], connection_details['password'])
+        except Exception as error:
+            logger.exception('BATCH: could not fetch version %s', version_pid)
+            failures.append({'version': version_pid, 'error': f'{type(error).__name__}: {error}'})
+            continue
+        new_pids = [pid for pid in merged['data_objects'] if pid not in data_object_pids]
+        if not new_pids and not refresh:
+            if journal is not None:
+                journal.version_updated(version_pid)
+            continue
+        payload = dict(merged['payload'], has_data_objects=data_object_pids + new_pids)
+        records.append(HandleRecord('version', version_pid, payload, update=True))
+    error = None
+    try:
+        register_records(records, connection_details, max_in_flight=max_in_flight or DEFAULT_MAX_IN_FLIGHT,
+                         fingerprints=open_store(fingerprints), sinks=open_sinks(ndjson=ndjson))
+    except Exception as exception:
+        error = f'{type(exception).__name__}: {exception}'
+    updated = []
+    for record in records:
+        if record.handle is None:
+            failures.append({'version': record.pid, 'error': error})
+            continue
+        updated.append(record.pid)
+        if journal is not None:
+            journal.version_updated(record.pid)
+    return updated, failures
+
+
+def run_batch(files: list[str], credentials: str, out_dir: str = None, workers: int = None,
+              dumpjsons: bool = False, journal: str = None, **options) -> dict:
+    """
+    Registers all files with m2h in a pool of worker processes and returns
+    the aggregated report. Without out_dir the files are modified in place,
+    else they are written to out_dir with their paths relative to the
+    directory that contains them all, see out_paths.
+    Further keyword arguments are passed on to m2h. The metrics of all
+    files are merged into the metrics of this process. With a journal file
+    the batch can be resumed, files that were completed before are skipped.
+    Versions registered before that get new DataObjects are updated once at
+    the end, see update_versions.
+    """
+    from mets2handle.metrics import metrics
+
+    options['dumpjsons'] = dumpjsons
+    start = time.perf_counter()
+    results = []
+    version_updates = []
+    skipped = 0
+    batch_journal = None
+    if journal:
+        from mets2handle.journal import BatchJournal
+
+        batch_journal = BatchJournal(journal)
+        written = batch_journal.written_files()
+        remaining = [filename for filename in files if BatchJournal.key(filename) not in written]
+        skipped = len(files) - len(remaining)
+        files = remaining
+        if skipped:
+            logger.info('BATCH: skipping %d files completed before', skipped)
+    out_files = out_paths(files, out_dir) if out_dir else {}
+    for out_file in out_files.values():
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(credentials,)) as executor:
+        futures = []
+        for filename in files:
+            futures.append(executor.submit(_register_file, filename, out_files.get(filename), credentials, options,
+                                           journal))
+        for future in as_completed(futures):
+            result = future.result()
+            metrics.merge(result.pop('metrics'))
+            # With a journal the worker has kept them there already
+            version_updates.extend(result.pop('version_updates'))
+            results.append(result)
+            logger.info('BATCH: %s %s', 'done' if result['ok'] else 'FAILED', result['file'])
+    if batch_journal is not None:
+        # Including the updates left over by an interrupted run
+        version_updates = batch_journal.pending_version_updates()
+    with metrics.span('update_versions'):
+        versions_updated, version_failures = update_versions(
+            version_updates, credentials, refresh=options.get('refresh', False),
+            fingerprints=options.get('fingerprints'), max_in_flight=options.get('max_in_flight'),
+            journal=batch_journal, ndjson=options.get('ndjson'))
+    if batch_journal is not None:
+        batch_journal.close()
+    results.sort(key=lambda result: result['file'])
+    failures = [result for result in results if not result['ok']]
+    return {'total': len(results) + skipped,
+            'skipped': skipped,
+            'succeeded': len(results) - len(failures),
+            'failed': len(failures) + len(version_failures),
+            'seconds': round(time.perf_counter() - start, 3),
+            'versions_updated': versions_updated,
+            'failures': failures,
+            'version_failures': version_failures,
+            'results': results}
+
+
+def print_report(report: dict):
+    print(f"{report['total']} METS files in {report['seconds']} s: {report['succeeded']} registered,"
+          f" {report['skipped']} skipped, {report['failed']} failed.")
+    if report.get('skipped'):
+        print(f"Skipped {report['skipped']} METS files completed by an earlier run.")
+    if report.get('versions_updated'):
+        print(f"Updated {len(report['versions_updated'])} versions with their new DataObjects.")
+    for failure in report['failures']:
+        print(f"  FAILED {failure['file']}: {failure['error']}")
+    for failure in report.get('version_failures', []):
+        print(f"  FAILED update of version {failure['version']}: {failure['error']}")
+
+
+def main(argv=None):
+    from mets2handle.engine import DEFAULT_MAX_IN_FLIGHT
+
+    parser = argparse.ArgumentParser(
+        prog='metstohandle batch',
+        description='Register many METS files using a pool of worker processes.')
+    parser.add_argument(
+        '-c', '--credentials', metavar='<credentials_file>',
+        default='handle_connection.txt',
+        help='File containing credentials for access to handle system'
+        ' (default: %(default)s).')
+    parser.add_argument(
+        '-d', '--dump-jsons', action='store_true',
+        help='Write generated json to files in the working directory.')
+    parser.add_argument(
+        '--fingerprints', metavar='<fingerprint_store>',
+        help='SQLite store of the fingerprints of the records sent before. Records'
+        ' that have not changed are not sent again.')
+    parser.add_argument(
+        '-j', '--max-in-flight', metavar='<n>', type=int, default=None,
+        help='Maximum number of concurrent requests of every worker process'
+        ' (default: %d).' % DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument(
+        '-J', '--journal', metavar='<journal_file>',
+        help='SQLite journal of the batch. A batch that is started again with the'
+        ' same journal skips the files completed before and resumes interrupted ones.')
+    parser.add_argument(
+        '-m', '--manifest', metavar='<manifest_file>', action='append', default=[],
+        help='File listing one METS file per line. Can be given more than once.')
+    parser.add_argument(
+        '--metrics', metavar='<metrics_file>',
+        help='Write timings and counters of all files to this file, in the Prometheus'
+        ' text format if it ends with .prom and as JSON otherwise.')
+    parser.add_argument(
+        '--ndjson', metavar='<ndjson_file>',
+        help='Append the payloads of all records of the batch to this file, one JSON object per line.')
+    parser.add_argument(
+        '-o', '--out-dir', metavar='<directory>',
+        help='Do not modify METS in place but write them to this directory instead, in'
+        ' the subdirectories they have below the directory that contains them all.')
+    parser.add_argument(
+        '--patch', action='store_true',
+        help='Splice the new elements into copies of the original METS files instead'
+        ' of serializing them again.')
+    parser.add_argument(
+        '-P', '--processes', metavar='<n>', type=int, default=None,
+        help='Number of worker processes (default: number of CPUs).')
+    parser.add_argument(
+        '-p', '--pattern', metavar='<pattern>', default='*.xml',
+        help='File name pattern used when searching directories, compressed files'
+        ' (.gz, .zst) are found as well (default: %(default)s).')
+    parser.add_argument(
+        '-r', '--report', metavar='<report_file>',
+        help='Write the report as JSON to this file.')
+    parser.add_argument(
+        '--refresh', action='store_true',
+        help='Update the records that are already registered from the METS, too.')
+    parser.add_argument(
+        '-s', '--streaming', action='store_true',
+        help='Parse and write the METS files as streams, for very large files.')
+    parser.add_argument(
+        'sources', metavar='<directory|glob|mets_file>', nargs='*',
+        help='Directories, glob patterns or METS files to register.')
+    args = parser.parse_args(argv)
+
+    files = collect_mets_files(args.sources, args.manifest, args.pattern)
+    if not files:
+        parser.error('no METS files found')
+    options = {}
+    if args.max_in_flight is not None:
+        options['max_in_flight'] = args.max_in_flight
+    report = run_batch(files, args.credentials, out_dir=args.out_dir, workers=args.processes,
+                       dumpjsons=args.dump_jsons, journal=args.journal, streaming=args.streaming,
+                       fingerprints=args.fingerprints, refresh=args.refresh, ndjson=args.ndjson,
+                       patch=args.patch, **options)
+    print_report(report)
+    if args.metrics:
+        from mets2handle.metrics import metrics
+
+        metrics.export(args.metrics)
+    if args.report:
+        with open(args.report, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    return 1 if report['failed'] else 0
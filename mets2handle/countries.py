@@ -0,0 +1,195 @@
+'''
+This module implements the resolution of the country names found in the
+METS (ebucore:location) to ISO 3166 alpha_2 codes.
+
+All names known to pycountry are put into one index by their normalized
+form (case, accents and punctuation removed): the current, official and
+common names and the alpha_3 codes of all countries, the historic
+countries, their German translations from the pycountry locales and a
+table of names used in the archive (BRD, DDR, Weimarer Republik, ...).
+A name in this index is resolved with one dict lookup.
+
+Names that are not in the index are matched approximately with a trigram
+index over the same names and the names of all subdivisions, instead of
+running pycountry's search_fuzzy over the whole database. Every resolved
+string is memoized, so each distinct name of a batch is resolved only once.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import re
+import unicodedata
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+# Languages of the pycountry translations that are added to the index
+LOCALES = ('de',)
+
+# Names used in the archive that are neither in pycountry nor in its
+# translations. They take precedence over all other names.
+ALIASES = {
+    'BRD': 'DE',
+    'Bundesrepublik': 'DE',
+    'Bundesrepublik Deutschland': 'DE',
+    'Westdeutschland': 'DE',
+    'Deutsches Reich': 'DE',
+    'Weimarer Republik': 'DE',
+    'DDR': 'DD',
+    'Ostdeutschland': 'DD',
+    'UdSSR': 'SU',
+    'Sowjetunion': 'SU',
+    'CSSR': 'CS',
+    'Tschechoslowakei': 'CS',
+    'Jugoslawien': 'YU',
+    'England': 'GB',
+    'Großbritannien': 'GB',
+    'UK': 'GB',
+    'USA': 'US',
+    'Holland': 'NL',
+}
+
+# Trigram similarity (Dice coefficient) an approximate match must exceed
+MIN_SIMILARITY = 0.5
+
+CountryMatch = namedtuple('CountryMatch', ['alpha_2', 'name', 'approximate'])
+
+
+def normalize(name: str) -> str:
+    """
+    Lower case form of name without accents and punctuation.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return ' '.join(re.split(r'[\W_]+', name.casefold())).strip()
+
+
+def trigrams(name: str) -> set[str]:
+    padded = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _translations(domain: str):
+    import gettext
+    import pycountry
+
+    for language in LOCALES:
+        try:
+            yield gettext.translation(domain, pycountry.LOCALES_DIR, languages=[language])
+        except OSError:
+            pass
+
+
+def build_tables() -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Builds the name index and the subdivision index from pycountry. Both map
+    normalized names to alpha_2 codes. Later entries take precedence, so a
+    current country wins over a historic one with the same name.
+    """
+    import pycountry
+
+    names = {}
+
+    def add(name, alpha_2):
+        if name and alpha_2:
+            names[normalize(name)] = alpha_2
+
+    historic = [country for country in pycountry.historic_countries if getattr(country, 'alpha_2', None)]
+    for translation in [None, *_translations('iso3166-3')]:
+        for country in historic:
+            name = translation.gettext(country.name) if translation else country.name
+            add(name, country.alpha_2)
+            # "USSR, Union of Soviet Socialist Republics"
+            add(name.split(',')[0], country.alpha_2)
+    for country in pycountry.countries:
+        add(country.alpha_3, country.alpha_2)
+    for country in pycountry.countries:
+        for attribute in ('official_name', 'common_name'):
+            add(getattr(country, attribute, None), country.alpha_2)
+    for translation in _translations('iso3166-1'):
+        for country in pycountry.countries:
+            add(translation.gettext(country.name), country.alpha_2)
+    for country in pycountry.countries:
+        add(country.name, country.alpha_2)
+    for name, alpha_2 in ALIASES.items():
+        add(name, alpha_2)
+
+    subdivisions = {}
+    for subdivision in pycountry.subdivisions:
+        subdivisions.setdefault(normalize(subdivision.name), subdivision.country_code)
+    return names, subdivisions
+
+
+class CountryResolver:
+    """
+    Resolves country names to alpha_2 codes. The tables are built from
+    pycountry on first use unless they are given, e.g. from the snapshot.
+    """
+
+    def __init__(self, names: dict[str, str] = None, subdivisions: dict[str, str] = None,
+                 memo_size: int = 4096):
+        self._names = names
+        self._subdivisions = subdivisions
+        self._fuzzy_index = None
+        self.resolve = lru_cache(maxsize=memo_size)(self._resolve)
+
+    def _load(self):
+        if self._names is None or self._subdivisions is None:
+            self._names, self._subdivisions = build_tables()
+
+    @property
+    def names(self) -> dict[str, str]:
+        self._load()
+        return self._names
+
+    def _build_fuzzy_index(self):
+        self._load()
+        # Names of countries take precedence over names of subdivisions
+        candidates = dict(self._subdivisions)
+        candidates.update(self._names)
+        index = {}
+        sizes = {}
+        for name in candidates:
+            sizes[name] = len(trigrams(name))
+            for trigram in trigrams(name):
+                index.setdefault(trigram, []).append(name)
+        self._fuzzy_index = (candidates, index, sizes)
+
+    def _approximate(self, key: str):
+        if self._fuzzy_index is None:
+            self._build_fuzzy_index()
+        candidates, index, sizes = self._fuzzy_index
+        query = trigrams(key)
+        shared = Counter()
+        for trigram in query:
+            shared.update(index.get(trigram, ()))
+        best, best_score = None, MIN_SIMILARITY
+        for name, count in shared.items():
+            score = 2 * count / (len(query) + sizes[name])
+            if score > best_score:
+                best, best_score = name, score
+        if best is None:
+            return None
+        return CountryMatch(candidates[best], best, True)
+
+    def _resolve(self, name: str):
+        """
+        Returns the CountryMatch for name or None. The match is approximate
+        if name was not found in the index of known names.
+        """
+        key = normalize(name)
+        alpha_2 = self.names.get(key)
+        if alpha_2 is not None:
+            return CountryMatch(alpha_2, key, False)
+        return self._approximate(key)
+
+    def seed(self, names: dict[str, str], subdivisions: dict[str, str]):
+        self._names = names
+        self._subdivisions = subdivisions
+        self._fuzzy_index = None
+        self.resolve.cache_clear()
+
+
+country_resolver = CountryResolver()
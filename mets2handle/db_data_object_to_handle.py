@@ -13,29 +13,33 @@ __version__ = "3.0"
 
 from datetime import datetime
 
+from mets2handle import xpaths as xp
+from mets2handle.metrics import metrics
+
 def specific_Carrier_type(dmdsec, ns):
-    for description in dmdsec.findall('.//ebucore:description', ns):
+    for description in xp.DESCRIPTIONS(dmdsec):
         if description.get('typeLabel') == 'specificCarrierType':
-            carrier = description.find('.//dc:description', ns).text
+            carrier = xp.first(xp.DC_DESCRIPTION, description).text
             return carrier
 
 def perservationAccessStatus(dmdsec, ns):
-    for description in dmdsec.findall('.//ebucore:description', ns):
+    for description in xp.DESCRIPTIONS(dmdsec):
         if description.get('typeLabel') == 'accessStatus':
-            status = description.find('.//dc:description', ns).text
+            status = xp.first(xp.DC_DESCRIPTION, description).text
             return {'type': 'preservation_access_status', 'parsed_data': status}
 
 def supplementaryInformation(dmdsec, ns):
-    for description in dmdsec.findall('.//ebucore:description', ns):
+    for description in xp.DESCRIPTIONS(dmdsec):
         if description.get('typeLabel') == 'comment':
-            information = description.find('.//dc:description', ns).text
+            information = xp.first(xp.DC_DESCRIPTION, description).text
             return information
     return 'teststring'
 
 def item_file_size(dmdsec, ns):
-    if dmdsec.find('.//ebucore:format//ebucore:fileSize', ns) is not None:
-        size = dmdsec.find('.//ebucore:format//ebucore:fileSize', ns).text
-        unit = dmdsec.find('.//ebucore:format//ebucore:fileSize', ns).get('unit')
+    file_size = xp.first(xp.FILE_SIZE, dmdsec)
+    if file_size is not None:
+        size = file_size.text
+        unit = file_size.get('unit')
         return str(size) + str(unit)
     else:
         return None
@@ -47,7 +51,7 @@ def languages(dmdsec, ns):
         language_label=language.get('typeLabel')
         lang=language.find('.//dc:language',ns).text
         language_version.append({'language_version':{'language':language,'label':language_label}})'''
-    for language in dmdsec.findall('.//ebucore:language', ns):
+    for language in xp.LANGUAGES(dmdsec):
         language_version.append(language.get('typeLabel'))
     return {'type': 'language_versions', 'parsed_data': language_version}
 
@@ -55,10 +59,6 @@ def getSource(dmdsec, ns):
     """
     Findet den Namen der Organisation, welche das Werk verwaltet
     """
-    sources = []
-    for source in dmdsec.find('.//ebucore:organisationDetails', ns).findall('.//ebucore:organisationName', ns):
-        sources.append({'name': source.text, 'identifier_uri': source.find('..').get('organisationId')})
-    source = {'source': sources}
     source =  {'sourceAttribution': {'attributionDate': datetime.now().replace(microsecond=0).isoformat()+'Z','attributionType': 'Created'},'sourceIdentifier': '21:','sourceName': 'SDK' }
     return source
 
@@ -67,8 +67,9 @@ def getLast_modified(dmdsec, ns) -> dict[str,str]:
     21.T11148/cc9350e8525a1ca5ffe4
     Findet das Datum  an dem die Mets DATei zuletzt verändert wurde.
     """
-    date = dmdsec.find('.//ebucore:ebuCoreMain', ns).get('dateLastModified').split("Z")
-    uhrzeit = dmdsec.find('.//ebucore:ebuCoreMain', ns).get('timeLastModified').split('Z')
+    ebucore_main = xp.first(xp.EBUCORE_MAIN, dmdsec)
+    date = ebucore_main.get('dateLastModified').split("Z")
+    uhrzeit = ebucore_main.get('timeLastModified').split('Z')
 
     time= date[0] + ' ' + uhrzeit[0]
 
@@ -82,6 +83,7 @@ def getIdentifier(identifier: str) -> dict[str,str]:
     return '21.123/123'
 
 
+@metrics.timed('map_data_object')
 def build_data_object_json(dmdsec, ns: dict[str, str], dataobjectPid, workpid: str) -> list[dict]:
     values = {}
     values['item_file_size'] = item_file_size(dmdsec, ns)
@@ -26,6 +26,9 @@ __license__ = "GPL"
 __version__ = "3.0"
 
 from mets2handle import helpers
+from mets2handle import xpaths as xp
+from mets2handle.metrics import metrics
+from mets2handle.vocabulary import get_vocabulary
 
 ns = {"mets": "http://www.loc.gov/METS/", "xlink": "http://www.w3.org/1999/xlink",
       "xsi": "http://www.w3.org/2001/XMLSchema-instance", "ebucore": "urn:ebu:metadata-schema:ebucore",
@@ -70,24 +73,22 @@ def get_titles(dmdsec, ns):
     # Allowed titles are at the moment equal to the titles used in "work"
     # Thus it is the same function as in db_works_to_handle
     titlelist = []
-    titletypes = helpers.getEnumFromType('21.T11148/2f4e516fbdfa40a52453')
-
-    for title in dmdsec.findall(".//dc:title", ns):
-        titlestring = str(title.find('..').get('typeLabel'))
-        try:
-            titlelist.append({'titleValue': title.text, 'titleType': helpers.vocab_map[titlestring]})
-        except KeyError:
-            helpers.logger.error('WORK: Titel Type "' + titlestring + '" not in vocab_map.json')
-        # If already mapped:
-        if titlestring in titletypes:
-            titlelist.append({'titleValue': title.text, 'titleType': titlestring})
+    titletypes = get_vocabulary('titleType')
+
+    for title in xp.DC_TITLES(dmdsec):
+        titlestring = str(title.getparent().get('typeLabel'))
+        titletype = titletypes.translate(titlestring)
+        if titletype is None:
+            helpers.logger.error('WORK: Titel Type "' + titlestring + '" not in vocab_map.json or the DTR enum')
+            continue
+        titlelist.append({'titleValue': title.text, 'titleType': titletype})
     return titlelist
 
 
 def get_release_date(dmdsec, ns):
     # Release data has to be given in YYYY-MM-DD
     try:
-        releasedate = dmdsec.find('.//ebucore:date//ebucore:released', ns).get('year')
+        releasedate = xp.first(xp.DATE_RELEASED, dmdsec).get('year')
     except AttributeError:
         helpers.logger.error('VERSION: No release date found')
         releasedate = '1000'
@@ -104,8 +105,9 @@ def get_years_of_reference(dmdsec, ns):
     """
     # years = [{'year_of_reference': dmdsec.find(".//ebucore:date", ns).find(".//ebucore:created", ns).get("startYear")},
     #         {'year_of_reference': dmdsec.find(".//ebucore:date", ns).find(".//ebucore:created", ns).get("endYear")}]
-    if dmdsec.find('.//ebucore:date//ebucore:created', ns) != None:
-        year = dmdsec.find('.//ebucore:date//ebucore:created', ns).get('startYear')
+    created = xp.first(xp.DATE_ANY_CREATED, dmdsec)
+    if created is not None:
+        year = created.get('startYear')
         return {'type': 'production_year', 'parsed_data': year}
     else:
         helpers.logger.error('VERSION: yearOfReference not found')
@@ -115,12 +117,13 @@ def get_years_of_reference(dmdsec, ns):
 def get_manifestation_type(dmdsec, ns):
     # Implements: 21.T11148/c72633267da87f952971
     typelist = []
-    manifestationTypes = helpers.getEnumFromType('21.T11148/567d070dfa708072819b')
+    manifestationTypes = get_vocabulary('manifestationType')
     #
-    for type in dmdsec.findall('.//ebucore:type//ebucore:objectType', ns):
+    for type in xp.OBJECT_TYPES(dmdsec):
         typestring = type.get('typeLabel')
-        if typestring in manifestationTypes:
-            typelist.append(typestring)
+        manifestation_type = manifestationTypes.resolve(typestring)
+        if manifestation_type is not None:
+            typelist.append(manifestation_type)
         else:
             helpers.logger.error('VERSION: manifestationType "' + typestring + '" not in the list')
             typelist.append('Unknown')
@@ -130,18 +133,16 @@ def get_manifestation_type(dmdsec, ns):
 def get_has_agent(dmdsec, ns):
     # Implements: 21.T11148/5a69721cca16545c03e6
     data = []
-    for companie in dmdsec.findall('.//ebucore_contributor', ns):
-        data.append({'name': companie.find('.//ebucore:organisationDetails//ebucore:organisationName', ns).text,
-                     'identifier_uri': companie.find('.//ebucore:organisationDetails', ns).get('organisationID')})
+    for companie in xp.HAS_AGENT_CONTRIBUTORS(dmdsec):
+        data.append({'name': xp.first(xp.ORGANISATION_NAME, companie).text,
+                     'identifier_uri': xp.first(xp.ORGANISATION_DETAILS, companie).get('organisationID')})
     return data
 
 
 def get_sources(dmdsec, ns):
     # Implements: 21.T11148/828d338a9b04221c9cbe
-    dmdsec.find('.//ebucore:metadataProvider//ebucore:organisationDetails//ebucore:organisationName', ns)
     source = {
-        'sourceName': dmdsec.find('.//ebucore:metadataProvider//ebucore:organisationDetails//ebucore:organisationName',
-                                  ns).text, }
+        'sourceName': xp.first(xp.PROVIDER_ORGANISATION_NAME, dmdsec).text, }
 
     # 'identifier_uri': dmdsec.find('.//ebucore:metadataProvider//ebucore:organisationDetails',ns).get('organisationId')
     return source
@@ -153,13 +154,15 @@ def get_last_modified(dmdsec, ns):
     Findet das Datum  an dem die Mets Datei zuletzt verändert wurde.
     TODO: Klären ob hier nicht die letzte Änderung der PID eingetragen werden muss.
     """
-    date = dmdsec.find('.//ebucore:ebuCoreMain', ns).get('dateLastModified').split("Z")
-    uhrzeit = dmdsec.find('.//ebucore:ebuCoreMain', ns).get('timeLastModified').split('Z')
+    ebucore_main = xp.first(xp.EBUCORE_MAIN, dmdsec)
+    date = ebucore_main.get('dateLastModified').split("Z")
+    uhrzeit = ebucore_main.get('timeLastModified').split('Z')
 
     time = date[0] + ' ' + uhrzeit[0]
     return time
 
 
+@metrics.timed('map_version')
 def build_version_json(dmdsec, ns, pid_works, dataobject_pid: list, version_pid, lastModified=True, Sources=True,
                        HasAgent=True, ManfiestationType=True, YearsofReference=True, releasedate=True, sameas=True,
                        title=False, DataObject=True, VerisonOf=True, identifier=True):
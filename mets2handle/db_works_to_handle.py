@@ -28,7 +28,11 @@ from lxml import etree as ET
 from lxml.etree import Element
 
 from mets2handle import helpers
-import pycountry
+from mets2handle import xpaths as xp
+from mets2handle.countries import country_resolver
+from mets2handle.mapping import DC, EBUCORE, RecordMapping
+from mets2handle.metrics import metrics
+from mets2handle.vocabulary import get_vocabulary
 
 from datetime import datetime
 
@@ -46,18 +50,20 @@ def get_title(dmdsec: ET, ns):
     Find the Title of the work
     DTR: 21.T11148/4b18b74f5ed1441bc6a3
     """
+    return _titles_from(xp.DC_TITLES(dmdsec))
+
+
+def _titles_from(titles):
     titlelist = []
-    titletypes = helpers.getEnumFromType('21.T11148/2f4e516fbdfa40a52453')
-
-    for title in dmdsec.findall(".//dc:title", ns):
-        titlestring = str(title.find('..').get('typeLabel'))
-        try:
-            titlelist.append({'titleValue': title.text, 'titleType': helpers.vocab_map[titlestring]})
-        except KeyError:
-            helpers.logger.error('WORK: Titel Type "' + titlestring + '" not in vocab_map.json')
-        # If already mapped:
-        if titlestring in titletypes:
-            titlelist.append({'titleValue': title.text, 'titleType': titlestring})
+    titletypes = get_vocabulary('titleType')
+
+    for title in titles:
+        titlestring = str(title.getparent().get('typeLabel'))
+        titletype = titletypes.translate(titlestring)
+        if titletype is None:
+            helpers.logger.error('WORK: Titel Type "' + titlestring + '" not in vocab_map.json or the DTR enum')
+            continue
+        titlelist.append({'titleValue': title.text, 'titleType': titletype})
     return titlelist
 
 
@@ -68,10 +74,14 @@ def get_series_name(dmdsec, ns):
     Existiert kein Serienname ist der Eintrag None
     """
     # TODO: Es gibt noch ungereimtheiten bei den wertelisten sowie mit den identifiern
+    return _series_name_from(xp.ALTERNATIVE_TITLES(dmdsec))
+
+
+def _series_name_from(alternative_titles):
     name = ""
-    for title in dmdsec.findall('.//ebucore:alternativeTitle', ns):
+    for title in alternative_titles:
         if title.get('typeLabel') == 'series':
-            name = title.find('.//dc:title', ns).text
+            name = xp.first(xp.DC_TITLES, title).text
     return name
 
 
@@ -79,10 +89,6 @@ def get_source(dmdsec, ns):
     """
     Findet den Namen der Organisation, welche das Werk verwaltet
     """
-    sources = []
-    for source in dmdsec.find('.//ebucore:organisationDetails', ns).findall('.//ebucore:organisationName', ns):
-        sources.append({'name': source.text, 'identifier_uri': source.find('..').get('organisationId')})
-    source = {'source': sources}
     source = [{'sourceAttribution': {'attributionDate': datetime.now().replace(microsecond=0).isoformat() + 'Z',
                                      'attributionType': 'Created'}, 'sourceIdentifier': '21:', 'sourceName': 'SDK'}]
     return source
@@ -92,30 +98,34 @@ def get_credits(dmdsec, ns):
     """
     Findet den Regisseur
     """
-    creditsRole = helpers.getEnumFromType('21.T11148/8dca46428d005a2f4c2e')
+    return _credits_from(xp.CONTRIBUTORS(dmdsec))
 
-    credits_list = []
-    for contributor in dmdsec.findall('.//ebucore:contributor', ns):
-        for role in contributor.findall('.//ebucore:role', ns):
-            if role.get('typeLabel').lower() in [creditoption.lower() for creditoption in creditsRole]:
-                name = contributor.find('./ebucore:contactDetails', ns).find('./ebucore:name', ns).text.split(',')
 
-                if contributor.find('.//ebucore:contactDetails', ns).get(
-                        'contactId') is not None:  # checktob es eine uri gibt
+def _credits_from(contributors):
+    credit_roles = get_vocabulary('creditRole')
+
+    credits_list = []
+    for contributor in contributors:
+        for role in xp.ROLES(contributor):
+            credit_role = credit_roles.resolve(role.get('typeLabel'))
+            if credit_role is not None:
+                name = xp.first(xp.NAME_CHILD, xp.first(xp.CONTACT_DETAILS_CHILD, contributor)).text.split(',')
+                contact_id = xp.first(xp.CONTACT_DETAILS, contributor).get('contactId')
+
+                if contact_id is not None:  # checktob es eine uri gibt
                     credits_list.append({
                         'identifier': {
-                            'identifier': contributor.find('.//ebucore:contactDetails', ns).get('contactId').split('/')[
-                                -1],
-                            'identifier_uri': contributor.find('.//ebucore:contactDetails', ns).get('contactId')},
+                            'identifier': contact_id.split('/')[-1],
+                            'identifier_uri': contact_id},
                         'name': {'family-name': name[0],
                                  'given-name': name[1].strip()},
-                        'role': str(role.get('typeLabel')).capitalize()
+                        'role': credit_role
                     })
                 else:
                     credits_list.append({
                         'name': {'family-name': name[0],
                                  'given-name': name[1].strip()},
-                        'role': role.get('typeLabel').capitalize()
+                        'role': credit_role
                     })
 
     return credits_list
@@ -125,16 +135,21 @@ def get_cast(dmdsec, ns):
     """
     Findet alle personen , welche vor der Kamera standen -> cast
     """
+    return _cast_from(xp.CONTRIBUTORS(dmdsec))
+
+
+def _cast_from(contributors):
     cast = []
-    for contributor in dmdsec.findall('.//ebucore:contributor', ns):
+    for contributor in contributors:
 
-        if contributor.find('.//ebucore:role', ns).get('typeLabel') == 'cast':
-            name = contributor.find('./ebucore:contactDetails', ns).find('./ebucore:name', ns).text.split(',')
-            if contributor.find('.//ebucore:contactDetails', ns).get('contactId') is not None:
+        if xp.first(xp.ROLES, contributor).get('typeLabel') == 'cast':
+            name = xp.first(xp.NAME_CHILD, xp.first(xp.CONTACT_DETAILS_CHILD, contributor)).text.split(',')
+            contact_id = xp.first(xp.CONTACT_DETAILS, contributor).get('contactId')
+            if contact_id is not None:
 
                 cast.append(
                     {'name': {'family-name': name[0], 'given-name': name[1].strip()},
-                     'identifier_uri': contributor.find('.//ebucore:contactDetails', ns).get('contactId')
+                     'identifier_uri': contact_id
                      })
             else:
                 cast.append({'name': {'family-name': name[0], 'given-name': name[1].strip()}, })
@@ -148,9 +163,13 @@ def get_original_duration(dmdsec: Element, ns: dict) -> Union[dict, None]:
     Findet die Länge des Werkes
     21.T11148/b8a2e906c01f78a0d37b
     """
-    duration = dmdsec.find('.//ebucore:duration', ns)
+    return _original_duration_from(xp.DURATION(dmdsec))
+
+
+def _original_duration_from(durations):
+    duration = durations[0] if durations else None
     if duration is not None and duration.get('typeLabel') == 'originalDuration':
-        time = duration.find('.//ebucore:normalPlayTime', ns).text
+        time = xp.first(xp.NORMAL_PLAY_TIME, duration).text
         return {'original_duration': time}
 
     return ""
@@ -161,7 +180,11 @@ def get_source_identifier(dmdsec, ns):
     21.T11148/4f79cf79777ae7c379fe
     Findet die identifier id/url der Hauptorganisation die dieses Werk verwaltet
     """
-    return dmdsec.find('.//ebucore:organisationDetails', ns).get('organisationId')
+    return _source_identifier_from(xp.ORGANISATION_DETAILS(dmdsec))
+
+
+def _source_identifier_from(organisation_details):
+    return organisation_details[0].get('organisationId')
 
 
 def get_last_modified(dmdsec, ns):
@@ -169,8 +192,13 @@ def get_last_modified(dmdsec, ns):
     21.T11148/cc9350e8525a1ca5ffe4
     Findet das Datum  an dem die Mets DATei zuletzt verändert wurde.
     """
-    date = dmdsec.find('.//ebucore:ebuCoreMain', ns).get('dateLastModified').split("Z")
-    uhrzeit = dmdsec.find('.//ebucore:ebuCoreMain', ns).get('timeLastModified').split('Z')
+    return _last_modified_from(xp.EBUCORE_MAIN(dmdsec))
+
+
+def _last_modified_from(ebucore_mains):
+    ebucore_main = ebucore_mains[0]
+    date = ebucore_main.get('dateLastModified').split("Z")
+    uhrzeit = ebucore_main.get('timeLastModified').split('Z')
 
     time = date[0] + ' ' + uhrzeit[0]
 
@@ -198,10 +226,14 @@ def get_original_language(dmdsec, ns):
     Findet die Sprache, in der das Werk erstmalig aufgenommen worden ist
     21.T11148/577d96232ee6ea2f8dfa
     """
+    return _original_language_from(xp.LANGUAGES(dmdsec))
+
+
+def _original_language_from(languages):
     original_languages = []
 
-    for lan in dmdsec.findall('.//ebucore:language', ns):
-        original_languages.append(lan.find('.//dc:language', ns).text)
+    for lan in languages:
+        original_languages.append(xp.first(xp.DC_LANGUAGE, lan).text)
     if not len(original_languages):
         return None
     # platzhalter nicht klar im xml
@@ -212,41 +244,26 @@ def get_countries_of_reference(dmdsec, ns):
     """
     Findet Ursprungsland
     """
+    return _countries_of_reference_from(xp.LOCATIONS(dmdsec))
+
+
+def _countries_of_reference_from(locations):
+    # Seeds the resolver from the snapshot if there is one
+    helpers.load_reference_data()
     landlist = []
-    for country in dmdsec.findall('.//ebucore:location', ns):
-        landstring = str(country.find('.//ebucore:name', ns).text)
-        # Try to find country name in the database
-        if pycountry.countries.get(name=landstring) is not None:
-            landlist.append(pycountry.countries.get(name=landstring).aplha_2)
-        elif pycountry.countries.get(official_name=landstring) is not None:
-            landlist.append(pycountry.countries.get(official_name=landstring).aplha_2)
-        elif pycountry.historic_countries.get(name=landstring) is not None:
-            landlist.append(pycountry.historic_countries.get(name=landstring).aplha_2)
-        else:
-            # As everything failed use fuzzy search and log the information
-            check_historic = True
-            try:
-                res = pycountry.countries.search_fuzzy(landstring)
-            except LookupError:
-                helpers.logger.error('WORK: countryOfReference "' + landstring + '" not found by pycountry')
-            else:
-                country_hits = [x for x in res if x is not None]
-                helpers.logger.error('WORK: countryOfReference "' + landstring + '" found as "'
-                                     + country_hits[0].alpha_2 + '" but might not be correct')
-
-                landlist.append(country_hits[0].alpha_2)
-                check_historic = False
-            if check_historic:
-                try:
-                    res = pycountry.historic_countries.search_fuzzy(landstring)
-                except LookupError:
-                    helpers.logger.error(
-                        'WORK: countryOfReference "' + landstring + '" not found by pycountry historic')
-                else:
-                    country_hits = [x for x in res if x is not None]
-                    helpers.logger.error('WORK: countryOfReference "' + landstring + '" found as "'
-                                         + country_hits[0].alpha_2 + '" but might not be correct')
-                    landlist.append(country_hits[0].alpha_2)
+    for country in locations:
+        landstring = str(xp.first(xp.LOCATION_NAME, country).text)
+        with metrics.span('country_resolve'):
+            match = country_resolver.resolve(landstring)
+        if match is None:
+            metrics.inc('country_lookups', result='not_found')
+            helpers.logger.error('WORK: countryOfReference "' + landstring + '" not found by pycountry')
+            continue
+        metrics.inc('country_lookups', result='approximate' if match.approximate else 'exact')
+        if match.approximate:
+            helpers.logger.error('WORK: countryOfReference "' + landstring + '" found as "'
+                                 + match.alpha_2 + '" but might not be correct')
+        landlist.append(match.alpha_2)
 
     return landlist
 
@@ -257,9 +274,13 @@ def get_years_of_reference(dmdsec, ns):  # wird eventuell noch abgeändert
     21.T11148/089d6db63cf69c35930d
     ISSUES: referenceType nicht gegeben aber immer created ?
     """
-    yearOfReferenceTypes = helpers.getEnumFromType('21.T11148/03dfc92c55cea3e18920')
-    start_year = dmdsec.find(".//ebucore:date", ns).find(".//ebucore:created", ns).get("startYear")
-    end_year = dmdsec.find(".//ebucore:date", ns).find(".//ebucore:created", ns).get("endYear")
+    return _years_of_reference_from(xp.DATES(dmdsec))
+
+
+def _years_of_reference_from(dates):
+    created = xp.first(xp.CREATED, dates[0])
+    start_year = created.get("startYear")
+    end_year = created.get("endYear")
     years = [{'yearOfReferenceStart': start_year,
               'yearOfReferenceEnd': end_year,
               'yearOfReferenceType': 'Created'}]
@@ -283,17 +304,20 @@ def get_genre(dmdsec, ns):
     """
     Findet das Genre eines Filmes
     """
+    return _genres_from(xp.GENRES(dmdsec))
+
+
+def _genres_from(genre_elements):
     genrelist = []
-    genres = helpers.getEnumFromType('21.T11148/9100b6b9d1719c5f6c82')
+    genres = get_vocabulary('genre')
     #
-    for genre in dmdsec.findall('.//ebucore:genre', ns):
+    for genre in genre_elements:
         genrestring = str(genre.get('typeLabel'))
-        try:
-            genrelist.append(helpers.vocab_map[genrestring])
-        except KeyError:
-            helpers.logger.error('WORK: Genre "' + genrestring + '" not in vocab_map.json')
-        if genrestring in genres:
-            genrelist.append(genrestring)
+        value = genres.translate(genrestring)
+        if value is None:
+            helpers.logger.error('WORK: Genre "' + genrestring + '" not in vocab_map.json or the DTR enum')
+            continue
+        genrelist.append(value)
     return genrelist
 
 
@@ -301,20 +325,19 @@ def get_original_format(dmdsec, ns):
     """
     Gibt das Format zurück, auf welchem der Film gespeichert wurde
     """
+    return _original_format_from(xp.FORMATS(dmdsec))
+
+
+def _original_format_from(formats):
     try:
-        format_sec = dmdsec.xpath(
-            './/ebucore:format[@typeLabel="originalFormat"]',
-            namespaces=ns)[0]
+        format_sec = [format_sec for format_sec in formats if format_sec.get('typeLabel') == 'originalFormat'][0]
     except IndexError:
         return None
     parsed_data = {}
     for prefix in ('video', 'audio'):
         for suffix in ('Format', 'Type'):
             try:
-                val = format_sec.xpath(
-                    f'ebucore:{prefix}Format/ebucore:technicalAttributeString'
-                    f'[@typeLabel="material{suffix}"]',
-                    namespaces=ns)[0].text
+                val = xp.MATERIAL_ATTRIBUTES[prefix, suffix](format_sec)[0].text
             except IndexError:
                 continue
             if val:
@@ -324,7 +347,44 @@ def get_original_format(dmdsec, ns):
     return parsed_data
 
 
+# Declarative mapping of the Work record, see mapping.py. Each field names the
+# flag of build_work_json that switches it on and the elements it is built
+# from, so the whole record is built in one walk over the dmdSec.
+work_mapping = RecordMapping()
+work_mapping.field('title', 'title', DC + 'title')(
+    lambda matches: _titles_from(matches[DC + 'title']))
+work_mapping.field('series', 'series', EBUCORE + 'alternativeTitle')(
+    lambda matches: _series_name_from(matches[EBUCORE + 'alternativeTitle']))
+work_mapping.field('credit', 'credits', EBUCORE + 'contributor')(
+    lambda matches: _credits_from(matches[EBUCORE + 'contributor']))
+work_mapping.field('cast', 'cast', EBUCORE + 'contributor')(
+    lambda matches: _cast_from(matches[EBUCORE + 'contributor']))
+work_mapping.field('original_duration', 'originalDuration', EBUCORE + 'duration')(
+    lambda matches: _original_duration_from(matches[EBUCORE + 'duration']))
+work_mapping.field('source', 'source')(
+    lambda matches: get_source(None, None))
+work_mapping.field('source_identifier', 'sourceIdentifier', EBUCORE + 'organisationDetails')(
+    lambda matches: _source_identifier_from(matches[EBUCORE + 'organisationDetails']))
+work_mapping.field('last_modifed', 'lastModified', EBUCORE + 'ebuCoreMain')(
+    lambda matches: _last_modified_from(matches[EBUCORE + 'ebuCoreMain']))
+work_mapping.field('production_companies', 'productionCompany')(
+    lambda matches: get_production_companies(None, None))
+work_mapping.field('countries_of_reference', 'countryOfReference', EBUCORE + 'location')(
+    lambda matches: _countries_of_reference_from(matches[EBUCORE + 'location']))
+work_mapping.field('original_language', 'originalLanguage', EBUCORE + 'language')(
+    lambda matches: _original_language_from(matches[EBUCORE + 'language']))
+work_mapping.field('years_of_reference', 'yearOfReference', EBUCORE + 'date')(
+    lambda matches: _years_of_reference_from(matches[EBUCORE + 'date']))
+work_mapping.field('related_identifier', 'relatedIdentifier')(
+    lambda matches: get_related_identifier(None, None))
+work_mapping.field('original_format', 'originalFormat', EBUCORE + 'format')(
+    lambda matches: _original_format_from(matches[EBUCORE + 'format']))
+work_mapping.field('genre', 'genre', EBUCORE + 'genre')(
+    lambda matches: _genres_from(matches[EBUCORE + 'genre']))
+
+
 # build json gibt ein dict zurück, welches von der json bibliothek in die fertige json datei ausgegeben werden kann.
+@metrics.timed('map_work')
 def build_work_json(dmdsec: Element, ns: dict[str, str], pid_work, handleId=True, title=True, series=False,
                     credit=False,
                     cast=True,
@@ -340,42 +400,16 @@ def build_work_json(dmdsec: Element, ns: dict[str, str], pid_work, handleId=True
     Standardmäßig werden alle Blöcke ausgegeben
     TODO set originallanguage to true when regex is fixed
     """
-    values = {}
-
     # if handleId:
     #  values.append(getIdentifier (pid_work))
 
-    if title:
-        values['title'] = get_title(dmdsec, ns)
-    if series:
-        values['series'] = get_series_name(dmdsec, ns)
-    if credit:
-        values['credits'] = get_credits(dmdsec, ns)
-    if cast:
-        values['cast'] = get_cast(dmdsec, ns)
-    if original_duration:
-        values['originalDuration'] = get_original_duration(dmdsec, ns)
-    if source:
-        values['source'] = get_source(dmdsec, ns)
-    if source_identifier:
-        values['sourceIdentifier'] = get_source_identifier(dmdsec, ns)
-    if last_modifed:
-        values['lastModified'] = get_last_modified(dmdsec, ns)
-    if production_companies:
-        values['productionCompany'] = get_production_companies(dmdsec, ns)
-    if countries_of_reference:
-        values['countryOfReference'] = get_countries_of_reference(dmdsec, ns)
-    if original_language:
-        values['originalLanguage'] = get_original_language(dmdsec, ns)
-    if years_of_reference:
-        values['yearOfReference'] = get_years_of_reference(dmdsec, ns)
-    if related_identifier:
-        values['relatedIdentifier'] = get_related_identifier(dmdsec, ns)
-    if original_format:
-        values['originalFormat'] = get_original_format(dmdsec, ns)
-    if genre:
-        values['genre'] = get_genre(dmdsec, ns)
-    return values
+    return work_mapping.build(dmdsec, {
+        'title': title, 'series': series, 'credit': credit, 'cast': cast,
+        'original_duration': original_duration, 'source': source, 'source_identifier': source_identifier,
+        'last_modifed': last_modifed, 'production_companies': production_companies,
+        'countries_of_reference': countries_of_reference, 'original_language': original_language,
+        'years_of_reference': years_of_reference, 'related_identifier': related_identifier,
+        'original_format': original_format, 'genre': genre})
 
 
 def create_identifier_element(pid: str):
@@ -0,0 +1,213 @@
+'''
+This module implements the asynchronous registration engine.
+
+Records for works, versions and data objects are described by HandleRecord
+objects. Their PIDs are minted locally, so records that do not depend on
+each other (e.g. several works of a multi-work METS or data objects of
+different METS files) can be registered at the same time. A record waits
+for all records in its depends_on list before its payload is built and
+sent, which keeps the order work -> version -> data object that the links
+between the records require. The number of requests in flight is limited
+by max_in_flight.
+
+The PUT requests themselves are sent through the shared session from
+session.py in a thread pool, so retries and connection pooling apply.
+With a FingerprintStore records whose payload has not changed since they
+were last sent are skipped, see fingerprints.py. The payload of every
+record is built and encoded once, the same bytes are used for the request
+body and for the dump sinks, see sinks.py.
+
+asyncio (which pulls in ssl) is imported when records are registered and
+not with the module, so that the command line tool starts quickly.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import json
+import logging
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from mets2handle.metrics import metrics
+from mets2handle.session import get_session
+
+logger = logging.getLogger(__name__)
+
+# Kernel information profiles and record types of the handle records
+RECORD_TYPES = {
+    'work': ('21.T11148/31b848e871121c47d064', 'movie_db_works'),
+    'version': ('21.T11148/ef6836b80e4d64e574e3', 'movie_db_version'),
+    'data_object': ('21.T11148/b0047df54c686b9df82a', 'movie_db_dataobjects'),
+}
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+HEADERS = {'accept': 'application/json', 'Content-Type': 'application/json; charset=utf-8'}
+
+# Request body of every record kind up to its payload, see HandleRecord.body()
+BODY_PREFIXES = {
+    kind: ('[{"type": "KIP", "parsed_data": %s}, {"type": %s, "parsed_data": '
+           % (json.dumps(kip), json.dumps(record_type))).encode('utf8')
+    for kind, (kip, record_type) in RECORD_TYPES.items()}
+
+
+class HandleRecord:
+    """
+    A handle record that is to be registered (or updated) under pid.
+
+    payload is either the dict that goes into the record or a callable that
+    builds it. The callable is called once all records in depends_on have
+    been registered, so it can use their PIDs. dump_name is the name of the
+    file the payload is written to by a DirectorySink.
+    """
+
+    def __init__(self, kind: str, pid: str, payload, depends_on=(), update=False):
+        if kind not in RECORD_TYPES:
+            raise ValueError(f"Unknown record kind {kind}")
+        self.kind = kind
+        self.pid = pid
+        self.payload = payload
+        self.depends_on = list(depends_on)
+        self.update = update
+        self.handle = None
+        self.dump_name = None
+        self.encoded = None
+
+    @classmethod
+    def new(cls, kind: str, prefix: str, payload, depends_on=()):
+        """
+        Creates a record with a freshly minted PID below prefix.
+        """
+        return cls(kind, prefix + '/{}'.format(uuid.uuid4()), payload, depends_on)
+
+    @property
+    def suffix(self) -> str:
+        return self.pid.split('/', 1)[1]
+
+    def build_payload(self) -> dict:
+        if callable(self.payload):
+            self.payload = self.payload()
+        return self.payload
+
+    def encode(self) -> bytes:
+        """
+        The payload as UTF-8 JSON, encoded on the first call only.
+        """
+        if self.encoded is None:
+            self.encoded = json.dumps(self.build_payload(), ensure_ascii=False).encode('utf8')
+        return self.encoded
+
+    def body(self) -> bytes:
+        """
+        The request body, the same as json.dumps(handle_data()) but built
+        around the encoded payload.
+        """
+        return BODY_PREFIXES[self.kind] + self.encode() + b'}]'
+
+    def handle_data(self) -> list[dict]:
+        kip, record_type = RECORD_TYPES[self.kind]
+        return [{'type': 'KIP', 'parsed_data': kip},
+                {'type': record_type, 'parsed_data': self.build_payload()}]
+
+    def __repr__(self):
+        return f"HandleRecord({self.kind!r}, {self.pid!r})"
+
+
+class RegistrationEngine:
+    """
+    Registers HandleRecords at the handle server given by connection_details
+    with at most max_in_flight concurrent requests.
+    """
+
+    def __init__(self, connection_details: dict[str, str], max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 fingerprints=None, sinks=()):
+        self.connection_details = connection_details
+        self.max_in_flight = max(1, max_in_flight)
+        self.fingerprints = fingerprints
+        self.sinks = list(sinks)
+
+    def put(self, record: HandleRecord) -> str:
+        """
+        Sends one record to the handle server and returns its handle.
+        """
+        response_from_handle_server = get_session(self.max_in_flight).put(
+            self.connection_details['url'] + record.suffix,
+            auth=(self.connection_details['user'], self.connection_details['password']),
+            headers=HEADERS,
+            data=record.body())
+        response_from_handle_server.raise_for_status()
+        handle = response_from_handle_server.json()['handle']
+        metrics.inc('records_put', kind=record.kind, update=record.update)
+        label = record.kind.replace('_', ' ')
+        # The whole line in one write, records are registered from several
+        # threads and print() writes the newline separately
+        line = (f'PID for {label}: ' if not record.update else f'Updated {label}: ') + handle + '\n'
+        sys.stdout.write(line)
+        return handle
+
+    async def _register(self, record: HandleRecord, tasks: dict, semaphore, executor):
+        import asyncio
+
+        for dependency in record.depends_on:
+            # Raises if the dependency could not be registered
+            await tasks[dependency]
+        # Built here and not in the thread pool, lxml trees are not shared between threads
+        data = record.encode()
+        metrics.inc('payload_bytes', len(data), kind=record.kind)
+        for sink in self.sinks:
+            sink.write(record, data)
+        if self.fingerprints is not None and self.fingerprints.is_unchanged(record.pid, record.kind, record.payload):
+            logger.info('%s is unchanged, not sent', record)
+            metrics.inc('records_unchanged', kind=record.kind)
+            record.handle = record.pid
+            return record.handle
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            record.handle = await loop.run_in_executor(executor, self.put, record)
+        if self.fingerprints is not None:
+            self.fingerprints.put(record.pid, record.kind, record.payload)
+        return record.handle
+
+    async def register_all(self, records: list[HandleRecord]) -> list[str]:
+        """
+        Registers all records concurrently, respecting their dependencies.
+        Raises the first error after all other records are done.
+        """
+        import asyncio
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        tasks = {}
+        known = set(records)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for record in records:
+                for dependency in record.depends_on:
+                    if dependency not in known:
+                        raise ValueError(f"{record} depends on {dependency} which is not registered")
+                tasks[record] = asyncio.ensure_future(self._register(record, tasks, semaphore, executor))
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for record, result in zip(tasks, results):
+            if isinstance(result, BaseException):
+                logger.error('Registration of %s failed: %s', record, result)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def run(self, records: list[HandleRecord]) -> list[str]:
+        import asyncio
+
+        return asyncio.run(self.register_all(records))
+
+
+def register_records(records: list[HandleRecord], connection_details: dict[str, str],
+                     max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, fingerprints=None, sinks=()) -> list[str]:
+    """
+    Registers the records of one or many METS files, see RegistrationEngine.
+    """
+    if not records:
+        return []
+    return RegistrationEngine(connection_details, max_in_flight, fingerprints, sinks).run(records)
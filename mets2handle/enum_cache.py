@@ -0,0 +1,258 @@
+'''
+This module implements a cache for the enumerations of DTR types.
+
+The mapping functions in db_works_to_handle and db_version_to_handle check
+the values found in the METS file against the enumerations that are
+registered for a type in the Data Type Registry (DTR). These enumerations
+change very rarely, so they are kept in memory for the running process and
+in an on-disk store that is shared between processes and runs. Entries are
+revalidated against the DTR once their time to live has expired. If the DTR
+cannot be reached, an expired entry is used rather than failing the run,
+and it is not revalidated again before retry_after seconds have passed, so
+an outage costs one failed request per type and not one per lookup.
+
+The location of the on-disk store, the time to live and the URL of the DTR
+can be configured by the environment variables METS2HANDLE_CACHE_DIR,
+METS2HANDLE_ENUM_TTL (in seconds) and METS2HANDLE_DTR_URL or by creating an
+EnumCache with the respective arguments.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError, URLError
+
+from mets2handle.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DTR_BASE_URL = "https://dtr-test.pidconsortium.net/objects/"
+
+# Types whose enumerations are looked up by the mapping modules
+KNOWN_ENUM_TYPES = {
+    'titleType': '21.T11148/2f4e516fbdfa40a52453',
+    'creditRole': '21.T11148/8dca46428d005a2f4c2e',
+    'genre': '21.T11148/9100b6b9d1719c5f6c82',
+    'yearOfReferenceType': '21.T11148/03dfc92c55cea3e18920',
+    'manifestationType': '21.T11148/567d070dfa708072819b',
+}
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_RETRY_AFTER = 5 * 60
+
+
+def default_cache_dir() -> str:
+    if os.environ.get('METS2HANDLE_CACHE_DIR'):
+        return os.environ['METS2HANDLE_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'mets2handle', 'dtr')
+
+
+class EnumCache:
+    """
+    Two level cache (memory and disk) for the enumerations of DTR types.
+
+    cache_dir=None keeps the enumerations in memory only. Entries older than
+    ttl seconds are revalidated with a conditional request to the DTR, after
+    a failed revalidation not before retry_after seconds. The
+    on-disk store is limited to max_entries files, the least recently
+    fetched ones are evicted first.
+    """
+
+    def __init__(self, cache_dir: str = None, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, base_url: str = DTR_BASE_URL,
+                 timeout: float = 30, retry_after: float = DEFAULT_RETRY_AFTER):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.max_entries = max_entries
+        self.base_url = base_url
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def get(self, datatype: str) -> list[str]:
+        """
+        Return the enumeration of the DTR type with the PID datatype.
+        """
+        with self._lock:
+            entry = self._entries.get(datatype)
+        if entry is None:
+            entry = self._read(datatype)
+            if entry is not None:
+                with self._lock:
+                    entry = self._entries.setdefault(datatype, entry)
+        if entry is not None and self._is_fresh(entry):
+            with self._lock:
+                self.hits += 1
+            metrics.inc('enum_cache_lookups', result='hit')
+            return entry['enum']
+        with self._lock:
+            self.misses += 1
+        metrics.inc('enum_cache_lookups', result='miss')
+        # The DTR is requested without holding the lock, so lookups of other
+        # types do not wait for a slow request
+        with metrics.span('dtr_fetch'):
+            entry = self._revalidate(datatype, entry)
+        with self._lock:
+            current = self._entries.get(datatype)
+            if current is not None and current['fetched_at'] > entry['fetched_at']:
+                # Another thread has fetched it meanwhile
+                return current['enum']
+            self._entries[datatype] = entry
+        return entry['enum']
+
+    def prefetch(self, datatypes=None) -> dict[str, list[str]]:
+        """
+        Make sure the enumerations of all given types (by default the ones
+        used by the mapping modules) are cached and fresh.
+        """
+        if datatypes is None:
+            datatypes = KNOWN_ENUM_TYPES.values()
+        return {datatype: self.get(datatype) for datatype in datatypes}
+
+    def seed(self, enums: dict[str, list[str]], fetched_at: float = None, overwrite: bool = True):
+        """
+        Put enumerations that were obtained elsewhere into the memory cache.
+        Without overwrite, enumerations already in memory are kept.
+        """
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            for datatype, enum in enums.items():
+                if not overwrite and datatype in self._entries:
+                    continue
+                self._entries[datatype] = {'datatype': datatype, 'enum': list(enum),
+                                           'fetched_at': fetched_at}
+
+    def invalidate(self, datatype: str = None):
+        """
+        Drop one (or all) entries from memory and disk.
+        """
+        with self._lock:
+            datatypes = [datatype] if datatype else list(self._entries)
+            for key in datatypes:
+                self._entries.pop(key, None)
+            if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+                return
+            if datatype:
+                paths = [self._path(datatype)]
+            else:
+                paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                         if name.endswith('.json')]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def evict(self, max_age: float = None):
+        """
+        Remove entries from disk that were fetched more than max_age seconds
+        ago (default: never) and keep only the max_entries newest ones.
+        """
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.cache_dir, name)
+                files.append((os.path.getmtime(path), path))
+        files.sort(reverse=True)
+        now = time.time()
+        for position, (mtime, path) in enumerate(files):
+            if position >= self.max_entries or (max_age is not None and now - mtime > max_age):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _is_fresh(self, entry: dict) -> bool:
+        now = time.time()
+        return now - entry['fetched_at'] < self.ttl or now < entry.get('retry_at', 0)
+
+    def _failed(self, datatype: str, entry: dict, error) -> dict:
+        logger.warning('DTR: revalidation of %s failed (%s), using cached enum', datatype, error)
+        return dict(entry, retry_at=time.time() + self.retry_after)
+
+    def _revalidate(self, datatype: str, entry: dict) -> dict:
+        # Imported on first use, it pulls in ssl and http.client
+        from urllib.request import Request, urlopen
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = urlopen(Request(self.base_url + datatype, headers=headers), timeout=self.timeout)
+        except HTTPError as error:
+            if error.code == 304 and entry is not None:
+                entry = dict(entry, fetched_at=time.time())
+                entry.pop('retry_at', None)
+                self._write(entry)
+                return entry
+            if entry is None:
+                raise
+            return self._failed(datatype, entry, error)
+        except (URLError, OSError) as error:
+            if entry is None:
+                raise
+            return self._failed(datatype, entry, error)
+        type_data = json.loads(response.read())
+        entry = {'datatype': datatype,
+                 'enum': json.loads(type_data['properties'][0]['enum']),
+                 'fetched_at': time.time(),
+                 'etag': response.headers.get('ETag'),
+                 'last_modified': response.headers.get('Last-Modified')}
+        self._write(entry)
+        self.evict()
+        return entry
+
+    def _path(self, datatype: str) -> str:
+        return os.path.join(self.cache_dir, datatype.replace('/', '_') + '.json')
+
+    def _read(self, datatype: str) -> dict:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(datatype), 'r', encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, entry: dict):
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(entry['datatype']))
+        except OSError as error:
+            logger.warning('DTR: could not write enum cache in %s (%s)', self.cache_dir, error)
+
+
+def _ttl_from_env() -> float:
+    try:
+        return float(os.environ.get('METS2HANDLE_ENUM_TTL', DEFAULT_TTL))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+# Cache shared by all modules of the package
+enum_cache = EnumCache(cache_dir=default_cache_dir(), ttl=_ttl_from_env(),
+                       base_url=os.environ.get('METS2HANDLE_DTR_URL', DTR_BASE_URL))
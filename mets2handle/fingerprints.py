@@ -0,0 +1,94 @@
+'''
+This module implements fingerprints of handle records, so that records
+whose content has not changed are not sent to the handle server again.
+
+The fingerprint of a record is the SHA-256 of its normalized payload: keys
+are sorted and volatile fields that change on every run without a change
+of the METS (the attribution date set by get_source and getSource) are
+left out. The fingerprint of every record that was sent is kept in a local
+SQLite store by PID. Before a record is sent, its fingerprint is compared
+with the stored one and the PUT is skipped if they are equal.
+
+The store is used if a path is given to m2h or batch (--fingerprints) or
+set in the environment variable METS2HANDLE_FINGERPRINTS.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Keys of the payloads that are set to the time of the run
+VOLATILE_KEYS = frozenset({'attributionDate'})
+
+
+def normalize(value):
+    """
+    Copy of value without the volatile keys in any of its dicts.
+    """
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if key not in VOLATILE_KEYS}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def fingerprint(kind: str, payload) -> str:
+    data = json.dumps([kind, normalize(payload)], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf8')).hexdigest()
+
+
+class FingerprintStore:
+    """
+    Fingerprints of the records sent to the handle server, by PID.
+    """
+
+    def __init__(self, path: str, timeout: float = 60):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS fingerprints '
+                                '(pid TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, updated REAL NOT NULL)')
+
+    def get(self, pid: str) -> str:
+        with self._lock:
+            row = self.connection.execute('SELECT fingerprint FROM fingerprints WHERE pid = ?', (pid,)).fetchone()
+        return row[0] if row else None
+
+    def is_unchanged(self, pid: str, kind: str, payload) -> bool:
+        return self.get(pid) == fingerprint(kind, payload)
+
+    def put(self, pid: str, kind: str, payload):
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)',
+                                    (pid, fingerprint(kind, payload), time.time()))
+
+    def close(self):
+        self.connection.close()
+
+
+_stores = {}
+
+
+def open_store(path: str = None) -> FingerprintStore:
+    """
+    The store in path, or in METS2HANDLE_FINGERPRINTS if path is None, one
+    per path and process. Returns None if neither is set.
+    """
+    path = path or os.environ.get('METS2HANDLE_FINGERPRINTS')
+    if not path:
+        return None
+    key = (os.path.abspath(path), os.getpid())
+    if key not in _stores:
+        _stores[key] = FingerprintStore(path)
+    return _stores[key]
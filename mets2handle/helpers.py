@@ -1,16 +1,76 @@
-import requests
-from urllib.request import urlopen
 import json
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
 from lxml import etree as ET
 
+from mets2handle import mets_io
+from mets2handle import xpaths as xp
+from mets2handle.countries import country_resolver
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES, enum_cache
+from mets2handle.metrics import metrics
+from mets2handle.session import get_session
+from mets2handle.snapshot import load_snapshot
+
 import logging
 
-logging.basicConfig(filename='/tmp/myapp.log', level=logging.DEBUG,
-                    format='%(asctime)s %(levelname)s %(name)s %(message)s')
 logger = logging.getLogger(__name__)
 
-vocab_map_file = open('mets2handle/vocab_map.json')
-vocab_map = json.load(vocab_map_file)
+VOCAB_MAP_RESOURCE = 'vocab_map.json'
+
+
+def read_vocab_map() -> dict[str, str]:
+    from importlib import resources
+
+    return json.loads(resources.files(__package__).joinpath(VOCAB_MAP_RESOURCE).read_text(encoding='utf8'))
+
+
+@lru_cache(maxsize=None)
+def load_reference_data():
+    """
+    Loads the precompiled reference data on first use and seeds the country
+    resolver and the enum cache with it, see snapshot.py. Enumerations that
+    were put into the enum cache before are kept. The enumerations of the
+    snapshot are as old as the snapshot, so they are revalidated once their
+    time to live has expired. Returns the snapshot or None if there is none.
+    """
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        country_resolver.seed(snapshot['countries'], snapshot['subdivisions'])
+        enum_cache.seed(snapshot['enums'], fetched_at=snapshot['created'], overwrite=False)
+    return snapshot
+
+
+def warm_up():
+    """
+    Loads the reference data before the first METS file of a long running
+    process. The snapshot is loaded first, only what it does not contain is
+    built from pycountry, and only the enumerations it does not contain or
+    whose time to live has expired are fetched from the DTR. Raises OSError
+    if the DTR cannot be reached and an enumeration is not cached at all.
+    """
+    snapshot = load_reference_data()
+    if snapshot is None:
+        # Builds the tables of country names from pycountry
+        country_resolver.names
+    enum_cache.prefetch(KNOWN_ENUM_TYPES.values())
+
+
+@lru_cache(maxsize=None)
+def get_vocab_map() -> dict[str, str]:
+    snapshot = load_reference_data()
+    return snapshot['vocab_map'] if snapshot is not None else read_vocab_map()
+
+
+def __getattr__(name: str):
+    # Nothing is read at import time, helpers.vocab_map and helpers.snapshot
+    # are loaded on first access
+    if name == 'vocab_map':
+        return get_vocab_map()
+    if name == 'snapshot':
+        return load_reference_data()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 '''
 Module to implement helper funktions to keept the code organized and less complex in metstohandle.py
@@ -18,18 +78,97 @@ Module to implement helper funktions to keept the code organized and less comple
 
 
 def getEnumFromType(datatype: str) -> list[str]:
-    baseurl = "https://dtr-test.pidconsortium.net/objects/"
-    url = baseurl + datatype
-    response = urlopen(url)
-    type_data = json.loads(response.read())
-    return json.loads(type_data['properties'][0]['enum'])
+    """
+    Returns the enumeration of a DTR type. The DTR is only asked if the
+    enumeration is neither in the memory nor in the disk cache or if the
+    cached entry is older than its time to live, see enum_cache.py
+    """
+    load_reference_data()
+    return enum_cache.get(datatype)
+
+
+@lru_cache(maxsize=None)
+def read_credentials(path: str) -> dict[str, str]:
+    """
+    Reads the connection details for the ePIC PID service from a file with
+    one "key|value" pair per line. The result is cached per path and must
+    not be modified.
+    """
+    connection_details = {}
+    with open(path, "r") as f:
+        for line in f:
+            key, value = line.strip().split("|")
+            connection_details[key] = value
+    return connection_details
 
 
-def getDAtaObejctPidsFrom_Versionhandle(pidOfVersion: str, url: str, user: str, password: str) -> object:
+def getDAtaObejctPidsFrom_Versionhandle(pidOfVersion: str, url: str, user: str, password: str) -> list[str]:
+    """
+    Returns the PIDs of the DataObjects recorded in a registered version.
+    """
     pid = pidOfVersion.split('/')[1]
-    answer = requests.get(url + pid, auth=(user, password))
+    answer = get_session().get(url + pid, auth=(user, password))
+    answer.raise_for_status()
     data = json.loads(answer.text)
-    return json.loads(data[1]['parsed_data'])
+    for entry in data:
+        if entry.get('type') == 'movie_db_version':
+            version = entry['parsed_data']
+            if isinstance(version, str):
+                version = json.loads(version)
+            return list(version.get('has_data_objects', []))
+    return []
+
+
+def get_handle_pids(dmdsec, ns: dict[str, str]) -> list[str]:
+    """
+    Returns the handles already recorded as identifiers in a dmdSec.
+    """
+    pids = []
+    for identifier in xp.IDENTIFIERS(dmdsec):
+        if identifier.get('formatLabel') == "hdl.handle.net":
+            pids.append(str(xp.first(xp.DC_IDENTIFIER, identifier).text).strip())
+    return pids
+
+
+@contextmanager
+def atomic_output(out_file: str):
+    """
+    Opens a temporary file next to out_file for writing, which replaces
+    out_file when the block is left without an error. Readers never see a
+    half written file and the original stays untouched if writing fails.
+    What is written is compressed if out_file is, see mets_io.py.
+    """
+    directory = os.path.dirname(os.path.abspath(out_file))
+    compression = mets_io.output_compression(out_file)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(out_file), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as metsfile:
+            with mets_io.compressed_writer(metsfile, compression) as writer:
+                yield writer
+            metrics.inc('mets_bytes_written', metsfile.tell())
+        if os.path.exists(out_file):
+            os.chmod(tmp_path, os.stat(out_file).st_mode & 0o7777)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, out_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_mets(xml_tree, out_file: str):
+    """
+    Serializes the METS tree once and atomically replaces out_file with it.
+    """
+    with atomic_output(out_file) as metsfile:
+        xml_tree.write(metsfile, xml_declaration=True, encoding='utf-8')
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
 
 
 def buildisVersiontOfVersionXML(pidWerk: str) -> object:
@@ -0,0 +1,185 @@
+'''
+This module implements the journal that makes batch runs resumable.
+
+The journal is a SQLite database with one row per METS file, written ahead
+of every step of its registration:
+
+* planned: the PIDs of the new records are minted and stored with a hash
+  of the dmdSecs they are built from, before anything is sent
+* registered: all records have been sent to the handle server
+* written: the PIDs have been written to the METS, the file is done
+
+When a batch is restarted with the same journal, written files are skipped
+at once. Files that were interrupted reuse the PIDs planned before, so a
+record that was already sent is overwritten instead of registered twice.
+Files whose records were all sent are only written, without sending them
+again, as long as their dmdSecs have not changed.
+
+Updates of versions that were registered before are collected by the
+batch and sent once per version at its end. The worker keeps them in the
+journal together with the written state of the file, so an interrupted
+batch sends them on its next run.
+
+Every worker process opens its own connection, the database is used in
+WAL mode so that they do not block each other for long.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from lxml import etree as ET
+
+PLANNED = 'planned'
+REGISTERED = 'registered'
+WRITTEN = 'written'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    pids TEXT NOT NULL DEFAULT '{}',
+    content_hash TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS version_updates (
+    version TEXT NOT NULL,
+    data_object TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (version, data_object)
+)
+'''
+
+
+def content_hash(dmdsecs) -> str:
+    """
+    Hash of the dmdSecs the records of a METS are built from.
+    """
+    digest = hashlib.sha256()
+    for dmdsec in dmdsecs:
+        digest.update(ET.tostring(dmdsec, method='c14n'))
+    return digest.hexdigest()
+
+
+class BatchJournal:
+    """
+    Connection to the journal database in path, which is created if needed.
+    """
+
+    def __init__(self, path: str, timeout: float = 60):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def key(filename: str) -> str:
+        return os.path.abspath(filename)
+
+    def written_files(self) -> set[str]:
+        rows = self.connection.execute('SELECT file FROM files WHERE state = ?', (WRITTEN,))
+        return {row[0] for row in rows}
+
+    def entry(self, filename: str) -> 'FileJournal':
+        row = self.connection.execute('SELECT state, pids, content_hash FROM files WHERE file = ?',
+                                      (self.key(filename),)).fetchone()
+        if row is None:
+            return FileJournal(self, filename)
+        return FileJournal(self, filename, row[0], json.loads(row[1]), row[2])
+
+    def update(self, filename: str, state: str = None, pids: dict = None, content_hash: str = None,
+               error: str = None):
+        """
+        Writes the state of filename. Values that are None are kept, except
+        for error, which is cleared by every update.
+        """
+        self.connection.execute(
+            'INSERT INTO files (file, state, pids, content_hash, error, updated) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(file) DO UPDATE SET state = coalesce(?, state), pids = coalesce(?, pids), '
+            'content_hash = coalesce(?, content_hash), error = ?, updated = ?',
+            (self.key(filename), state or PLANNED, json.dumps(pids or {}), content_hash, error, time.time(),
+             state, json.dumps(pids) if pids is not None else None, content_hash, error, time.time()))
+
+    def add_version_update(self, update: dict):
+        """
+        Keeps an update of a version deferred by m2h until it is sent.
+        """
+        payload = json.dumps(update['payload'], ensure_ascii=False)
+        self.connection.executemany('INSERT OR REPLACE INTO version_updates VALUES (?, ?, ?)',
+                                    [(update['version'], pid, payload) for pid in update['data_objects']])
+
+    def pending_version_updates(self) -> list[dict]:
+        rows = self.connection.execute('SELECT version, data_object, payload FROM version_updates ORDER BY rowid')
+        return [{'version': version, 'data_objects': [data_object], 'payload': json.loads(payload)}
+                for version, data_object, payload in rows]
+
+    def version_updated(self, version_pid: str):
+        self.connection.execute('DELETE FROM version_updates WHERE version = ?', (version_pid,))
+
+    def counts(self) -> dict[str, int]:
+        return dict(self.connection.execute('SELECT state, count(*) FROM files GROUP BY state'))
+
+    def close(self):
+        self.connection.close()
+
+
+class FileJournal:
+    """
+    The journal entry of one METS file, as passed to m2h.
+    """
+
+    def __init__(self, journal: BatchJournal, filename: str, state: str = None, pids: dict = None,
+                 content_hash: str = None):
+        self.journal = journal
+        self.filename = filename
+        self.state = state
+        self.pids = pids or {}
+        self.content_hash = content_hash
+
+    def is_registered(self, pids: dict, content_hash: str) -> bool:
+        """
+        True if the records with these PIDs were all sent by an earlier run
+        and the dmdSecs they were built from are unchanged.
+        """
+        return (self.state in (REGISTERED, WRITTEN) and content_hash == self.content_hash
+                and all(self.pids.get(dmdid) == pid for dmdid, pid in pids.items()))
+
+    def planned(self, pids: dict, content_hash: str):
+        if self.is_registered(pids, content_hash):
+            return
+        self.state, self.pids, self.content_hash = PLANNED, pids, content_hash
+        self.journal.update(self.filename, PLANNED, pids, content_hash)
+
+    def registered(self):
+        self.state = REGISTERED
+        self.journal.update(self.filename, REGISTERED)
+
+    def written(self, version_updates=()):
+        """
+        Marks the file as written. The version updates m2h deferred for it
+        are kept in the same transaction, so they cannot be lost once the
+        file is skipped by a resumed batch.
+        """
+        self.state = WRITTEN
+        connection = self.journal.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for update in version_updates:
+                self.journal.add_version_update(update)
+            self.journal.update(self.filename, WRITTEN)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def failed(self, error: str):
+        self.journal.update(self.filename, error=error)
@@ -0,0 +1,266 @@
+'''
+This module implements a local stand-in for the ePIC handle server and the
+DTR, for offline runs and load tests of metstohandle.
+
+The server implements the endpoints used by the package:
+
+* PUT /api/handles/<prefix>/<suffix> stores a handle record
+* GET /api/handles/<prefix>/<suffix> returns a stored handle record
+* GET /objects/<prefix>/<suffix> returns a DTR type with its enumeration
+* GET /stats returns the number of requests by method and status
+
+Records are kept in memory only. Latency, server errors (503) and rate
+limiting (429 with Retry-After) can be injected with a given probability,
+so that the concurrency, retry and batch modes can be measured without
+network access. Faults are only injected into the handle endpoints, unless
+dtr_faults is set, as the DTR lookups are not retried.
+
+Usage:
+    metstohandle local-server -p 8000 --latency 0.05 --error-rate 0.01 \\
+        --throttle-rate 0.05 -w handle_connection_local.txt
+    export METS2HANDLE_DTR_URL=http://127.0.0.1:8000/objects/
+    metstohandle -c handle_connection_local.txt <mets_file>
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES, EnumCache, enum_cache
+
+logger = logging.getLogger(__name__)
+
+HANDLES_PATH = '/api/handles/'
+OBJECTS_PATH = '/objects/'
+DEFAULT_PREFIX = '21.T11998'
+
+
+def default_enums() -> dict[str, list[str]]:
+    """
+    Enumerations served for the known DTR types: from the snapshot if there
+    is one, else from the on-disk enum cache. Types that are in neither are
+    served with an empty enumeration. The DTR itself is never asked.
+    """
+    from mets2handle.snapshot import load_snapshot
+
+    snapshot = load_snapshot()
+    enums = dict(snapshot['enums']) if snapshot is not None else {}
+    # Stale entries are fine here, so do not revalidate
+    disk_cache = EnumCache(cache_dir=enum_cache.cache_dir, ttl=float('inf'))
+    for datatype in KNOWN_ENUM_TYPES.values():
+        if datatype not in enums:
+            entry = disk_cache._read(datatype)
+            enums[datatype] = entry['enum'] if entry is not None else []
+    return enums
+
+
+class LocalHandleServer(ThreadingHTTPServer):
+    """
+    HTTP server holding the handle records and the fault injection settings.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 8000), enums: dict[str, list[str]] = None,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: int = 0, dtr_faults: bool = False,
+                 seed: int = None):
+        super().__init__(address, LocalHandleRequestHandler)
+        self.enums = default_enums() if enums is None else enums
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.dtr_faults = dtr_faults
+        self.records = {}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def fault(self):
+        """
+        Returns the status code of an injected fault or None.
+        """
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            draw = self.random.random()
+        if delay:
+            time.sleep(delay)
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def count(self, method: str, status: int):
+        with self.lock:
+            self.stats[f'{method} {status}'] += 1
+
+    def write_credentials(self, path: str, prefix: str = DEFAULT_PREFIX):
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(f'url|{self.url}{HANDLES_PATH}{prefix}/\n'
+                    'user|local\n'
+                    'password|local\n'
+                    f'prefix|{prefix}\n'
+                    'type_prefix|21.T11148\n')
+
+
+class LocalHandleRequestHandler(BaseHTTPRequestHandler):
+    server: LocalHandleServer
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid the delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug('LOCAL SERVER: ' + format, *args)
+
+    def _send(self, status: int, body=None, headers: dict = None):
+        data = json.dumps(body).encode('utf8') if body is not None else b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.count(self.command, status)
+
+    def _inject_fault(self) -> bool:
+        status = self.server.fault()
+        if status == 429:
+            self._send(429, {'responseCode': 429, 'message': 'Too many requests'},
+                       {'Retry-After': str(self.server.retry_after)})
+        elif status is not None:
+            self._send(status, {'responseCode': status, 'message': 'Injected error'})
+        return status is not None
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self._inject_fault():
+            return
+        if not self.path.startswith(HANDLES_PATH):
+            self._send(404, {'responseCode': 404, 'message': 'Not found'})
+            return
+        handle = self.path[len(HANDLES_PATH):].split('?')[0]
+        try:
+            record = json.loads(body)
+        except ValueError:
+            self._send(400, {'responseCode': 400, 'message': 'Invalid JSON'})
+            return
+        with self.server.lock:
+            exists = handle in self.server.records
+            self.server.records[handle] = record
+        self._send(200 if exists else 201, {'responseCode': 1, 'handle': handle})
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/stats':
+            with self.server.lock:
+                stats = {'records': len(self.server.records), 'requests': dict(self.server.stats)}
+            self._send(200, stats)
+            return
+        if (self.server.dtr_faults or not path.startswith(OBJECTS_PATH)) and self._inject_fault():
+            return
+        if path.startswith(HANDLES_PATH):
+            with self.server.lock:
+                record = self.server.records.get(path[len(HANDLES_PATH):])
+            if record is None:
+                self._send(404, {'responseCode': 100, 'message': 'Handle not found'})
+            else:
+                self._send(200, record)
+        elif path.startswith(OBJECTS_PATH):
+            self._get_type(path[len(OBJECTS_PATH):])
+        else:
+            self._send(404, {'responseCode': 404, 'message': 'Not found'})
+
+    def _get_type(self, datatype: str):
+        if datatype not in self.server.enums:
+            self._send(404, {'message': 'Type not found'})
+            return
+        enum = json.dumps(self.server.enums[datatype])
+        etag = '"%s"' % hashlib.sha1(enum.encode('utf8')).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, headers={'ETag': etag})
+            return
+        self._send(200, {'id': datatype, 'properties': [{'name': datatype, 'enum': enum}]},
+                   {'ETag': etag})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='metstohandle local-server',
+        description='Run a local stand-in for the ePIC handle server and the DTR.')
+    parser.add_argument(
+        '-b', '--bind', metavar='<address>', default='127.0.0.1',
+        help='Address to listen on (default: %(default)s).')
+    parser.add_argument(
+        '-p', '--port', metavar='<port>', type=int, default=8000,
+        help='Port to listen on (default: %(default)s).')
+    parser.add_argument(
+        '-e', '--enums', metavar='<json_file>',
+        help='JSON file mapping DTR type PIDs to their enumerations'
+        ' (default: snapshot or enum cache).')
+    parser.add_argument(
+        '-w', '--write-credentials', metavar='<credentials_file>',
+        help='Write a credentials file for this server.')
+    parser.add_argument(
+        '--latency', metavar='<seconds>', type=float, default=0.0,
+        help='Delay of every response (default: %(default)s).')
+    parser.add_argument(
+        '--jitter', metavar='<seconds>', type=float, default=0.0,
+        help='Maximum random delay added to the latency (default: %(default)s).')
+    parser.add_argument(
+        '--error-rate', metavar='<rate>', type=float, default=0.0,
+        help='Fraction of requests answered with 503 (default: %(default)s).')
+    parser.add_argument(
+        '--throttle-rate', metavar='<rate>', type=float, default=0.0,
+        help='Fraction of requests answered with 429 (default: %(default)s).')
+    parser.add_argument(
+        '--retry-after', metavar='<seconds>', type=int, default=0,
+        help='Retry-After of 429 responses (default: %(default)s).')
+    parser.add_argument(
+        '--dtr-faults', action='store_true',
+        help='Inject faults into DTR type lookups, too.')
+    parser.add_argument(
+        '--seed', metavar='<n>', type=int,
+        help='Seed of the fault injection, for reproducible runs.')
+    args = parser.parse_args(argv)
+
+    enums = None
+    if args.enums:
+        with open(args.enums, 'r', encoding='utf8') as f:
+            enums = json.load(f)
+    server = LocalHandleServer((args.bind, args.port), enums=enums, latency=args.latency,
+                               jitter=args.jitter, error_rate=args.error_rate,
+                               throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+                               dtr_faults=args.dtr_faults, seed=args.seed)
+    if args.write_credentials:
+        server.write_credentials(args.write_credentials)
+        print('Credentials written to', args.write_credentials)
+    print(f'Serving handles on {server.url}{HANDLES_PATH} and DTR types on {server.url}{OBJECTS_PATH}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print('Requests:', json.dumps(dict(server.stats), sort_keys=True))
+    return 0
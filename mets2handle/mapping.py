@@ -0,0 +1,66 @@
+'''
+This module implements a declarative mapping engine for the records built
+from a dmdSec.
+
+Each field of a record registers the element tags it needs and a handler
+that computes the value of the field from the elements with these tags.
+build() walks the dmdSec once, collects the elements of all tags needed by
+the selected fields in document order and then calls the handlers. So the
+cost of mapping a record grows with the size of the dmdSec and not with the
+number of fields times the size of the document.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+EBUCORE = '{urn:ebu:metadata-schema:ebucore}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+
+
+class MappingField:
+    def __init__(self, flag: str, key: str, tags: tuple, handler):
+        self.flag = flag
+        self.key = key
+        self.tags = tags
+        self.handler = handler
+
+
+class RecordMapping:
+    """
+    Fields of one record type in the order they appear in the record.
+    """
+
+    def __init__(self):
+        self.fields = []
+
+    def field(self, flag: str, key: str, *tags: str):
+        """
+        Decorator that registers handler(matches) as the field key of the
+        record. flag is the name of the switch for this field, matches maps
+        each of the tags to the list of matching elements in the dmdSec.
+        """
+        def register(handler):
+            self.fields.append(MappingField(flag, key, tags, handler))
+            return handler
+        return register
+
+    def collect(self, dmdsec, tags) -> dict:
+        """
+        Elements below dmdsec with one of the tags, in one walk over dmdsec.
+        """
+        matches = {tag: [] for tag in tags}
+        if matches:
+            for elem in dmdsec.iter(*matches):
+                if elem is not dmdsec:
+                    matches[elem.tag].append(elem)
+        return matches
+
+    def build(self, dmdsec, enabled: dict[str, bool]) -> dict:
+        """
+        Returns the record with all fields whose flag is true in enabled.
+        """
+        fields = [field for field in self.fields if enabled.get(field.flag)]
+        matches = self.collect(dmdsec, {tag for field in fields for tag in field.tags})
+        return {field.key: field.handler(matches) for field in fields}
@@ -0,0 +1,215 @@
+'''
+This module implements a lightweight instrumentation layer for
+metstohandle.
+
+The modules of the package record counters (cache hits, records, bytes
+written) and histograms (durations of the stages of a run, latency of the
+HTTP requests) in the shared registry metrics. At the end of a run or batch
+the registry can be exported as a JSON summary or in the Prometheus text
+format. In batch mode every worker process sends a snapshot of what it
+recorded since the previous one with the result of each file, the first
+one includes the warm-up of the worker. The parent merges the snapshots.
+
+Stages are timed with
+
+    with metrics.span('parse'):
+        ...
+
+or by decorating a function with @metrics.timed('map_work').
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'mets2handle_'
+# Upper bounds of the histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_key(key: tuple, extra: tuple = ()) -> str:
+    name, labels = key
+    labels = labels + extra
+    if not labels:
+        return name
+    return name + '{' + ','.join('%s="%s"' % (label, value.replace('\\', '\\\\').replace('"', '\\"'))
+                                 for label, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            position = len(self.buckets)
+        self.counts[position] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count, 'max': self.max}
+
+    def merge(self, snapshot: dict):
+        self.counts = [own + other for own, other in zip(self.counts, snapshot['counts'])]
+        self.sum += snapshot['sum']
+        self.count += snapshot['count']
+        self.max = max(self.max, snapshot['max'])
+
+
+class Metrics:
+    """
+    Registry of counters and histograms, safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str):
+        """
+        Records the duration of the block in stage_seconds{stage=...}.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage: str):
+        """
+        Decorator recording the duration of every call as a span.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """
+        Picklable and JSON serializable state of the registry, see merge().
+        With reset the registry is emptied in the same step.
+        """
+        with self._lock:
+            counters, histograms = self.counters, self.histograms
+            if reset:
+                self.counters = {}
+                self.histograms = {}
+            return {'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                    'histograms': [[name, dict(labels), histogram.snapshot()]
+                                   for (name, labels), histogram in histograms.items()]}
+
+    def merge(self, snapshot: dict):
+        """
+        Adds the state of another registry, e.g. of a worker process.
+        """
+        for name, labels, value in snapshot['counters']:
+            self.inc(name, value, **labels)
+        for name, labels, histogram in snapshot['histograms']:
+            key = _key(name, labels)
+            with self._lock:
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].merge(histogram)
+
+    def summary(self) -> dict:
+        """
+        Human readable summary: counters, cache hit rates and count, total,
+        mean and maximum of every histogram.
+        """
+        with self._lock:
+            counters = {_format_key(key): value for key, value in sorted(self.counters.items())}
+            histograms = {}
+            for key, histogram in sorted(self.histograms.items()):
+                histograms[_format_key(key)] = {
+                    'count': histogram.count,
+                    'total_seconds': round(histogram.sum, 6),
+                    'mean_seconds': round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                    'max_seconds': round(histogram.max, 6)}
+            hits = self.counters.get(_key('enum_cache_lookups', {'result': 'hit'}), 0)
+            lookups = hits + self.counters.get(_key('enum_cache_lookups', {'result': 'miss'}), 0)
+        return {'counters': counters,
+                'histograms': histograms,
+                'enum_cache_hit_rate': round(hits / lookups, 4) if lookups else None}
+
+    def prometheus(self) -> str:
+        """
+        The registry in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f'# TYPE {PREFIX}{name}_total counter')
+                for key, value in sorted(self.counters.items()):
+                    if key[0] == name:
+                        lines.append(f'{PREFIX}{_format_key((name + "_total", key[1]))} {value}')
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {PREFIX}{name} histogram')
+                for key, histogram in sorted(self.histograms.items()):
+                    if key[0] != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        bucket = _format_key((name + '_bucket', key[1]), (('le', str(bound)),))
+                        lines.append(f'{PREFIX}{bucket} {cumulative}')
+                    lines.append(f'{PREFIX}{_format_key((name + "_sum", key[1]))} {histogram.sum}')
+                    lines.append(f'{PREFIX}{_format_key((name + "_count", key[1]))} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str):
+        """
+        Writes the metrics to path, in the Prometheus text format if path
+        ends with .prom and as JSON summary otherwise.
+        """
+        with open(path, 'w', encoding='utf8') as f:
+            if path.endswith('.prom'):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.summary(), f, indent=4)
+
+
+# Registry shared by all modules of the package
+metrics = Metrics()
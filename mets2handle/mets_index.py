@@ -0,0 +1,88 @@
+'''
+This module implements an index over the parts of a METS document that are
+needed to register the PIDs.
+
+The index is built in one pass over the document. It maps the IDs of the
+dmdSecs to their elements, the DMDIDs of the structMap to their divs and
+the TYPE of the divs (cinematographicWork, version, dataObject) to the
+DMDIDs in the order of the structMap. All lookups afterwards are dict
+lookups, so the cost of resolving the works, versions and data objects of a
+METS does not depend on the number of dmdSecs.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+METS_NS = 'http://www.loc.gov/METS/'
+DMDSEC = '{%s}dmdSec' % METS_NS
+STRUCTMAP = '{%s}structMap' % METS_NS
+DIV = '{%s}div' % METS_NS
+
+# TYPEs of the divs in the structMap that are registered as handles
+KNOWN_TYPES = ('cinematographicWork', 'version', 'dataObject')
+
+
+class MetsIndex:
+    """
+    Index of the dmdSecs and the (first) structMap of a METS tree.
+    """
+
+    def __init__(self, xml_tree):
+        self.tree = xml_tree
+        self.root = xml_tree.getroot() if hasattr(xml_tree, 'getroot') else xml_tree
+        self.dmdsecs = {}
+        self.divs = {}
+        self.ids_by_type = {}
+        self.struct_map = None
+        for elem in self.root.iter(DMDSEC, STRUCTMAP):
+            if elem.tag == DMDSEC:
+                self.dmdsecs[elem.get('ID')] = elem
+            elif self.struct_map is None:
+                self.struct_map = elem
+                self._index_struct_map(elem)
+
+    def _index_struct_map(self, struct_map):
+        for div in struct_map.iter(DIV):
+            element_type = div.get('TYPE')
+            if element_type not in KNOWN_TYPES:
+                logger.info('FOUND an unkown DMDID Type %s', element_type)
+            # DMDID may reference more than one dmdSec
+            for dmdid in (div.get('DMDID') or '').split():
+                self.divs[dmdid] = div
+                self.ids_by_type.setdefault(element_type, []).append(dmdid)
+
+    def ids_of_type(self, element_type: str) -> list[str]:
+        """
+        DMDIDs of all divs with the given TYPE, in structMap order.
+        """
+        return self.ids_by_type.get(element_type, [])
+
+    def dmdsec(self, dmdid: str):
+        return self.dmdsecs.get(dmdid)
+
+    def div(self, dmdid: str):
+        return self.divs.get(dmdid)
+
+    def type_of(self, dmdid: str) -> str:
+        div = self.divs.get(dmdid)
+        return div.get('TYPE') if div is not None else None
+
+    def dmdsecs_of_type(self, element_type: str) -> list:
+        """
+        The dmdSecs referenced by divs with the given TYPE. References to
+        missing dmdSecs are logged and skipped.
+        """
+        dmdsecs = []
+        for dmdid in self.ids_of_type(element_type):
+            dmdsec = self.dmdsecs.get(dmdid)
+            if dmdsec is None:
+                logger.error('No dmdSec with ID %s for %s', dmdid, element_type)
+            else:
+                dmdsecs.append(dmdsec)
+        return dmdsecs
@@ -0,0 +1,114 @@
+'''
+This module implements reading and writing of compressed METS files.
+
+METS packages may be stored compressed with gzip (.xml.gz) or zstd
+(.xml.zst). They are read and written as streams, without temporary
+decompressed copies:
+
+* open_input() returns the decompressed content of a METS file as a binary
+  file object. The compression is detected by the magic bytes of the file.
+  Uncompressed files are memory mapped, so lxml and expat read them
+  without copying them through a file buffer.
+* compressed_writer() compresses what is written to an output file. The
+  compression is chosen by the extension of the output file, or by the
+  magic bytes of the file it replaces (e.g. when the input is updated in
+  place). helpers.atomic_output() uses it for every METS file written.
+
+zstd needs the optional zstandard package (pip install mets2handle[zstd]).
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import gzip
+import mmap
+import os
+from contextlib import contextmanager
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+MAGIC_BYTES = {GZIP: b'\x1f\x8b', ZSTD: b'\x28\xb5\x2f\xfd'}
+SUFFIXES = {'.gz': GZIP, '.zst': ZSTD}
+GZIP_LEVEL = 6
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as error:
+        raise ImportError('zstd compressed METS files need the zstandard package '
+                          '(pip install mets2handle[zstd])') from error
+    return zstandard
+
+
+def input_compression(path: str):
+    """
+    The compression of the file in path by its magic bytes, or None.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for compression, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def output_compression(path: str):
+    """
+    The compression of an output file by its extension, or by the magic
+    bytes of the file that is replaced, or None.
+    """
+    compression = SUFFIXES.get(os.path.splitext(path)[1].lower())
+    if compression is None and os.path.isfile(path):
+        compression = input_compression(path)
+    return compression
+
+
+def check_output(path: str):
+    """
+    Raises ImportError if the compression of the output file in path is not
+    available, before anything is registered.
+    """
+    if output_compression(path) == ZSTD:
+        _zstandard()
+
+
+@contextmanager
+def open_input(path: str):
+    """
+    Opens the METS file in path for reading its decompressed content.
+    """
+    compression = input_compression(path)
+    if compression == GZIP:
+        with gzip.open(path, 'rb') as f:
+            yield f
+    elif compression == ZSTD:
+        with open(path, 'rb') as raw, \
+                _zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True) as f:
+            yield f
+    else:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files cannot be mapped
+                yield f
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+
+@contextmanager
+def compressed_writer(raw, compression: str = None):
+    """
+    Wraps the binary file raw, so that what is written is compressed with
+    compression. raw stays open.
+    """
+    if compression == GZIP:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=GZIP_LEVEL, mtime=0) as f:
+            yield f
+    elif compression == ZSTD:
+        with _zstandard().ZstdCompressor().stream_writer(raw, closefd=False) as f:
+            yield f
+    else:
+        yield raw
@@ -7,15 +7,24 @@ __license__ = "GPL"
 __version__ = "3.0"
 
 import argparse
-import json
+import importlib
+import logging
+import os
 import sys
-import uuid
 from xml.etree import ElementTree
 
-import requests
 from lxml import etree as ET
-from mets2handle import helpers
+from mets2handle import helpers, mets_io
+from mets2handle import xpaths as xp
 import mets2handle
+from mets2handle.engine import DEFAULT_MAX_IN_FLIGHT, HandleRecord, register_records
+from mets2handle.fingerprints import open_store
+from mets2handle.journal import content_hash
+from mets2handle.mets_index import MetsIndex
+from mets2handle.metrics import metrics
+from mets2handle.patching import MetsPatch, is_utf8, write_patched
+from mets2handle.sinks import open_sinks
+from mets2handle.streaming import parse_skeleton, write_streaming
 
 '''
 Vollständige Menschen am Sonntag Handle unter handle id 21.T11998/0412EF68-FC59-4240-9D5D-EEA25F083873
@@ -43,8 +52,8 @@ Einige wichtige Variablen, Funktionen und Abschnitte des Codes sind:
 * uuid.uuid4(): Eine Funktion zum Generieren einer eindeutigen UUID (Universally 
     Unique Identifier), die als Teil der Handle-ID für jeden erstellten cineastischen 
     Work verwendet wird.
-* requests.post() und requests.put(): Funktionen zum Senden von HTTP-POST- bzw. 
-    PUT-Anfragen an den Handle-Server mit den erstellten JSON-Daten.
+* http.put(): Sendet PUT-Anfragen mit den erstellten JSON-Daten über die 
+    gemeinsame Session aus session.py (Connection-Pooling, Retries) an den Handle-Server.
 * sys.argv[1]: Der Pfad zum METS-Dokument, der als Argument beim Aufruf des Skripts 
     übergeben wird.
 
@@ -55,32 +64,51 @@ um die Liste der "cinematographicWork" und "version" DIVs zu erstellen. Für jed
 Hilfe des xj-Moduls erstellt. Dieses Objekt wird dann mit requests.post() an den 
 Handle-Server gesendet. Wenn die POST-Anfrage erfolgreich ist, wird die neue Handle-ID 
 im METS-Dokument eingefügt und das Dokument gespeichert. Für jedes "version" DIV wird 
-ein JSON-Objekt mit Hilfe des vh-Moduls erstellt und mit requests.put() an den 
+ein JSON-Objekt mit Hilfe des vh-Moduls erstellt und mit http.put() an den 
 Handle-Server gesendet.
 
 '''
 
 
+@metrics.timed('m2h')
 def m2h(filename,
         out_file=None,
         work_pid=None,
         version_pid=None,
         credentials='./mets2handle/credentials/handle_connection.txt',
-        dumpjsons=True):
+        dumpjsons=True,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+        streaming=False,
+        journal=None,
+        fingerprints=None,
+        refresh=False,
+        version_updates=None,
+        ndjson=None,
+        patch=False):
+    """
+    Registers the work(s), version and DataObject(s) of a METS file and
+    writes the new PIDs into it. journal is the FileJournal of the file in a
+    resumable batch, see journal.py. fingerprints is the path of the store
+    of the records sent before, unchanged records are not sent again, see
+    fingerprints.py. With refresh the records that are already registered
+    are updated from the METS as well. If version_updates is a list, the
+    update of an already registered version is not sent but appended to
+    it, so a batch can merge the updates of all its files, see batch.py.
+    With dumpjsons the payloads are written to files in the working
+    directory, with ndjson they are appended to that file, see sinks.py.
+    With patch the new elements are spliced into a copy of the original
+    file instead of serializing the tree, see patching.py. filename and
+    out_file may be compressed with gzip or zstd, see mets_io.py.
+    """
     helpers.logger.info(' --- Start new run ---')
 
     # If no outfile is provided the original file will be overwritten
     if out_file is None:
         out_file = filename
+    mets_io.check_output(out_file)
 
     # Read credentials for the ePIC PID service
-    connection_details = {}
-    with open(credentials, "r") as f:
-        for line in f:
-            key, value = line.strip().split("|")
-            connection_details[key] = value
-
-    header = {'accept': 'application/json', 'Content-Type': 'application/json'}
+    connection_details = helpers.read_credentials(credentials)
 
     # counter to enumerate the files that result from the json dump for multiworks
     # TODO: Explain multiwork
@@ -92,40 +120,31 @@ def m2h(filename,
           "dc": "http://purl.org/dc/elements/1.1/"}
     parser = ET.XMLParser(remove_comments=False)
 
-    try:
-        xml_tree: ElementTree = ET.parse(filename, parser=parser)
-    except IndexError:
-        raise SystemExit(f"Usage: {sys.argv[0]} <path_to_XML_file>")
+    with metrics.span('parse'):
+        if streaming:
+            # Only the dmdSecs and the structMap are kept in memory
+            xml_tree: ElementTree = parse_skeleton(filename)
+        else:
+            try:
+                with mets_io.open_input(filename) as source:
+                    xml_tree: ElementTree = ET.parse(source, parser=parser, base_url=filename)
+            except IndexError:
+                raise SystemExit(f"Usage: {sys.argv[0]} <path_to_XML_file>")
 
     root = xml_tree.getroot()
-    struct = xml_tree.find('.//mets:structMap', ns)
-
-    # Create empty lists for the DMDIDs of cinematographic works, versions, and data objects
-    cinematographic_works = []
-    versions = []
-    data_objects = []
-    boolean_list_if_pids_exists = [0, 0, 0]
-
-    # Loop through the structure map of the METS file and
-    # find the DMDIDs of cinematographic works, versions, and data objects
-    # TODO: Make sure only one valid TYPE is given in the mets file
-    for div in struct.findall('.//mets:div', ns):
-        element_type = div.get('TYPE')
-        if element_type == 'cinematographicWork':
-            cinematographic_works.append(div.get('DMDID'))
-        elif element_type == 'version':
-            versions.append(div.get('DMDID'))
-        elif element_type == 'dataObject':
-            data_objects.append(div.get('DMDID'))
-        else:
-            helpers.logger.info('FOUND an unkown DMDID Type'+element_type)
+    # Index of the dmdSecs by ID and of the DMDIDs of the structure map by
+    # TYPE (cinematographicWork, version, dataObject), built in one pass
+    index = MetsIndex(xml_tree)
+    cinematographic_works = index.ids_of_type('cinematographicWork')
+    versions = index.ids_of_type('version')
+    data_objects = index.ids_of_type('dataObject')
 
     if len(versions) != 1:
         raise ValueError(
             f"Unexpectedly found {len(versions)} versions in {filename}.")
-    if len(data_objects) != 1:
+    if not data_objects:
         raise ValueError(
-            f"Unexpectedly found {len(data_objects)} DataObjects in {filename}.")
+            f"No DataObject found in {filename}.")
     if work_pid and len(cinematographic_works) != 1:
         raise ValueError(
             f"Parameter work_pid not allowed since there are"
@@ -135,278 +154,256 @@ def m2h(filename,
             f"Parameter version_pid not allowed since there are"
             f" {len(versions)} versions recorded in {filename}.")
 
+    work_dmdsecs = index.dmdsecs_of_type('cinematographicWork')
+    version_dmdsec = index.dmdsec(versions[0])
+    data_object_dmdsecs = [index.dmdsec(dmdid) for dmdid in data_objects]
+    if version_dmdsec is None or None in data_object_dmdsecs:
+        raise ValueError(
+            f"No dmdSec found for the version or a DataObject in {filename}.")
+    modified_dmdsecs = work_dmdsecs + [version_dmdsec] + data_object_dmdsecs
+    # Taken before anything is changed in the tree
+    mets_patch = None
+    if patch:
+        if not is_utf8(filename):
+            # The new elements are serialized as UTF-8 and cannot be spliced in
+            raise ValueError(f"Patch mode needs a METS encoded in UTF-8, {filename} is not.")
+        mets_patch = MetsPatch(modified_dmdsecs)
+
+    # All records that have to be sent to the handle server are planned first
+    # and then registered by the engine, which sends independent records
+    # concurrently, see engine.py. PIDs are minted here, so every payload
+    # can already reference the PIDs of the other records.
+    records = []
+    # PIDs of the new records by the ID of their dmdSec
+    planned_pids = {}
+    journaled_pids = journal.pids if journal is not None else {}
+
+    def new_record(kind, dmdsec, depends_on=()):
+        # Reuse the PID planned by an interrupted run of a batch
+        pid = journaled_pids.get(dmdsec.get('ID'))
+        if pid is None:
+            record = HandleRecord.new(kind, connection_details['prefix'], None, depends_on)
+        else:
+            record = HandleRecord(kind, pid, None, depends_on)
+        planned_pids[dmdsec.get('ID')] = record.pid
+        return record
+
     # empty list to hold PIDs of cinematographic works
     cinematographic_work_pids = []
-
-    # Generate a new UUID to use as the PID for the dataobject.
-    # Has to be done here, so we have it already when we get to
-    # the Version object, where the entry for the PID of a dataobject is needed.
-    data_object_uuid = str(uuid.uuid4())
-    data_object_pid = connection_details['prefix'] + '/{}'.format(data_object_uuid)
-
-    # Start of the main loop
-    for dmdsec in xml_tree.findall('.//mets:dmdSec', ns):
-
-        # If the ID attribute of the dmdSec element is in the list of cinematographic works,
-        # generate a new UUID to use as the PID for the work, generate the JSON for the work,
-        # write it to a file, and send a PUT request to the handle server to create a new handle for the work
-        if dmdsec.get('ID') in cinematographic_works:
-            # TODO: In an example file it is unclear if DMDID or ID should be used
-            pid = None
-            # TODO: hier abfrage, ob Werk bereits Pid hat
-
-            for identifier in dmdsec.findall('.//ebucore:identifier', ns):
-                # checks if work has an existing pid. if that is the case we add a 1 to the boolean array
-                if identifier.get('formatLabel') == "hdl.handle.net":
-                    boolean_list_if_pids_exists[0] = 1
-                    cinematographic_work_pids.append(str(identifier.find('.//dc:identifier', ns).text).strip())
-
-            if work_pid:
-                if boolean_list_if_pids_exists[0]:
-                    if work_pid not in cinematographic_work_pids:
-                        raise ValueError(
-                            f"Parameter work_pid={work_pid} clashes with"
-                            f" existing value in {filename}:"
-                            f" {cinematographic_work_pids[-1]}.")
-                else:
-                    pid = work_pid
-            elif not boolean_list_if_pids_exists[0]:
-                # Generate a work pid
-                work_uuid = str(uuid.uuid4())
-                cinematographic_work_pid = connection_details['prefix'] + '/{}'.format(str(work_uuid))
-
-                work_json = mets2handle.build_work_json(root, ns, pid_work=cinematographic_work_pid,
-                                                      original_duration=False,
-                                                      related_identifier=False, original_format=False)
-                if dumpjsons:
-                    json.dump(work_json,
-                              open(str(multi_work_number) + 'handle_work.json', 'w', encoding='utf8'),
-                              indent=4, sort_keys=False, ensure_ascii=False)
-
-                handle_data=[{'type': 'KIP','parsed_data': '21.T11148/31b848e871121c47d064'},
-                       {'type': 'movie_db_works','parsed_data':work_json}]
-
-                response_from_handle_server = requests.put(connection_details['url'] + work_uuid,
-                                    auth=(connection_details['user'], connection_details['password']),
-                                    headers=header,
-                                    data=json.dumps(handle_data))
-
-                #print(response_from_handle_server.text, response_from_handle_server.status_code, 'Response to create-Work-request')
-                print('PID for work: ', response_from_handle_server.json()['handle'])
-                response_from_handle_server.raise_for_status()
-
-                response = json.loads(response_from_handle_server.text)
-                multi_work_number = multi_work_number + 1
-                if True: # Just to keep diff output short
-                    # gets pid from response
-                    pid = response['handle']
-
-            if pid:
-                if True: # Just to keep diff output short
-                    cinematographic_work_pids.append(pid)
-
-                    # writes new PID into the mets file
-                    new_ident = mets2handle.create_identifier_element(pid)
-
-                    new_ident.text = '\n              '
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).addprevious(new_ident)
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).tail = '\n\n            '
-
-                    new_tree = ET.tostring(xml_tree, pretty_print=True)
-                    with open(out_file, 'wb') as metsfile:
-
-                        baum = ET.ElementTree(root)
-                        baum.write(metsfile, xml_declaration=True, encoding='utf-8')
-
-        # if the ID attribute of the dmdSec element is in the list of versions,
-        #  generate a new UUID to use as the PID for the work, generate the JSON for the version,
-        # write it to a file, and send a PUT request to the handle server to create a new handle for the version
-        if dmdsec.get('ID') in versions:
-            pid = existing_pid = None
-            # TODO: Hier gegebenenfalls abfrage, ob Versions_pid bereits im METS vorhanden ist
-            for identifier in dmdsec.findall('.//ebucore:identifier',
-                                             ns):  # checks if work has a existing pid. if thats the case we add a 1 to the boolean array
-                if identifier.get('formatLabel') == "hdl.handle.net":
-                    boolean_list_if_pids_exists[1] = 1
-                    existing_pid = str(identifier.find('.//dc:identifier', ns).text).strip()
-                    if version_pid and version_pid != existing_pid:
-                        raise ValueError(
-                            f"Parameter version_pid={version_pid} clashes with"
-                            f" existing value in {filename}: {existing_pid}.")
-                    version_uuid = str(identifier.find('.//dc:identifier', ns).text).strip().split('/')[1]
-                    data_object_pids.extend(
-                        helpers.getDAtaObejctPidsFrom_Versionhandle(version_pid, connection_details['url'],
-                                                                    connection_details['user'],
-                                                                    connection_details['password']))
-                    break
-
-            xml_tree_modified = False
-            if version_pid:
-                if not boolean_list_if_pids_exists[1]:
-                    pid = version_pid
-            elif not boolean_list_if_pids_exists[1]:
-                version_uuid = str(uuid.uuid4())
-                version_pid = connection_details['prefix'] + '/{}'.format(str(version_uuid))
-                data_object_pids = [data_object_pid]
-
-                version_json = mets2handle.build_version_json(root, ns, pid_works=cinematographic_work_pids,
-                                                                 dataobject_pid=data_object_pids, version_pid=version_pid)
-                if dumpjsons:
-                    json.dump(version_json,open('version.json', 'w', encoding='utf8'),
-                              indent=4, sort_keys=False, ensure_ascii=False)
-                handle_data_version = [{'type': 'KIP','parsed_data': '21.T11148/ef6836b80e4d64e574e3'},
-                       {'type': 'movie_db_version','parsed_data': version_json}]
-                response_from_handle_server = requests.put(connection_details['url'] + version_uuid, auth=(
-                    connection_details['user'], connection_details['password']), headers=header,
-                                                           data=json.dumps(handle_data_version))
-
-                #print(response_from_handle_server.text, response_from_handle_server.status_code, 'Response to create-Version-request')
-                print('PID for version: ', response_from_handle_server.json()['handle'])
-                response_from_handle_server.raise_for_status()
-
-                if True: # Just to keep diff output short
-                    # gets pid from response
-                    response = json.loads(response_from_handle_server.text)
-                    pid = response['handle']
+    work_records = []
+    # Works that get a new identifier element in the METS, with their PID
+    new_work_identifiers = []
+
+    for dmdsec in work_dmdsecs:
+        existing_pids = helpers.get_handle_pids(dmdsec, ns)
+        if existing_pids:
+            if work_pid and work_pid not in existing_pids:
+                raise ValueError(
+                    f"Parameter work_pid={work_pid} clashes with"
+                    f" existing value in {filename}:"
+                    f" {existing_pids[-1]}.")
+            cinematographic_work_pids.extend(existing_pids)
+            if refresh:
+                work_records.append(HandleRecord('work', existing_pids[0],
+                                                 work_payload(dmdsec, ns, existing_pids[0]), update=True))
+        elif work_pid:
+            cinematographic_work_pids.append(work_pid)
+            new_work_identifiers.append((dmdsec, work_pid))
+        else:
+            work_record = new_record('work', dmdsec)
+            # Every work is mapped from its own dmdSec when the engine
+            # sends it, so the first works are sent while the next ones
+            # are mapped
+            work_record.payload = work_payload(dmdsec, ns, work_record.pid)
+            work_record.dump_name = str(multi_work_number) + 'handle_work.json'
+            multi_work_number = multi_work_number + 1
+            work_records.append(work_record)
+            cinematographic_work_pids.append(work_record.pid)
+            new_work_identifiers.append((dmdsec, work_record.pid))
+    records.extend(work_records)
+
+    existing_version_pids = helpers.get_handle_pids(version_dmdsec, ns)
+    if existing_version_pids:
+        if version_pid and version_pid != existing_version_pids[0]:
+            raise ValueError(
+                f"Parameter version_pid={version_pid} clashes with"
+                f" existing value in {filename}: {existing_version_pids[0]}.")
+        version_pid = existing_version_pids[0]
+
+    # The PIDs of all dataobjects have to be known before the version record
+    # is built, where the entries for the PIDs of the dataobjects are needed.
+    # (dmdSec, PID, record) of every dataobject, record is None if it is
+    # registered and not refreshed
+    data_object_entries = []
+    for dmdsec in data_object_dmdsecs:
+        existing_data_object_pids = helpers.get_handle_pids(dmdsec, ns)
+        if existing_data_object_pids:
+            data_object_pid = existing_data_object_pids[0]
+            data_object_record = HandleRecord('data_object', data_object_pid, None, update=True) if refresh else None
+        else:
+            data_object_record = new_record('data_object', dmdsec)
+            data_object_pid = data_object_record.pid
+        data_object_entries.append((dmdsec, data_object_pid, data_object_record))
+    file_data_object_pids = [pid for _, pid, _ in data_object_entries]
+    data_object_records = [record for _, _, record in data_object_entries if record]
+
+    version_record = None
+    if version_pid:
+        # The version is already registered, only its list of DataObjects
+        # has to be updated once the new DataObject is registered
+        if version_updates is not None:
+            # The batch fetches the version once and merges the DataObjects
+            # of all its files, here only the ones in the METS are known.
+            # The update is always deferred: the hasParts of the METS may
+            # have been written by a run whose version update was lost, the
+            # batch compares with the version record on the server.
+            data_object_pids = [str(xp.first(xp.DC_IDENTIFIER, el).text).strip()
+                                for el in xp.HANDLE_HAS_PARTS(version_dmdsec)]
+        else:
+            data_object_pids = helpers.getDAtaObejctPidsFrom_Versionhandle(version_pid, connection_details['url'],
+                                                                           connection_details['user'],
+                                                                           connection_details['password'])
+        missing_pids = [pid for pid in file_data_object_pids if pid not in data_object_pids]
+        if missing_pids or refresh or version_updates is not None:
+            data_object_pids.extend(missing_pids)
+            version_payload = mets2handle.build_version_json(root, ns, pid_works=cinematographic_work_pids,
+                                                             dataobject_pid=data_object_pids,
+                                                             version_pid=version_pid)
+            if version_updates is not None:
+                version_updates.append({'version': version_pid, 'data_objects': file_data_object_pids,
+                                        'payload': version_payload})
+            else:
+                version_record = HandleRecord('version', version_pid, version_payload,
+                                              depends_on=data_object_records, update=True)
+    else:
+        data_object_pids = list(file_data_object_pids)
+        version_record = new_record('version', version_dmdsec, depends_on=work_records)
+        version_pid = version_record.pid
+        version_record.payload = mets2handle.build_version_json(root, ns, pid_works=cinematographic_work_pids,
+                                                                dataobject_pid=data_object_pids,
+                                                                version_pid=version_pid)
+        # The dataobjects only depend on the version, so they are
+        # registered concurrently
+        for data_object_record in data_object_records:
+            data_object_record.depends_on.append(version_record)
+    if version_record:
+        version_record.dump_name = 'version.json'
+        records.append(version_record)
+
+    for number, (dmdsec, data_object_pid, data_object_record) in enumerate(data_object_entries):
+        if not data_object_record:
+            continue
+        data_object_record.payload = mets2handle.build_data_object_json(dmdsec, ns, data_object_pid, version_pid)
+        data_object_record.dump_name = 'dataobject.json' if len(data_object_entries) == 1 else f'{number}dataobject.json'
+        records.append(data_object_record)
+
+    already_registered = False
+    if journal is not None:
+        dmdsecs_hash = content_hash(modified_dmdsecs)
+        already_registered = journal.is_registered(planned_pids, dmdsecs_hash)
+        journal.planned(planned_pids, dmdsecs_hash)
+    if already_registered:
+        helpers.logger.info('All records of %s were registered by an earlier run', filename)
+    else:
+        with metrics.span('register'):
+            register_records(records, connection_details, max_in_flight=max_in_flight,
+                             fingerprints=open_store(fingerprints), sinks=open_sinks(dumpjsons, ndjson))
+        if journal is not None:
+            journal.registered()
+
+    # writes the new PIDs into the mets file. All changes are made to the
+    # tree first, which is then written once at the end.
+    xml_tree_modified = False
+    for dmdsec, pid in new_work_identifiers:
+        insert_identifier(dmdsec, ns, pid)
+        xml_tree_modified = True
+
+    if not existing_version_pids:
+        for workPid in cinematographic_work_pids:
+            xp.first(xp.IS_VERSION_OF, version_dmdsec).addprevious(
+                helpers.buildisVersiontOfVersionXML(workPid))
+        insert_identifier(version_dmdsec, ns, version_pid)
+        xml_tree_modified = True
+
+    # Update list of referenced DataObjects
+    old_references = xp.HANDLE_HAS_PARTS(version_dmdsec)
+    recorded_data_objects = set([
+        str(xp.first(xp.DC_IDENTIFIER, el).text).strip()
+        for el in old_references])
+    if recorded_data_objects != set(data_object_pids):
+        insert_here = xp.first(xp.HAS_PART, version_dmdsec)
+        for pid in data_object_pids:
+            insert_here.addprevious(
+                helpers.buildHasPartInXML(pid))
+        for old_record in old_references:
+            old_record.getparent().remove(old_record)
+        xml_tree_modified = True
+
+    for dmdsec, data_object_pid, data_object_record in data_object_entries:
+        if data_object_record and not data_object_record.update:
+            insert_identifier(dmdsec, ns, data_object_pid)
+            xp.first(xp.IS_PART_OF, dmdsec).addprevious(
+                helpers.buildIsPartOfInXML(version_pid))
+            xml_tree_modified = True
+
+    if xml_tree_modified or out_file != filename:
+        with metrics.span('write'):
+            if mets_patch is not None:
+                write_patched(filename, out_file, mets_patch.splices(filename))
+            elif streaming:
+                write_streaming(filename, out_file, {dmdsec.get('ID'): dmdsec for dmdsec in modified_dmdsecs})
             else:
-                pid = existing_pid
-            if pid:
-                if True: # Just to keep diff output short
-                    version_pid = pid
-
-                    # writes new PID into the mets file
-                    for workPid in cinematographic_work_pids:
-                        dmdsec.find('.//ebucore:isVersionOf', ns).addprevious(
-                            helpers.buildisVersiontOfVersionXML(workPid))
-                    new_ident = mets2handle.create_identifier_element(pid)
-
-                    new_ident.text = '\n              '
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).addprevious(new_ident)
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).tail = '\n\n            '
-                    xml_tree_modified = True
-
-            # Update list of referenced DataObjects
-            old_references = dmdsec.xpath('.//ebucore:hasPart[@formatLabel="hdl.handle.net"]', namespaces=ns)
-            recorded_data_objects = set([
-                str(el.find('.//dc:identifier', ns).text).strip()
-                for el in old_references])
-            if recorded_data_objects != set(data_object_pids):
-                insert_here = dmdsec.find('.//ebucore:hasPart', ns)
-                for pid in data_object_pids:
-                    insert_here.addprevious(
-                        helpers.buildHasPartInXML(pid))
-                if old_references:
-                    parent_element = data_object_references[0].getparent()
-                    for old_record in data_object_references:
-                        parent_element.remove(old_record)
-                xml_tree_modified = True
-
-            if xml_tree_modified:
-                if True: # Just to keep diff output short
-                    with open(out_file, 'wb') as metsfile:
-
-                        baum = ET.ElementTree(root)
-                        baum.write(metsfile, xml_declaration=True, encoding='utf-8')
-
-        # if the ID attribute of the dmdSec element is in the list of data_objects,
-        #  generate a new UUID to use as the PID for the work, generate the JSON for the dataobject,
-        # write it to a file, and send a PUT request to the handle server to create a new handle for the dataobject
-        if dmdsec.get('ID') in data_objects:
-
-            for identifier in dmdsec.findall('.//ebucore:identifier', ns):
-                # checks if work has a existing pid. if thats the case we add a 1 to the boolean array
-                if identifier.get('formatLabel') == "hdl.handle.net":
-                    boolean_list_if_pids_exists[2] = 1
-
-            if not boolean_list_if_pids_exists[2] and not boolean_list_if_pids_exists[1]:
-                # dataobject, work or version has never been seen by the handle -> new mets
-                json.dump(mets2handle.build_data_object_json(dmdsec, ns, data_object_pid, version_pid),
-                          open('dataobject.json', 'w', encoding='utf8'),
-                          indent=4, sort_keys=False, ensure_ascii=False)
-
-                payload_object = mets2handle.build_data_object_json(dmdsec, ns, data_object_pid, version_pid)
-                handle_data_object = [{'type': 'KIP', 'parsed_data': '21.T11148/b0047df54c686b9df82a'},
-                                       {'type': 'movie_db_dataobjects', 'parsed_data': payload_object}]
-                # Create PID
-                response_from_handle_server = requests.put(connection_details['url'] + data_object_uuid, auth=(
-                    connection_details['user'], connection_details['password']), headers=header,
-                                                           data=json.dumps(handle_data_object))
-
-                #print(response_from_handle_server.text, response_from_handle_server.status_code, 'Response to create-DataObject-request')
-                print('PID for data object: ', response_from_handle_server.json()['handle'])
-                response_from_handle_server.raise_for_status()
-                if True: # Just to keep diff output short
-                    respon = json.loads(response_from_handle_server.text)
-                    pid = respon['handle']
-                    data_object_pid = pid
-
-                    # writes new PID into the mets file
-                    new_ident = mets2handle.create_identifier_element(pid)
-
-                    new_ident.text = '\n              '
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).addprevious(new_ident)
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).tail = '\n\n            '
-
-                    dmdsec.find('.//ebucore:isPartOf', ns).addprevious(
-                        helpers.buildIsPartOfInXML(version_pid))
-
-                    new_tree = ET.tostring(xml_tree, pretty_print=True)
-                    with open(out_file, 'wb') as metsfile:
-                        baum = ET.ElementTree(root)
-                        baum.write(metsfile, xml_declaration=True, encoding='utf-8')
-
-            if boolean_list_if_pids_exists[0] and boolean_list_if_pids_exists[1] and not boolean_list_if_pids_exists[
-                2]:  # case fresh dataobject in mets where version and work have a pid already
-                json.dump(mets2handle.build_data_object_json(dmdsec, ns, data_object_pid, version_pid),
-                          open('dataobject.json', 'w', encoding='utf8'),
-                          indent=4, sort_keys=False, ensure_ascii=False)
-
-                payload_object = mets2handle.build_data_object_json(dmdsec, ns, data_object_pid, version_pid)
-                handle_data_object = [{'type': 'KIP', 'parsed_data': '21.T11148/b0047df54c686b9df82a'},
-                                      {'type': 'movie_db_dataobjects', 'parsed_data': payload_object}]
-                # Create PID
-                response_from_handle_server = requests.put(connection_details['url'] + data_object_uuid, auth=(
-                    connection_details['user'], connection_details['password']), headers=header,
-                                                           data=json.dumps(handle_data_object))
-
-                #print(response_from_handle_server.text, response_from_handle_server.status_code, 'Response to create-DataObject-request')
-                print('PID for data object: ', response_from_handle_server.json()['handle'])
-                response_from_handle_server.raise_for_status()
-                if True: # Just to keep diff output short
-                    respon = json.loads(response_from_handle_server.text)
-                    pid = respon['handle']
-
-                    # writes new PID into the mets file
-                    new_ident = mets2handle.create_identifier_element(pid)
-
-                    new_ident.text = '\n              '
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).addprevious(new_ident)
-                    dmdsec.find('.//ebucore:coreMetadata', ns).find('ebucore:identifier', ns).tail = '\n\n            '
-
-                    dmdsec.find('.//ebucore:isPartOf', ns).addprevious(
-                        helpers.buildIsPartOfInXML(version_pid))
-
-                    new_tree = ET.tostring(xml_tree, pretty_print=True)
-                    with open(out_file, 'wb') as metsfile:
-                        baum = ET.ElementTree(root)
-                        baum.write(metsfile, xml_declaration=True, encoding='utf-8')
-
-                payload_version = mets2handle.build_version_json(root, ns, pid_works=cinematographic_work_pids,
-                                                                 dataobject_pid=data_object_pids, version_pid=version_pid)
-                print(payload_version)
-                print(version_uuid)
-                response_from_handle_server = requests.put(connection_details['url'] + version_uuid, auth=(
-                    connection_details['user'], connection_details['password']), headers=header,
-                                                           data=json.dumps(payload_version))
-
-                print(response_from_handle_server.text, response_from_handle_server.status_code, 'Response to update-Version-request')
-
-                print(response_from_handle_server)
-                response_from_handle_server.raise_for_status()
+                helpers.write_mets(xml_tree, out_file)
     return True
 
 
+def work_payload(dmdsec, ns: dict[str, str], pid: str):
+    """
+    Returns the callable that builds the payload of a work record from its
+    dmdSec, see HandleRecord.
+    """
+    def build():
+        return mets2handle.build_work_json(dmdsec, ns, pid_work=pid, original_duration=False,
+                                           related_identifier=False, original_format=False)
+    return build
+
+
+def insert_identifier(dmdsec, ns: dict[str, str], pid: str):
+    """
+    Writes a new PID into the coreMetadata of a dmdSec, in front of the
+    existing identifiers.
+    """
+    new_ident = mets2handle.create_identifier_element(pid)
+
+    new_ident.text = '\n              '
+    core_metadata = xp.first(xp.CORE_METADATA, dmdsec)
+    xp.first(xp.CORE_IDENTIFIER, core_metadata).addprevious(new_ident)
+    new_ident.tail = '\n\n            '
+
+
+# Subcommands of metstohandle and the modules implementing them, everything
+# else is treated as a METS file. The modules are imported when used.
+SUBCOMMANDS = {
+    'batch': 'mets2handle.batch',
+    'local-server': 'mets2handle.local_server',
+    'snapshot': 'mets2handle.snapshot',
+    'synthetic': 'mets2handle.synthetic',
+    'watch': 'mets2handle.watch',
+}
+
+# Log file of the command line tool, the package itself does not configure logging
+DEFAULT_LOG_FILE = '/tmp/myapp.log'
+
+
+def configure_logging():
+    logging.basicConfig(filename=os.environ.get('METS2HANDLE_LOG_FILE', DEFAULT_LOG_FILE), level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
+
 def cli_entry_point():
+    configure_logging()
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        return importlib.import_module(SUBCOMMANDS[sys.argv[1]]).main(sys.argv[2:])
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '-c', '--credentials', metavar='<credentials_file>',
@@ -416,9 +413,34 @@ def cli_entry_point():
     parser.add_argument(
         '-d', '--dump-jsons', action='store_true',
         help='Write generated json to stdout in, then send request.')
+    parser.add_argument(
+        '--fingerprints', metavar='<fingerprint_store>',
+        help='SQLite store of the fingerprints of the records sent before. Records'
+        ' that have not changed are not sent again.')
+    parser.add_argument(
+        '-j', '--max-in-flight', metavar='<n>', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+        help='Maximum number of concurrent requests to the handle server (default: %(default)s).')
+    parser.add_argument(
+        '--metrics', metavar='<metrics_file>',
+        help='Write timings and counters of the run to this file, in the Prometheus'
+        ' text format if it ends with .prom and as JSON otherwise.')
+    parser.add_argument(
+        '--ndjson', metavar='<ndjson_file>',
+        help='Append the payloads of all records sent to this file, one JSON object per line.')
     parser.add_argument(
         '-o', '--out-file', metavar='<modified_mets>',
-        help='Do not modify METS in place but write to this file instead.')
+        help='Do not modify METS in place but write to this file instead. It is'
+        ' compressed if it ends with .gz or .zst.')
+    parser.add_argument(
+        '--patch', action='store_true',
+        help='Splice the new elements into a copy of the original METS instead of'
+        ' serializing it again. All other bytes are kept as they are.')
+    parser.add_argument(
+        '--refresh', action='store_true',
+        help='Update the records that are already registered from the METS, too.')
+    parser.add_argument(
+        '-s', '--streaming', action='store_true',
+        help='Parse and write the METS as a stream, for very large files.')
     parser.add_argument(
         '-v', '--version-pid', metavar='<known_handle_for_version>',
         help='Instead of registering new version handle, use this one.')
@@ -429,10 +451,19 @@ def cli_entry_point():
         'mets_file', metavar='<mets_file>',
         help='METS file containing dmdSecs for DataObject, Version, and Work.')
     args = parser.parse_args()
-    return m2h(
+    result = m2h(
         args.mets_file,
         out_file=args.out_file,
         work_pid=args.work_pid,
         version_pid=args.version_pid,
         credentials=args.credentials,
-        dumpjsons=args.dump_jsons)
+        dumpjsons=args.dump_jsons,
+        max_in_flight=args.max_in_flight,
+        streaming=args.streaming,
+        fingerprints=args.fingerprints,
+        refresh=args.refresh,
+        ndjson=args.ndjson,
+        patch=args.patch)
+    if args.metrics:
+        metrics.export(args.metrics)
+    return result
@@ -0,0 +1,257 @@
+'''
+This module implements the patch mode for writing METS files.
+
+m2h only adds a few elements to the dmdSecs (identifiers, isVersionOf,
+isPartOf, hasPart) and may drop outdated hasPart elements. Instead of
+serializing the whole tree, the patch mode copies the original file byte
+by byte and splices the changes in at their positions, so all untouched
+bytes are kept exactly as they were:
+
+1. MetsPatch is created before the tree is modified and remembers the
+   original elements of the dmdSecs that may change.
+2. After the modifications, MetsPatch.splices() compares the dmdSecs with
+   the remembered elements. New elements are serialized on their own and
+   inserted in front of the original element that follows them, removed
+   elements are cut out together with their tail. The byte positions of
+   the original elements are found by a pass over the file with expat.
+3. write_patched() copies the file to the output in chunks and applies the
+   splices in between.
+
+The patch mode works with fully parsed trees as well as with the skeleton
+of the streaming mode, and with compressed files, which are read as
+streams (see mets_io.py). Files that are not encoded in UTF-8 are refused
+by m2h before anything is registered.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import mmap
+import re
+from xml.parsers import expat
+
+from lxml import etree as ET
+
+from mets2handle import helpers, mets_io
+
+CHUNK_SIZE = 1024 * 1024
+NAMESPACE_DECLARATION = re.compile(rb'\s+xmlns(?::([\w.-]+))?="([^"]*)"')
+ENCODING_DECLARATION = re.compile(rb'^(?:\xef\xbb\xbf)?<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)["\']')
+
+
+def is_utf8(source: str) -> bool:
+    with mets_io.open_input(source) as f:
+        head = f.read(200)
+    match = ENCODING_DECLARATION.match(head)
+    return match is None or match.group(1).decode('ascii').lower() in ('utf-8', 'utf8')
+
+
+def _local_name(name: str) -> str:
+    return name.rsplit(':', 1)[-1]
+
+
+def element_positions(source: str, dmdids: set) -> dict:
+    """
+    Byte positions of all elements in the dmdSecs with the given IDs, by
+    (dmdSec ID, number of the element in document order within its dmdSec),
+    as [start, end, tail_end, empty]: the start of the start tag, the end
+    reported by expat (the start of the end tag, or the end of an empty
+    element tag), the end of the tail (the start of the next markup) and
+    whether the element is an empty element tag.
+    """
+    parser = expat.ParserCreate()
+    positions = {}
+    # ID of the dmdSec that is read and the numbers of its open elements
+    current = None
+    open_elements = []
+    count = 0
+    # Elements whose tail ends at the next markup, with the bytes at their end
+    ended = []
+    # The bytes parsed last, starting at window_start in the file
+    window = b''
+    window_start = 0
+
+    def peek(position: int, size: int):
+        offset = position - window_start
+        if offset < 0 or offset + size > len(window):
+            return None
+        return bytes(window[offset:offset + size])
+
+    def markup():
+        index = parser.CurrentByteIndex
+        for key, end_bytes in ended:
+            position = positions[key]
+            position[2] = index
+            # An end tag starts at the end position and is followed by more
+            # bytes, after an empty element tag the next markup may start there
+            position[3] = end_bytes != b'</' or index == position[1]
+        ended.clear()
+
+    def start(name, attributes):
+        nonlocal current, count
+        if ended:
+            markup()
+        if current is None:
+            if _local_name(name) != 'dmdSec' or attributes.get('ID') not in dmdids:
+                return
+            current = attributes['ID']
+            count = 0
+        positions[(current, count)] = [parser.CurrentByteIndex, None, None, False]
+        open_elements.append(count)
+        count += 1
+
+    def end(name):
+        nonlocal current
+        if ended:
+            markup()
+        if current is None:
+            return
+        key = (current, open_elements.pop())
+        positions[key][1] = parser.CurrentByteIndex
+        ended.append((key, peek(parser.CurrentByteIndex, 2)))
+        if not open_elements:
+            current = None
+
+    def other(*args):
+        if ended:
+            markup()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CommentHandler = other
+    parser.ProcessingInstructionHandler = other
+    parser.StartCdataSectionHandler = other
+    with mets_io.open_input(source) as f:
+        if isinstance(f, mmap.mmap):
+            # Parsed straight from the memory map
+            window = f
+            parser.Parse(f, True)
+        else:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                # Tokens may start in the chunk before
+                previous = window[-CHUNK_SIZE:]
+                window_start += len(window) - len(previous)
+                window = previous + chunk
+                parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+    return positions
+
+
+def _elements(dmdsec):
+    return dmdsec.iter(ET.Element)
+
+
+class MetsPatch:
+    """
+    Remembers the original elements of dmdsecs, so that the changes made to
+    them can be written as splices into the original file.
+    """
+
+    def __init__(self, dmdsecs):
+        self.dmdsecs = list(dmdsecs)
+        # Holding the elements keeps their proxies and thus their identity
+        self.original = {}
+        for dmdsec in self.dmdsecs:
+            for number, elem in enumerate(_elements(dmdsec)):
+                self.original[elem] = (dmdsec.get('ID'), number)
+
+    def _fragment(self, elem) -> bytes:
+        """
+        elem and its tail as they are serialized in the document: without
+        the namespace declarations that are in scope at its position.
+        """
+        data = ET.tostring(elem, encoding='utf-8', with_tail=True)
+        start_tag_end = data.index(b'>')
+        in_scope = elem.getparent().nsmap
+
+        def declaration(match):
+            prefix = match.group(1).decode('utf8') if match.group(1) else None
+            return b'' if in_scope.get(prefix) == match.group(2).decode('utf8') else match.group(0)
+
+        return NAMESPACE_DECLARATION.sub(declaration, data[:start_tag_end]) + data[start_tag_end:]
+
+    def _is_original(self, elem) -> bool:
+        return elem in self.original
+
+    def splices(self, source: str) -> list[tuple[int, int, bytes]]:
+        """
+        The changes of the dmdSecs as (start, end, data) splices into the
+        file in source, sorted by position. The bytes from start to end are
+        replaced by data.
+        """
+        # Insertions as (original element they precede or whose end tag
+        # they precede, before_end, new element), in document order
+        insertions = []
+        present = set()
+        for dmdsec in self.dmdsecs:
+            for elem in _elements(dmdsec):
+                if self._is_original(elem):
+                    present.add(elem)
+                    continue
+                parent = elem.getparent()
+                if not self._is_original(parent):
+                    # Part of an inserted element
+                    continue
+                follower = elem.getnext()
+                while follower is not None and not (isinstance(follower.tag, str) and self._is_original(follower)):
+                    follower = follower.getnext()
+                if follower is not None:
+                    insertions.append((follower, False, elem))
+                else:
+                    insertions.append((parent, True, elem))
+        removed = [elem for elem in self.original if elem not in present]
+        if not insertions and not removed:
+            return []
+
+        positions = element_positions(source, {dmdsec.get('ID') for dmdsec in self.dmdsecs})
+        splices = []
+        for order, (anchor, before_end, elem) in enumerate(insertions):
+            start, end, _, empty = positions[self.original[anchor]]
+            if before_end and empty:
+                raise ValueError(f'Cannot insert into the empty element {anchor.tag} of {source}')
+            offset = end if before_end else start
+            splices.append((offset, offset, order, self._fragment(elem)))
+        for elem in removed:
+            if self._is_original(elem.getparent()) and elem.getparent() not in present:
+                # Removed together with its parent
+                continue
+            # The tail is removed with the element
+            start, _, tail_end, _ = positions[self.original[elem]]
+            splices.append((start, tail_end, -1, b''))
+        splices.sort(key=lambda splice: splice[:3])
+        return [(start, end, fragment) for start, end, _, fragment in splices]
+
+
+def _copy(src, out, size: int = None):
+    """
+    Copies size bytes, or all that are left, from src to out. With out None
+    they are skipped.
+    """
+    while size is None or size > 0:
+        chunk = src.read(CHUNK_SIZE if size is None else min(CHUNK_SIZE, size))
+        if not chunk:
+            break
+        if out is not None:
+            out.write(chunk)
+        if size is not None:
+            size -= len(chunk)
+
+
+def write_patched(source: str, out_file: str, splices: list):
+    """
+    Copies source to out_file and applies the splices on the way. out_file
+    may be the same file as source. source is read once from start to end,
+    so it may be compressed.
+    """
+    with mets_io.open_input(source) as src, helpers.atomic_output(out_file) as out:
+        position = 0
+        for start, end, fragment in splices:
+            _copy(src, out, start - position)
+            out.write(fragment)
+            _copy(src, None, end - start)
+            position = end
+        _copy(src, out)
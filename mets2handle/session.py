@@ -0,0 +1,151 @@
+'''
+This module implements the HTTP session that is used for all requests to the
+handle server.
+
+All requests share one requests.Session per process, so connections are
+pooled and kept alive between the records of a METS file and between METS
+files. Idempotent requests (GET and PUT) are retried with exponential
+backoff on connection errors and on the status codes in RETRY_STATUS, in
+which case a Retry-After header sent by the server is respected. Every
+request has a timeout.
+
+The defaults can be changed with configure() or by the environment variables
+METS2HANDLE_HTTP_TIMEOUT (seconds), METS2HANDLE_HTTP_RETRIES,
+METS2HANDLE_HTTP_BACKOFF (seconds) and METS2HANDLE_HTTP_POOLSIZE. Without
+a pool size set there, the pool grows to the number of concurrent requests
+of the registration engine (-j), so no connection is dropped and opened
+again while they are in flight.
+
+requests is only imported when the first session is created, so importing
+the package stays cheap for code that does not send requests.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from mets2handle.metrics import metrics
+
+if TYPE_CHECKING:
+    import requests
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset({'GET', 'PUT', 'HEAD', 'OPTIONS'})
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def _from_env(name: str, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class HandleSession:
+    """
+    Pooled keep-alive session with timeouts and retries.
+    """
+
+    def __init__(self, timeout: float = None, retries: int = None, backoff_factor: float = None,
+                 pool_maxsize: int = None):
+        if timeout is None:
+            timeout = _from_env('METS2HANDLE_HTTP_TIMEOUT', 60)
+        if retries is None:
+            retries = _from_env('METS2HANDLE_HTTP_RETRIES', 5, int)
+        if backoff_factor is None:
+            backoff_factor = _from_env('METS2HANDLE_HTTP_BACKOFF', 0.5)
+        if pool_maxsize is None:
+            pool_maxsize = _from_env('METS2HANDLE_HTTP_POOLSIZE', DEFAULT_POOL_MAXSIZE, int)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS,
+                      allowed_methods=RETRY_METHODS, respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> 'requests.Response':
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            metrics.observe('http_request_seconds', time.perf_counter() - start, method=method, status=status)
+
+    def get(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('PUT', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_settings = {}
+
+
+def configure(**settings):
+    """
+    Sets the arguments for the HandleSession of this process and drops the
+    current one, see HandleSession for the possible arguments.
+    """
+    global _session
+    with _lock:
+        _settings.clear()
+        _settings.update(settings)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def _pool_maxsize(concurrency: int = None) -> int:
+    """
+    The size of the connection pool for concurrency requests in flight. A
+    size set by configure() or METS2HANDLE_HTTP_POOLSIZE takes precedence.
+    """
+    if 'pool_maxsize' in _settings:
+        return _settings['pool_maxsize']
+    if os.environ.get('METS2HANDLE_HTTP_POOLSIZE'):
+        return _from_env('METS2HANDLE_HTTP_POOLSIZE', DEFAULT_POOL_MAXSIZE, int)
+    return max(DEFAULT_POOL_MAXSIZE, concurrency or 0)
+
+
+def get_session(concurrency: int = None) -> HandleSession:
+    """
+    Returns the HandleSession of this process. A new one is created after a
+    fork, since pooled connections must not be shared between processes,
+    and when concurrency, the number of requests the caller keeps in
+    flight, does not fit into the connection pool.
+    """
+    global _session, _session_pid
+    with _lock:
+        pool_maxsize = _pool_maxsize(concurrency)
+        if (_session is None or _session_pid != os.getpid()
+                or _session.pool_maxsize < pool_maxsize):
+            # The old session is not closed, other threads may still use it
+            _session = HandleSession(**dict(_settings, pool_maxsize=pool_maxsize))
+            _session_pid = os.getpid()
+        return _session
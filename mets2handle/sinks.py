@@ -0,0 +1,90 @@
+'''
+This module implements the sinks the payloads of the records are dumped to.
+
+The engine encodes the payload of every record once to UTF-8 JSON and
+hands the same bytes to the request body and to every sink, see
+HandleRecord.encode() in engine.py.
+
+* DirectorySink writes one file per record, named by m2h (e.g.
+  0handle_work.json, version.json, dataobject.json), indented as the -d
+  option always did. These files are meant to be read, so the payload is
+  encoded again for them.
+* NdjsonSink appends one line per record to a single file, which can be
+  shared by all worker processes of a batch:
+
+      {"pid": "21.T11998/...", "kind": "work", "update": false, "payload": {...}}
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import json
+import os
+import threading
+
+from mets2handle.metrics import metrics
+
+
+class DirectorySink:
+    """
+    Writes the payload of every record with a dump_name to that file in
+    directory.
+    """
+
+    def __init__(self, directory: str = '.'):
+        self.directory = directory
+
+    def write(self, record, data: bytes):
+        if not record.dump_name:
+            return
+        with open(os.path.join(self.directory, record.dump_name), 'w', encoding='utf8') as f:
+            json.dump(record.build_payload(), f, indent=4, sort_keys=False, ensure_ascii=False)
+
+
+class NdjsonSink:
+    """
+    Appends the payload of every record as one line to the file in path.
+    Lines are written with a single write to a file opened with O_APPEND,
+    so several processes can append to the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+
+    def write(self, record, data: bytes):
+        line = (b'{"pid": ' + json.dumps(record.pid).encode('utf8')
+                + b', "kind": ' + json.dumps(record.kind).encode('utf8')
+                + b', "update": ' + (b'true' if record.update else b'false')
+                + b', "payload": ' + data + b'}\n')
+        with self._lock:
+            os.write(self._fd, line)
+        metrics.inc('ndjson_bytes_written', len(line))
+
+    def close(self):
+        os.close(self._fd)
+
+
+_ndjson_sinks = {}
+
+
+def open_ndjson_sink(path: str) -> NdjsonSink:
+    """
+    The NdjsonSink appending to path, one per path and process.
+    """
+    key = (os.path.abspath(path), os.getpid())
+    if key not in _ndjson_sinks:
+        _ndjson_sinks[key] = NdjsonSink(path)
+    return _ndjson_sinks[key]
+
+
+def open_sinks(dumpjsons: bool = False, ndjson: str = None) -> list:
+    sinks = []
+    if dumpjsons:
+        sinks.append(DirectorySink())
+    if ndjson:
+        sinks.append(open_ndjson_sink(ndjson))
+    return sinks
@@ -0,0 +1,98 @@
+'''
+This module implements a precompiled snapshot of the reference data that is
+needed to map a METS file: the vocab_map, the enumerations of the DTR types
+and the country name indexes of countries.py.
+
+The snapshot is compiled once with "metstohandle snapshot" and stored as a
+single pickle file. It is loaded on first use of the reference data by
+helpers.load_reference_data(), or before the first file by
+helpers.warm_up() in batch and watch mode, so neither the DTR nor the
+pycountry databases have to be accessed if it exists. Its enumerations are
+revalidated against the DTR once they are older than the time to live of
+the enum cache. The path of the snapshot can be set with the environment
+variable METS2HANDLE_SNAPSHOT. A snapshot with a different format version
+than SNAPSHOT_FORMAT is ignored.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import argparse
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 2
+
+
+def default_snapshot_path() -> str:
+    if os.environ.get('METS2HANDLE_SNAPSHOT'):
+        return os.environ['METS2HANDLE_SNAPSHOT']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'mets2handle', 'snapshot.pickle')
+
+
+def compile_snapshot(path: str = None, datatypes=None) -> str:
+    """
+    Collects all reference data and writes the snapshot to path.
+    """
+    from mets2handle import helpers
+    from mets2handle.countries import build_tables
+    from mets2handle.enum_cache import EnumCache, enum_cache
+
+    if path is None:
+        path = default_snapshot_path()
+    countries, subdivisions = build_tables()
+    snapshot = {'format': SNAPSHOT_FORMAT,
+                'created': time.time(),
+                'vocab_map': helpers.read_vocab_map(),
+                # Not the memory cache, it may hold the enums of an older snapshot
+                'enums': EnumCache(cache_dir=enum_cache.cache_dir, ttl=enum_cache.ttl).prefetch(datatypes),
+                'countries': countries,
+                'subdivisions': subdivisions}
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_snapshot(path: str = None) -> dict:
+    """
+    Returns the snapshot stored in path or None if there is no usable one.
+    """
+    if path is None:
+        path = default_snapshot_path()
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError) as error:
+        logger.warning('Could not read snapshot %s (%s)', path, error)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        logger.warning('Ignoring snapshot %s with incompatible format', path)
+        return None
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='metstohandle snapshot',
+        description='Compile vocab_map, DTR enumerations and country tables into a snapshot file.')
+    parser.add_argument(
+        '-o', '--out-file', metavar='<snapshot_file>', default=default_snapshot_path(),
+        help='Where to write the snapshot (default: %(default)s).')
+    args = parser.parse_args(argv)
+    path = compile_snapshot(args.out_file)
+    print('Snapshot written to', path)
+    return 0
@@ -0,0 +1,154 @@
+'''
+This module implements the streaming mode for very large METS files.
+
+Only the structMap and the dmdSecs are needed to register the PIDs, while
+most of the size of a METS package is in the fileSec and the amdSec
+(technical metadata). In streaming mode the METS file is read twice with
+lxml.etree.iterparse and never held in memory as a whole:
+
+1. parse_skeleton() returns a tree that only contains the dmdSecs and the
+   structMap. Everything else is dropped while it is parsed.
+2. write_streaming() copies the METS element by element to the output file
+   and writes the (modified) dmdSecs of the skeleton in place of the
+   original ones.
+
+The output is equivalent to the one written from a fully parsed tree, but
+empty elements are written with a start and an end tag and namespace
+declarations are only kept where they introduce a new prefix. Compressed
+METS files are read and written as streams as well, see mets_io.py.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+from lxml import etree as ET
+
+from mets2handle import helpers, mets_io
+
+METS_NS = 'http://www.loc.gov/METS/'
+DMDSEC = '{%s}dmdSec' % METS_NS
+# Top level sections of the METS that are kept by parse_skeleton
+SKELETON_SECTIONS = frozenset({DMDSEC, '{%s}structMap' % METS_NS})
+
+
+def _iterparse(source, events):
+    with mets_io.open_input(source) as f:
+        yield from ET.iterparse(f, events=events, remove_comments=False, huge_tree=True)
+
+
+def parse_skeleton(source) -> ET._ElementTree:
+    """
+    Parses the METS in source, keeping only the dmdSecs and the structMap
+    below the root element. Memory use does not depend on the size of the
+    other sections.
+    """
+    root = None
+    depth = 0
+    # The top level section that is currently parsed and whether it is kept
+    keep_section = False
+    for event, elem in _iterparse(source, ('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                root = elem
+            elif depth == 2:
+                keep_section = elem.tag in SKELETON_SECTIONS
+            continue
+        if depth == 2 and not keep_section:
+            root.remove(elem)
+        elif depth > 2 and not keep_section:
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        depth -= 1
+    return ET.ElementTree(root)
+
+
+def _new_namespaces(elem, parent) -> dict:
+    if parent is None:
+        return dict(elem.nsmap)
+    parent_nsmap = parent.nsmap
+    return {prefix: uri for prefix, uri in elem.nsmap.items() if parent_nsmap.get(prefix) != uri}
+
+
+def _write_leaf(xf, node):
+    if node.tag is ET.Comment:
+        xf.write(ET.Comment(node.text))
+    elif node.tag is ET.ProcessingInstruction:
+        xf.write(ET.ProcessingInstruction(node.target, node.text))
+
+
+def _write_element(xf, elem, parent=None):
+    """
+    Writes elem and its descendants, without the tail of elem.
+    """
+    if not isinstance(elem.tag, str):
+        _write_leaf(xf, elem)
+        return
+    with xf.element(elem.tag, dict(elem.attrib), nsmap=_new_namespaces(elem, parent) or None):
+        if elem.text:
+            xf.write(elem.text)
+        for child in elem:
+            _write_element(xf, child, elem)
+            if child.tail:
+                xf.write(child.tail)
+
+
+def write_streaming(source, out_file: str, replacements: dict):
+    """
+    Copies the METS in source to out_file without loading it as a whole.
+    dmdSecs whose ID is a key of replacements are replaced by the given
+    element. out_file may be the same file as source.
+    """
+    with helpers.atomic_output(out_file) as metsfile, ET.xmlfile(metsfile, encoding='utf-8') as xf:
+        xf.write_declaration()
+        # Open elements as [element, context, text_written]
+        stack = []
+        # Node whose tail has not been written yet
+        pending = None
+        # Original element that is replaced and whose content is skipped
+        skipping = None
+
+        def flush():
+            nonlocal pending
+            if stack and not stack[-1][2]:
+                if stack[-1][0].text:
+                    xf.write(stack[-1][0].text)
+                stack[-1][2] = True
+            if pending is not None:
+                parent = pending.getparent()
+                if stack and pending.tail:
+                    xf.write(pending.tail)
+                if parent is not None:
+                    parent.remove(pending)
+                pending = None
+
+        for event, node in _iterparse(source, ('start', 'end', 'comment', 'pi')):
+            if skipping is not None:
+                if event == 'end' and node is skipping:
+                    pending = node
+                    skipping = None
+                elif event == 'end':
+                    node.clear(keep_tail=True)
+                continue
+            if event in ('comment', 'pi'):
+                flush()
+                _write_leaf(xf, node)
+                pending = node
+            elif event == 'start':
+                flush()
+                parent = stack[-1][0] if stack else None
+                if node.tag == DMDSEC and node.get('ID') in replacements:
+                    _write_element(xf, replacements[node.get('ID')], parent)
+                    skipping = node
+                    continue
+                context = xf.element(node.tag, dict(node.attrib),
+                                     nsmap=_new_namespaces(node, parent) or None)
+                context.__enter__()
+                stack.append([node, context, False])
+            else:
+                flush()
+                stack.pop()[1].__exit__(None, None, None)
+                pending = node
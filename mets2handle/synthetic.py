@@ -0,0 +1,235 @@
+'''
+This module implements a generator for synthetic METS files in the form
+delivered by the Deutsche Kinemathek: a structMap with cinematographic
+works, one version and its data objects and an ebucore dmdSec for each of
+them.
+
+The sizes that drive the cost of a registration can be tuned: the number
+of works and data objects per file, of contributors, titles and locations
+per work and the size of the technical metadata (amdSec) that is copied
+but not read. With the same seed the same files are generated.
+
+Usage:
+    metstohandle synthetic -o <directory> -n 100 --works 2 --contributors 50
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import argparse
+import os
+import random
+from xml.sax.saxutils import escape
+
+ROLES = ('Director', 'cast', 'Producer', 'Screenplay', 'cast', 'cast')
+TITLE_TYPES = ('originalTitle', 'workingTitle', 'distributionTitle')
+COUNTRIES = ('Deutschland', 'BRD', 'DDR', 'Weimarer Republik', 'Frankreich', 'Österreich', 'USA',
+             'Schweiz', 'Italien', 'Sowjetunion')
+GENRES = ('fiction', 'Documentary', 'Fiction')
+FAMILY_NAMES = ('Siodmak', 'Ulmer', 'Wilder', 'Zinnemann', 'Borchert', 'von Waltershausen', 'Schüfftan',
+                'Lang', 'Murnau', 'Riefenstahl', 'Dudow', 'Wolf')
+GIVEN_NAMES = ('Robert', 'Edgar', 'Billy', 'Fred', 'Brigitte', 'Wolfgang', 'Eugen', 'Fritz', 'Friedrich',
+               'Leni', 'Slatan', 'Konrad')
+
+HEADER = ('<?xml version=\'1.0\' encoding=\'utf-8\'?>\n'
+          '<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink"'
+          ' xmlns:ebucore="urn:ebu:metadata-schema:ebucore" xmlns:dc="http://purl.org/dc/elements/1.1/">\n')
+
+DMDSEC = '''  <mets:dmdSec ID="{id}">
+    <mets:mdWrap MDTYPE="OTHER">
+      <mets:xmlData>
+        <ebucore:ebuCoreMain dateLastModified="2023-05-01Z" timeLastModified="10:00:00Z">
+          <ebucore:coreMetadata>
+{content}
+            <ebucore:metadataProvider>
+              <ebucore:organisationDetails organisationId="https://www.deutsche-kinemathek.de">
+                <ebucore:organisationName>Deutsche Kinemathek</ebucore:organisationName>
+              </ebucore:organisationDetails>
+            </ebucore:metadataProvider>
+          </ebucore:coreMetadata>
+        </ebucore:ebuCoreMain>
+      </mets:xmlData>
+    </mets:mdWrap>
+  </mets:dmdSec>
+'''
+
+TITLE = '''            <ebucore:title typeLabel="{type}">
+              <dc:title>{title}</dc:title>
+            </ebucore:title>'''
+
+CONTRIBUTOR = '''            <ebucore:contributor>
+              <ebucore:contactDetails contactId="http://d-nb.info/gnd/{gnd}">
+                <ebucore:name>{name}</ebucore:name>
+              </ebucore:contactDetails>
+              <ebucore:role typeLabel="{role}"/>
+            </ebucore:contributor>'''
+
+LOCAL_IDENTIFIER = '''            <ebucore:identifier formatLabel="local">
+              <dc:identifier>{id}</dc:identifier>
+            </ebucore:identifier>'''
+
+RELATION = '''            <ebucore:{relation}>
+              <ebucore:relationIdentifier formatLabel="local">
+                <dc:identifier>{id}</dc:identifier>
+              </ebucore:relationIdentifier>
+            </ebucore:{relation}>'''
+
+LOCATION = '''                <ebucore:location>
+                  <ebucore:name>{name}</ebucore:name>
+                </ebucore:location>'''
+
+
+def _work(rng: random.Random, number: int, contributors: int, titles: int, locations: int) -> str:
+    title = f'Menschen am Sonntag {number}'
+    content = [TITLE.format(type=TITLE_TYPES[i % len(TITLE_TYPES)], title=f'{title} ({i})' if i else title)
+               for i in range(titles)]
+    content.append('''            <ebucore:alternativeTitle typeLabel="series">
+              <dc:title>Serie</dc:title>
+            </ebucore:alternativeTitle>''')
+    for i in range(contributors):
+        name = f'{rng.choice(FAMILY_NAMES)}, {rng.choice(GIVEN_NAMES)}'
+        content.append(CONTRIBUTOR.format(gnd=rng.randrange(10 ** 8, 10 ** 9), name=escape(name),
+                                          role=ROLES[i % len(ROLES)]))
+    start_year = rng.randrange(1920, 1990)
+    content.append(LOCAL_IDENTIFIER.format(id=f'W{number}'))
+    content.append(f'''            <ebucore:type>
+              <ebucore:genre typeLabel="{rng.choice(GENRES)}"/>
+            </ebucore:type>
+            <ebucore:date>
+              <ebucore:created startYear="{start_year}" endYear="{start_year + 1}"/>
+            </ebucore:date>
+            <ebucore:coverage>
+              <ebucore:spatial>
+{chr(10).join(LOCATION.format(name=rng.choice(COUNTRIES)) for _ in range(locations))}
+              </ebucore:spatial>
+            </ebucore:coverage>
+            <ebucore:duration typeLabel="originalDuration">
+              <ebucore:normalPlayTime>PT{rng.randrange(1, 3)}H{rng.randrange(60)}M</ebucore:normalPlayTime>
+            </ebucore:duration>''')
+    return DMDSEC.format(id=f'DMD_WORK_{number}', content='\n'.join(content))
+
+
+def _version(works: int, data_objects: int) -> str:
+    content = [TITLE.format(type='originalTitle', title='Menschen am Sonntag'),
+               LOCAL_IDENTIFIER.format(id='V1'),
+               '''            <ebucore:type>
+              <ebucore:objectType typeLabel="Restoration"/>
+            </ebucore:type>
+            <ebucore:date>
+              <ebucore:released year="1930"/>
+              <ebucore:created startYear="1929"/>
+            </ebucore:date>''']
+    content += [RELATION.format(relation='isVersionOf', id=f'W{i}') for i in range(1, works + 1)]
+    content += [RELATION.format(relation='hasPart', id=f'D{i}') for i in range(1, data_objects + 1)]
+    return DMDSEC.format(id='DMD_VERSION_1', content='\n'.join(content))
+
+
+def _data_object(rng: random.Random, number: int) -> str:
+    content = [LOCAL_IDENTIFIER.format(id=f'D{number}'),
+               f'''            <ebucore:description typeLabel="specificCarrierType">
+              <dc:description>{rng.choice(('DCP', '35mm', 'ProRes'))}</dc:description>
+            </ebucore:description>
+            <ebucore:description typeLabel="comment">
+              <dc:description>Restored {rng.randrange(2000, 2023)}</dc:description>
+            </ebucore:description>
+            <ebucore:format>
+              <ebucore:fileSize unit="byte">{rng.randrange(10 ** 6, 10 ** 12)}</ebucore:fileSize>
+            </ebucore:format>''',
+               RELATION.format(relation='isPartOf', id='V1')]
+    return DMDSEC.format(id=f'DMD_DATAOBJECT_{number}', content='\n'.join(content))
+
+
+def _tech_md(rng: random.Random, size_kb: int) -> str:
+    lines = []
+    size = 0
+    while size < size_kb * 1024:
+        line = (f'        <tech frame="{len(lines)}" checksum="{rng.getrandbits(128):032x}">'
+                'lots of technical metadata</tech>\n')
+        lines.append(line)
+        size += len(line)
+    return ('  <mets:amdSec ID="AMD_1">\n    <mets:techMD ID="TECH_1">\n'
+            '      <mets:mdWrap MDTYPE="OTHER"><mets:xmlData>\n' + ''.join(lines) +
+            '      </mets:xmlData></mets:mdWrap>\n    </mets:techMD>\n  </mets:amdSec>\n')
+
+
+def synthetic_mets(works: int = 1, data_objects: int = 1, contributors: int = 10, titles: int = 2,
+                   locations: int = 1, tech_kb: int = 0, seed=None) -> bytes:
+    """
+    Returns a METS document with the given number of works and data objects
+    of one version, serialized as UTF-8.
+    """
+    rng = random.Random(seed)
+    parts = [HEADER]
+    parts += [_work(rng, i, contributors, titles, locations) for i in range(1, works + 1)]
+    parts.append(_version(works, data_objects))
+    parts += [_data_object(rng, i) for i in range(1, data_objects + 1)]
+    parts.append(_tech_md(rng, tech_kb))
+    parts.append('  <mets:fileSec>\n    <mets:fileGrp>\n')
+    parts += [f'      <mets:file ID="F{i}"><mets:FLocat xlink:href="file{i}.mkv"/></mets:file>\n'
+              for i in range(1, data_objects + 1)]
+    parts.append('    </mets:fileGrp>\n  </mets:fileSec>\n  <mets:structMap TYPE="logical">\n')
+    parts.append('    <mets:div TYPE="cinematographicWork" DMDID="DMD_WORK_1">\n'
+                 '      <mets:div TYPE="version" DMDID="DMD_VERSION_1">\n')
+    parts += [f'        <mets:div TYPE="dataObject" DMDID="DMD_DATAOBJECT_{i}"/>\n'
+              for i in range(1, data_objects + 1)]
+    parts.append('      </mets:div>\n    </mets:div>\n')
+    parts += [f'    <mets:div TYPE="cinematographicWork" DMDID="DMD_WORK_{i}"/>\n' for i in range(2, works + 1)]
+    parts.append('  </mets:structMap>\n</mets:mets>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def write_corpus(directory: str, files: int, seed: int = 0, **sizes) -> list[str]:
+    """
+    Writes files synthetic METS files to directory and returns their paths.
+    sizes are passed on to synthetic_mets.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f'synthetic_{i:06d}.xml')
+        with open(path, 'wb') as f:
+            f.write(synthetic_mets(seed=seed + i, **sizes))
+        paths.append(path)
+    return paths
+
+
+def add_size_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--works', metavar='<n>', type=int, default=1,
+                        help='Works per file (default: %(default)s).')
+    parser.add_argument('--data-objects', metavar='<n>', type=int, default=1,
+                        help='Data objects per file (default: %(default)s).')
+    parser.add_argument('--contributors', metavar='<n>', type=int, default=10,
+                        help='Contributors per work (default: %(default)s).')
+    parser.add_argument('--titles', metavar='<n>', type=int, default=2,
+                        help='Titles per work (default: %(default)s).')
+    parser.add_argument('--locations', metavar='<n>', type=int, default=1,
+                        help='Locations per work (default: %(default)s).')
+    parser.add_argument('--tech-kb', metavar='<kb>', type=int, default=0,
+                        help='Size of the technical metadata per file in kB (default: %(default)s).')
+
+
+def sizes_from_args(args) -> dict:
+    return {'works': args.works, 'data_objects': args.data_objects, 'contributors': args.contributors,
+            'titles': args.titles, 'locations': args.locations, 'tech_kb': args.tech_kb}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='metstohandle synthetic',
+        description='Generate synthetic METS files for tests and benchmarks.')
+    parser.add_argument(
+        '-o', '--out-dir', metavar='<directory>', required=True,
+        help='Directory to write the METS files to.')
+    parser.add_argument(
+        '-n', '--files', metavar='<n>', type=int, default=1,
+        help='Number of files (default: %(default)s).')
+    parser.add_argument(
+        '--seed', metavar='<n>', type=int, default=0,
+        help='Seed of the first file (default: %(default)s).')
+    add_size_arguments(parser)
+    args = parser.parse_args(argv)
+    paths = write_corpus(args.out_dir, args.files, seed=args.seed, **sizes_from_args(args))
+    print(f'{len(paths)} METS files written to {args.out_dir}')
+    return 0
@@ -0,0 +1,162 @@
+'''
+This module implements the lookup of controlled vocabulary.
+
+The labels used in the METS (title types, genres, credit roles,
+manifestation types) have to be translated to the values of the matching
+DTR enumeration. A label is either mapped by vocab_map.json or already a
+value of the enumeration. For every DTR type a Vocabulary is built once
+from vocab_map.json and the enumeration: both are normalized (case and
+whitespace) into frozen hash maps, so a lookup is a single dict access
+whatever the case of the label, and returns the value exactly as the DTR
+spells it.
+
+When a vocabulary is built, the targets of vocab_map.json are checked
+against the enumerations of the types it is used for, and targets that are
+no valid enum value are logged once. Titles and genres still carry such a
+target, as before the check, and a warning is logged for every one of
+them (Vocabulary.translate). A vocabulary is rebuilt when the enum cache
+returns a new enumeration, see enum_cache.py.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import logging
+import threading
+from types import MappingProxyType
+
+from mets2handle import helpers
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES
+
+logger = logging.getLogger(__name__)
+
+# DTR types whose labels are translated with vocab_map.json
+MAPPED_TYPES = (KNOWN_ENUM_TYPES['titleType'], KNOWN_ENUM_TYPES['genre'])
+
+
+def normalize(label: str) -> str:
+    return ' '.join(str(label).split()).casefold()
+
+
+class Vocabulary:
+    """
+    The values of one DTR enumeration and the entries of mapping that
+    translate to one of them, by normalized label.
+    """
+
+    def __init__(self, enum: list[str], mapping: dict[str, str] = None):
+        # The list the vocabulary was built from, to notice a new enumeration
+        self.source = enum
+        self.values = frozenset(enum)
+        by_key = {}
+        for value in enum:
+            by_key.setdefault(normalize(value), value)
+        self._values = MappingProxyType(by_key)
+        mapped = {}
+        # Labels as they are spelled in vocab_map.json or the enumeration,
+        # looked up before the label is normalized
+        exact = {value: value for value in enum}
+        # Labels whose target in vocab_map.json is no value of the enumeration
+        invalid = {}
+        for label, target in (mapping or {}).items():
+            value = by_key.get(normalize(target))
+            if value is not None:
+                mapped.setdefault(normalize(label), value)
+                exact[label] = value
+            else:
+                invalid.setdefault(normalize(label), target)
+        self._mapped = MappingProxyType(mapped)
+        self._exact = MappingProxyType(exact)
+        self._invalid = MappingProxyType(invalid)
+
+    def resolve(self, label: str):
+        """
+        The enum value for label, mapped by vocab_map.json or given as it
+        is, or None.
+        """
+        if label is None:
+            return None
+        value = self._exact.get(label)
+        if value is not None:
+            return value
+        key = normalize(label)
+        value = self._mapped.get(key)
+        return value if value is not None else self._values.get(key)
+
+    def translate(self, label: str):
+        """
+        Like resolve(), but a label that vocab_map.json maps to a target that
+        is no enum value gives that target, with a warning.
+        """
+        value = self.resolve(label)
+        if value is None and label is not None:
+            value = self._invalid.get(normalize(label))
+            if value is not None:
+                logger.warning('VOCABULARY: "%s" is mapped to "%s", which is no value of the DTR enum',
+                               label, value)
+        return value
+
+    def __contains__(self, label) -> bool:
+        return self.resolve(label) is not None
+
+
+def invalid_targets(mapping: dict[str, str], enums) -> list[str]:
+    """
+    The labels of mapping whose target is in none of the enumerations.
+    """
+    valid = {normalize(value) for enum in enums for value in enum}
+    return sorted(label for label, target in mapping.items() if normalize(target) not in valid)
+
+
+class Vocabularies:
+    """
+    The Vocabulary of every DTR type, built on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vocabularies = {}
+        # Enumerations vocab_map.json was last validated against
+        self._validated = None
+
+    def get(self, datatype: str) -> Vocabulary:
+        enum = helpers.getEnumFromType(datatype)
+        vocabulary = self._vocabularies.get(datatype)
+        if vocabulary is not None and vocabulary.source is enum:
+            return vocabulary
+        mapped = datatype in MAPPED_TYPES
+        if mapped:
+            self._validate()
+        with self._lock:
+            vocabulary = Vocabulary(enum, helpers.get_vocab_map() if mapped else None)
+            self._vocabularies[datatype] = vocabulary
+        return vocabulary
+
+    def _validate(self):
+        enums = [helpers.getEnumFromType(datatype) for datatype in MAPPED_TYPES]
+        with self._lock:
+            if self._validated is not None and all(a is b for a, b in zip(self._validated, enums)):
+                return
+            self._validated = enums
+        for label in invalid_targets(helpers.get_vocab_map(), enums):
+            logger.error('VOCABULARY: "%s" is mapped to "%s", which is no value of a DTR enum',
+                         label, helpers.get_vocab_map()[label])
+
+    def clear(self):
+        with self._lock:
+            self._vocabularies = {}
+            self._validated = None
+
+
+# Vocabularies shared by all mapping modules
+vocabularies = Vocabularies()
+
+
+def get_vocabulary(name: str) -> Vocabulary:
+    """
+    The Vocabulary of a DTR type by its name in KNOWN_ENUM_TYPES, e.g.
+    'titleType'.
+    """
+    return vocabularies.get(KNOWN_ENUM_TYPES[name])
@@ -0,0 +1,360 @@
+'''
+This module implements the watch mode of metstohandle.
+
+A long running process watches a hot folder and registers every METS file
+that is written or moved into it. The credentials, the DTR enumerations,
+pycountry and the HTTP session are loaded once and shared by all files.
+
+* Changes are reported by inotify on Linux and by polling the folder
+  (size and modification time of the files) everywhere else.
+* A file is registered when its size and modification time have not
+  changed for --settle seconds, so files that are still being written are
+  left alone. Hidden files (e.g. .name.tmp) and files that do not match the
+  pattern are ignored.
+* Files are registered in place and then moved to the done folder, or to
+  the failed folder with a .error file containing the error.
+
+Usage:
+    metstohandle watch -c <credentials> [--done <dir>] [--failed <dir>] <directory>
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+import argparse
+import fnmatch
+import logging
+import os
+import select
+import shutil
+import signal
+import struct
+import threading
+import time
+
+from mets2handle.mets_io import SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+# inotify events that a file was written or moved into the folder
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def matches(path: str, pattern: str) -> bool:
+    """
+    Whether the file in path is a METS file to register: not hidden and
+    matching pattern or one of its compressed variants.
+    """
+    name = os.path.basename(path)
+    if name.startswith('.'):
+        return False
+    return any(fnmatch.fnmatch(name, pattern + suffix) for suffix in ('',) + tuple(SUFFIXES))
+
+
+def _scan(directory: str) -> dict[str, tuple[int, int]]:
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                continue
+    return files
+
+
+class PollingWatcher:
+    """
+    Reports the files of directory that are new or whose size or
+    modification time changed since the last call.
+    """
+
+    def __init__(self, directory: str, interval: float = 1.0):
+        self.directory = directory
+        self.interval = interval
+        self._files = _scan(directory)
+
+    def changes(self, timeout: float) -> set[str]:
+        time.sleep(min(timeout, self.interval))
+        files = _scan(self.directory)
+        changed = {path for path, signature in files.items() if self._files.get(path) != signature}
+        self._files = files
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Reports the files of directory that were written, created or moved
+    into it, using inotify.
+    """
+
+    def __init__(self, directory: str):
+        import ctypes
+
+        self.directory = directory
+        libc = ctypes.CDLL(None, use_errno=True)
+        # AttributeError where there is no inotify
+        init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        self._fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        if add_watch(self._fd, os.fsencode(directory), INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, os.strerror(error), directory)
+
+    def changes(self, timeout: float) -> set[str]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, all files are checked again
+                changed.update(_scan(self.directory))
+            elif name:
+                changed.add(os.path.join(self.directory, os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def open_watcher(directory: str, interval: float = 1.0, polling: bool = False):
+    """
+    An InotifyWatcher for directory, or a PollingWatcher if polling is set
+    or inotify is not available.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (AttributeError, OSError) as error:
+            logger.warning('WATCH: inotify is not available (%s), polling %s every %s s',
+                           error, directory, interval)
+    return PollingWatcher(directory, interval)
+
+
+class Debouncer:
+    """
+    Files that changed, until their size and modification time have not
+    changed for settle seconds.
+    """
+
+    def __init__(self, settle: float = 2.0):
+        self.settle = settle
+        # Size and modification time of every file and the time they last changed
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, path: str, now: float):
+        self._pending[path] = (None, now)
+
+    def ready(self, now: float) -> list[str]:
+        """
+        Removes the files that settled from the pending ones and returns
+        them, oldest first. Files that were removed are dropped.
+        """
+        ready = []
+        for path, (signature, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                ready.append((since, path))
+        return [path for _, path in sorted(ready)]
+
+
+def _move(path: str, directory: str) -> str:
+    """
+    Moves the file in path to directory, with a time stamp prepended to its
+    name if that file exists, and returns the new path.
+    """
+    target = os.path.join(directory, os.path.basename(path))
+    if os.path.exists(target):
+        target = os.path.join(directory, time.strftime('%Y%m%dT%H%M%S_') + os.path.basename(path))
+    shutil.move(path, target)
+    return target
+
+
+def register_file(path: str, credentials: str, done_dir: str, failed_dir: str, options: dict) -> dict:
+    """
+    Registers the METS file in path in place and moves it to done_dir, or to
+    failed_dir if that fails. Returns the result as in a batch report.
+    """
+    from mets2handle.metrics import metrics
+    from mets2handle.metstohandle import m2h
+
+    start = time.perf_counter()
+    result = {'file': path, 'ok': True, 'error': None}
+    try:
+        m2h(path, credentials=credentials, **options)
+    # m2h exits on METS it cannot register, which must not stop the watch
+    except (Exception, SystemExit) as error:
+        logger.exception('WATCH: registration of %s failed', path)
+        result['ok'] = False
+        result['error'] = f'{type(error).__name__}: {error}'
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    metrics.inc('files', result='ok' if result['ok'] else 'failed')
+    try:
+        result['moved_to'] = _move(path, done_dir if result['ok'] else failed_dir)
+        if not result['ok']:
+            with open(result['moved_to'] + '.error', 'w', encoding='utf8') as f:
+                f.write(result['error'] + '\n')
+    except OSError as error:
+        logger.exception('WATCH: could not move %s', path)
+        result['moved_to'] = None
+    return result
+
+
+def watch(directory: str, credentials: str, done_dir: str = None, failed_dir: str = None,
+          settle: float = 2.0, interval: float = 1.0, pattern: str = '*.xml', polling: bool = False,
+          stop: threading.Event = None, on_result=None, **options):
+    """
+    Registers the METS files in directory and every METS file written or
+    moved into it, until stop is set. Files are moved to done_dir and
+    failed_dir, by default the folders done and failed in directory.
+    on_result is called with the result of every file. Further keyword
+    arguments are passed on to m2h.
+    """
+    from mets2handle import helpers
+    from mets2handle.metrics import metrics
+
+    done_dir = done_dir or os.path.join(directory, 'done')
+    failed_dir = failed_dir or os.path.join(directory, 'failed')
+    os.makedirs(done_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+    stop = stop or threading.Event()
+    options.setdefault('dumpjsons', False)
+    metrics_file = options.pop('metrics', None)
+
+    helpers.read_credentials(credentials)
+    try:
+        helpers.warm_up()
+    except OSError as error:
+        logger.warning('WATCH: could not prefetch DTR enums (%s)', error)
+    watcher = open_watcher(directory, interval, polling)
+    debouncer = Debouncer(settle)
+    now = time.monotonic()
+    # Files that were there before the watch started
+    for path in sorted(_scan(directory)):
+        if matches(path, pattern):
+            debouncer.touch(path, now)
+    logger.info('WATCH: watching %s', directory)
+    try:
+        while not stop.is_set():
+            # Wake up in time to register the files that settle
+            timeout = min(interval, settle) if len(debouncer) else interval
+            for path in watcher.changes(timeout):
+                if matches(path, pattern):
+                    debouncer.touch(path, time.monotonic())
+            for path in debouncer.ready(time.monotonic()):
+                if stop.is_set():
+                    break
+                result = register_file(path, credentials, done_dir, failed_dir, options)
+                logger.info('WATCH: %s %s', 'done' if result['ok'] else 'FAILED', path)
+                if metrics_file:
+                    metrics.export(metrics_file)
+                if on_result is not None:
+                    on_result(result)
+    finally:
+        watcher.close()
+
+
+def print_result(result: dict):
+    if result['ok']:
+        print(f"Registered {result['file']} in {result['seconds']} s.", flush=True)
+    else:
+        print(f"FAILED {result['file']}: {result['error']}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='metstohandle watch',
+        description='Register the METS files written or moved into a folder, until stopped.')
+    parser.add_argument(
+        '-c', '--credentials', metavar='<credentials_file>',
+        default='handle_connection.txt',
+        help='File containing credentials for access to handle system'
+        ' (default: %(default)s).')
+    parser.add_argument(
+        '--done', metavar='<directory>',
+        help='Folder the registered METS files are moved to (default: <directory>/done).')
+    parser.add_argument(
+        '--failed', metavar='<directory>',
+        help='Folder the METS files that could not be registered are moved to'
+        ' (default: <directory>/failed).')
+    parser.add_argument(
+        '--fingerprints', metavar='<fingerprint_store>',
+        help='SQLite store of the fingerprints of the records sent before. Records'
+        ' that have not changed are not sent again.')
+    parser.add_argument(
+        '--interval', metavar='<seconds>', type=float, default=1.0,
+        help='Interval of the polling, if inotify is not used (default: %(default)s).')
+    parser.add_argument(
+        '--metrics', metavar='<metrics_file>',
+        help='Write timings and counters to this file after every METS file, in the'
+        ' Prometheus text format if it ends with .prom and as JSON otherwise.')
+    parser.add_argument(
+        '--ndjson', metavar='<ndjson_file>',
+        help='Append the payloads of all records sent to this file, one JSON object per line.')
+    parser.add_argument(
+        '-p', '--pattern', metavar='<pattern>', default='*.xml',
+        help='File name pattern of the METS files, compressed files (.gz, .zst) are'
+        ' registered as well (default: %(default)s).')
+    parser.add_argument(
+        '--patch', action='store_true',
+        help='Splice the new elements into the original METS files instead of'
+        ' serializing them again.')
+    parser.add_argument(
+        '--polling', action='store_true',
+        help='Poll the folder instead of using inotify, e.g. for network file systems.')
+    parser.add_argument(
+        '--settle', metavar='<seconds>', type=float, default=2.0,
+        help='Time a METS file must not change before it is registered (default: %(default)s).')
+    parser.add_argument(
+        '-s', '--streaming', action='store_true',
+        help='Parse and write the METS files as streams, for very large files.')
+    parser.add_argument(
+        'directory', metavar='<directory>',
+        help='Folder to watch.')
+    args = parser.parse_args(argv)
+
+    stop = threading.Event()
+    # The file that is registered is finished before the watch stops
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    watch(args.directory, args.credentials, done_dir=args.done, failed_dir=args.failed,
+          settle=args.settle, interval=args.interval, pattern=args.pattern, polling=args.polling,
+          stop=stop, on_result=print_result, fingerprints=args.fingerprints, ndjson=args.ndjson,
+          patch=args.patch, streaming=args.streaming, metrics=args.metrics)
+    return 0
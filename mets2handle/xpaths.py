@@ -0,0 +1,90 @@
+'''
+This module implements the registry of precompiled XPath expressions used by
+the mapping modules (db_works_to_handle, db_version_to_handle and
+db_data_object_to_handle) and by metstohandle.
+
+Every path is compiled once at import with the namespace map bound, instead
+of being parsed again by find/findall for every call. The expressions are
+evaluated relative to the element they are called with and return a list of
+matches; first() returns the first match or None like Element.find.
+'''
+
+__author__ = "Henry Beiker, Sven Bingert"
+__copyright__ = "Copyright 2023, Stiftung Deutsche Kinemathek"
+__license__ = "GPL"
+__version__ = "3.0"
+
+from lxml import etree as ET
+
+ns = {"mets": "http://www.loc.gov/METS/", "xlink": "http://www.w3.org/1999/xlink",
+      "xsi": "http://www.w3.org/2001/XMLSchema-instance", "ebucore": "urn:ebu:metadata-schema:ebucore",
+      "dc": "http://purl.org/dc/elements/1.1/"}
+
+
+def compile_path(path: str) -> ET.XPath:
+    return ET.XPath(path, namespaces=ns)
+
+
+def first(xpath: ET.XPath, elem):
+    """
+    First result of xpath evaluated on elem or None.
+    """
+    result = xpath(elem)
+    return result[0] if result else None
+
+
+# Document structure
+EBUCORE_MAIN = compile_path('.//ebucore:ebuCoreMain')
+CORE_METADATA = compile_path('.//ebucore:coreMetadata')
+CORE_IDENTIFIER = compile_path('ebucore:identifier')
+
+# Identifiers and relations
+IDENTIFIERS = compile_path('.//ebucore:identifier')
+DC_IDENTIFIER = compile_path('.//dc:identifier')
+HANDLE_HAS_PARTS = compile_path('.//ebucore:hasPart[ebucore:relationIdentifier/@formatLabel="hdl.handle.net"]')
+HAS_PART = compile_path('.//ebucore:hasPart')
+IS_PART_OF = compile_path('.//ebucore:isPartOf')
+IS_VERSION_OF = compile_path('.//ebucore:isVersionOf')
+
+# Titles
+DC_TITLES = compile_path('.//dc:title')
+ALTERNATIVE_TITLES = compile_path('.//ebucore:alternativeTitle')
+
+# Contributors
+CONTRIBUTORS = compile_path('.//ebucore:contributor')
+ROLES = compile_path('.//ebucore:role')
+CONTACT_DETAILS = compile_path('.//ebucore:contactDetails')
+CONTACT_DETAILS_CHILD = compile_path('./ebucore:contactDetails')
+NAME_CHILD = compile_path('./ebucore:name')
+# Kept as in the original mapping, matches un-namespaced elements only
+HAS_AGENT_CONTRIBUTORS = compile_path('.//ebucore_contributor')
+ORGANISATION_DETAILS = compile_path('.//ebucore:organisationDetails')
+ORGANISATION_NAME = compile_path('.//ebucore:organisationDetails//ebucore:organisationName')
+PROVIDER_ORGANISATION_NAME = compile_path(
+    './/ebucore:metadataProvider//ebucore:organisationDetails//ebucore:organisationName')
+
+# Dates and durations
+DATES = compile_path('.//ebucore:date')
+CREATED = compile_path('.//ebucore:created')
+DATE_ANY_CREATED = compile_path('.//ebucore:date//ebucore:created')
+DATE_RELEASED = compile_path('.//ebucore:date//ebucore:released')
+DURATION = compile_path('.//ebucore:duration')
+NORMAL_PLAY_TIME = compile_path('.//ebucore:normalPlayTime')
+
+# Classification
+GENRES = compile_path('.//ebucore:genre')
+OBJECT_TYPES = compile_path('.//ebucore:type//ebucore:objectType')
+LANGUAGES = compile_path('.//ebucore:language')
+DC_LANGUAGE = compile_path('.//dc:language')
+LOCATIONS = compile_path('.//ebucore:location')
+LOCATION_NAME = compile_path('.//ebucore:name')
+
+# Formats and descriptions
+FORMATS = compile_path('.//ebucore:format')
+MATERIAL_ATTRIBUTES = {
+    (prefix, suffix): compile_path(f'ebucore:{prefix}Format/ebucore:technicalAttributeString'
+                                   f'[@typeLabel="material{suffix}"]')
+    for prefix in ('video', 'audio') for suffix in ('Format', 'Type')}
+FILE_SIZE = compile_path('.//ebucore:format//ebucore:fileSize')
+DESCRIPTIONS = compile_path('.//ebucore:description')
+DC_DESCRIPTION = compile_path('.//dc:description')
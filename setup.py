@@ -6,6 +6,7 @@ setup(name='mets2handle',
       url='https://github.com/AV-EFI/mets2handle_dk',
       author='Henry Beiker, Sven Bingert',
       packages=['mets2handle'],
+      package_data={'mets2handle': ['vocab_map.json']},
       zip_safe=False,
       install_requires=[
         'typing==3.7.4.3',
@@ -15,6 +16,9 @@ setup(name='mets2handle',
         'uuid==1.30',
         'pycountry==22.3.5'
         ],
+      extras_require={
+          'zstd': ['zstandard'],
+      },
       entry_points={
           'console_scripts': [
               'metstohandle=mets2handle.metstohandle:cli_entry_point',
@@ -0,0 +1,77 @@
+import itertools
+import threading
+import uuid
+
+import pytest
+from lxml import etree as ET
+
+from mets2handle import mets_io
+from mets2handle import xpaths as xp
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES, enum_cache
+from mets2handle.local_server import LocalHandleServer
+from mets2handle.metstohandle import m2h
+from mets2handle.synthetic import synthetic_mets
+
+# Enumerations of the local DTR, with the values the synthetic METS use
+ENUMS = {
+    KNOWN_ENUM_TYPES['titleType']: ['Original Title', 'Alternative Title'],
+    KNOWN_ENUM_TYPES['creditRole']: ['Director', 'Producer'],
+    KNOWN_ENUM_TYPES['genre']: ['Fiction', 'Documentary'],
+    KNOWN_ENUM_TYPES['yearOfReferenceType']: ['Created'],
+    KNOWN_ENUM_TYPES['manifestationType']: ['Restoration', 'Unknown'],
+}
+
+
+@pytest.fixture
+def handle_server(tmp_path, monkeypatch):
+    """
+    A local handle server and DTR, with the credentials for it in
+    server.credentials.
+    """
+    server = LocalHandleServer(('127.0.0.1', 0), enums=ENUMS)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(enum_cache, 'base_url', server.url + '/objects/')
+    monkeypatch.setattr(enum_cache, 'cache_dir', None)
+    monkeypatch.setattr(enum_cache, '_entries', {})
+    server.credentials = str(tmp_path / 'credentials.txt')
+    server.write_credentials(server.credentials)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def write_mets(tmp_path):
+    """
+    Writes a synthetic METS file and returns its path.
+    """
+    def write(name='mets.xml', **sizes):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(synthetic_mets(seed=0, **sizes))
+        return str(path)
+    return write
+
+
+def handle_pids(dmdsec) -> list[str]:
+    return [xp.first(xp.DC_IDENTIFIER, identifier).text.strip()
+            for identifier in xp.IDENTIFIERS(dmdsec) if identifier.get('formatLabel') == 'hdl.handle.net']
+
+
+def dmdsecs(path: str, kind: str) -> list:
+    """
+    The dmdSecs of a METS file whose ID starts with DMD_<kind>.
+    """
+    root = ET.parse(path).getroot()
+    return [dmdsec for dmdsec in root.iter('{http://www.loc.gov/METS/}dmdSec')
+            if dmdsec.get('ID').startswith('DMD_' + kind.upper())]
+
+
+def register(server, source, out_file, monkeypatch, **options):
+    # The same PIDs in every run, so that the outputs can be compared
+    counter = itertools.count(1)
+    monkeypatch.setattr(uuid, 'uuid4', lambda: uuid.UUID(int=next(counter)))
+    m2h(source, out_file=out_file, credentials=server.credentials, dumpjsons=False, **options)
+    with mets_io.open_input(out_file) as f:
+        return ET.tostring(ET.parse(f), method='c14n')
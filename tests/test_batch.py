@@ -0,0 +1,156 @@
+import os
+
+import pytest
+
+from mets2handle import helpers
+from mets2handle import xpaths as xp
+from mets2handle.batch import _register_file, coalesce_version_updates, out_paths, run_batch
+from mets2handle.journal import WRITTEN, BatchJournal
+from mets2handle.metstohandle import m2h
+
+from conftest import ENUMS, dmdsecs, handle_pids
+
+
+def version_data_objects(server, version_pid: str) -> list[str]:
+    details = helpers.read_credentials(server.credentials)
+    return helpers.getDAtaObejctPidsFrom_Versionhandle(version_pid, details['url'], details['user'],
+                                                       details['password'])
+
+
+@pytest.fixture
+def new_data_object(handle_server, write_mets, tmp_path):
+    """
+    A METS of a registered version with a DataObject that is not
+    registered yet. Returns its path and the PID of the version.
+    """
+    registered = write_mets('registered.xml')
+    m2h(registered, credentials=handle_server.credentials, dumpjsons=False)
+    version_pid = handle_pids(dmdsecs(registered, 'version')[0])[0]
+
+    tree = dmdsecs(registered, 'version')[0].getroottree()
+    data_object = [dmdsec for dmdsec in tree.getroot().iter('{http://www.loc.gov/METS/}dmdSec')
+                   if dmdsec.get('ID').startswith('DMD_DATAOBJECT')][0]
+    for identifier in xp.IDENTIFIERS(data_object):
+        if identifier.get('formatLabel') == 'hdl.handle.net':
+            identifier.getparent().remove(identifier)
+    for is_part_of in xp.IS_PART_OF(data_object):
+        if is_part_of.find('.//{urn:ebu:metadata-schema:ebucore}relationIdentifier[@formatLabel="hdl.handle.net"]') \
+                is not None:
+            is_part_of.getparent().remove(is_part_of)
+    path = str(tmp_path / 'new_data_object.xml')
+    tree.write(path, xml_declaration=True, encoding='utf-8')
+    return path, version_pid
+
+
+def test_version_update_survives_interrupted_batch(handle_server, new_data_object, tmp_path):
+    path, version_pid = new_data_object
+    journal = str(tmp_path / 'journal.sqlite')
+    # The worker finishes the file, the batch is killed before it updates the version
+    result = _register_file(path, None, handle_server.credentials, {'dumpjsons': False}, journal)
+    assert result['ok']
+    data_object_pid = handle_pids(dmdsecs(path, 'dataobject')[0])[0]
+    assert data_object_pid not in version_data_objects(handle_server, version_pid)
+    assert BatchJournal(journal).written_files() == {os.path.abspath(path)}
+
+    report = run_batch([path], handle_server.credentials, workers=1, journal=journal)
+    assert report['skipped'] == 1
+    assert report['versions_updated'] == [version_pid]
+    assert data_object_pid in version_data_objects(handle_server, version_pid)
+    assert BatchJournal(journal).pending_version_updates() == []
+
+
+def test_version_update_is_repaired_without_journal(handle_server, new_data_object):
+    path, version_pid = new_data_object
+    # The METS already lists the new DataObject, the version record does not
+    _register_file(path, None, handle_server.credentials, {'dumpjsons': False})
+    data_object_pid = handle_pids(dmdsecs(path, 'dataobject')[0])[0]
+    assert data_object_pid not in version_data_objects(handle_server, version_pid)
+
+    report = run_batch([path], handle_server.credentials, workers=1)
+    assert report['failed'] == 0
+    assert data_object_pid in version_data_objects(handle_server, version_pid)
+
+
+def test_resume_reuses_planned_pids(handle_server, write_mets, tmp_path):
+    path = write_mets(data_objects=2)
+    journal_path = str(tmp_path / 'journal.sqlite')
+    journal = BatchJournal(journal_path)
+    entry = journal.entry(path)
+    # First run: registered, but interrupted before the METS was written
+    original = open(path, 'rb').read()
+    m2h(path, out_file=str(tmp_path / 'lost.xml'), credentials=handle_server.credentials,
+        dumpjsons=False, journal=entry)
+    planned = journal.entry(path).pids
+    records = len(handle_server.records)
+
+    report = run_batch([path], handle_server.credentials, workers=1, journal=journal_path)
+    assert report['succeeded'] == 1
+    assert open(path, 'rb').read() != original
+    written = {dmdsec.get('ID'): handle_pids(dmdsec)[0]
+               for kind in ('work', 'version', 'dataobject') for dmdsec in dmdsecs(path, kind)}
+    assert written == planned
+    # Nothing was registered twice
+    assert len(handle_server.records) == records
+    assert journal.entry(path).state == WRITTEN
+
+
+def test_coalesce_version_updates():
+    updates = [
+        {'version': 'V1', 'data_objects': ['D1'], 'payload': {'n': 1}},
+        {'version': 'V2', 'data_objects': ['D3'], 'payload': {'n': 2}},
+        {'version': 'V1', 'data_objects': ['D2', 'D1'], 'payload': {'n': 3}},
+    ]
+    assert coalesce_version_updates(updates) == {
+        'V1': {'data_objects': ['D1', 'D2'], 'payload': {'n': 3}},
+        'V2': {'data_objects': ['D3'], 'payload': {'n': 2}},
+    }
+
+
+def test_out_paths_keep_subdirectories(tmp_path):
+    files = [str(tmp_path / 'in' / 'a' / 'mets.xml'), str(tmp_path / 'in' / 'b' / 'mets.xml')]
+    assert out_paths(files, 'out') == {files[0]: os.path.join('out', 'a', 'mets.xml'),
+                                       files[1]: os.path.join('out', 'b', 'mets.xml')}
+    assert out_paths(files[:1], 'out') == {files[0]: os.path.join('out', 'mets.xml')}
+
+
+def test_metrics_include_worker_warm_up(handle_server, write_mets, tmp_path, monkeypatch):
+    from mets2handle.metrics import metrics
+
+    # No snapshot, the workers fetch the DTR enums when they start
+    monkeypatch.setenv('METS2HANDLE_SNAPSHOT', str(tmp_path / 'no-snapshot.pickle'))
+    helpers.load_reference_data.cache_clear()
+    metrics.reset()
+    try:
+        run_batch([write_mets('a.xml'), write_mets('b.xml')], handle_server.credentials, workers=1)
+        counters = metrics.summary()['counters']
+    finally:
+        helpers.load_reference_data.cache_clear()
+        metrics.reset()
+    assert counters['enum_cache_lookups{result="miss"}'] == len(ENUMS)
+    assert counters['files{result="ok"}'] == 2
+
+
+def test_main_options(monkeypatch, write_mets):
+    from mets2handle import batch
+
+    calls = []
+
+    def fake_run_batch(files, credentials, **options):
+        calls.append(options)
+        return {'total': 1, 'skipped': 1, 'succeeded': 0, 'failed': 0, 'seconds': 0.1,
+                'versions_updated': [], 'failures': [], 'version_failures': [], 'results': []}
+
+    monkeypatch.setattr(batch, 'run_batch', fake_run_batch)
+    assert batch.main(['-P', '2', '-j', '3', write_mets()]) == 0
+    assert calls[0]['workers'] == 2
+    assert calls[0]['max_in_flight'] == 3
+    batch.main([write_mets()])
+    assert 'max_in_flight' not in calls[1]
+
+
+def test_report_counts_skipped_files(capsys):
+    from mets2handle.batch import print_report
+
+    print_report({'total': 3, 'skipped': 3, 'succeeded': 0, 'failed': 0, 'seconds': 0.1,
+                  'failures': []})
+    assert capsys.readouterr().out.startswith('3 METS files in 0.1 s: 0 registered, 3 skipped, 0 failed.')
@@ -0,0 +1,37 @@
+import pytest
+
+from mets2handle.countries import CountryResolver
+
+
+@pytest.fixture(scope='module')
+def resolver():
+    return CountryResolver()
+
+
+@pytest.mark.parametrize('name, alpha_2', [
+    ('Deutschland', 'DE'),
+    ('BRD', 'DE'),
+    ('DDR', 'DD'),
+    ('  weimarer  Republik', 'DE'),
+    ('Frankreich', 'FR'),
+    ('Federal Republic of Germany', 'DE'),
+])
+def test_known_names_are_exact(resolver, name, alpha_2):
+    match = resolver.resolve(name)
+    assert (match.alpha_2, match.approximate) == (alpha_2, False)
+
+
+def test_unknown_names_are_approximate(resolver):
+    assert resolver.resolve('Deutschlnd') == ('DE', 'deutschland', True)
+    # Subdivisions are matched by their country
+    assert resolver.resolve('Bayern').alpha_2 == 'DE'
+    assert resolver.resolve('xyzzy') is None
+
+
+def test_resolved_names_are_memoized():
+    resolver = CountryResolver(names={'deutschland': 'DE'}, subdivisions={})
+    for _ in range(3):
+        resolver.resolve('Deutschland')
+    assert resolver.resolve.cache_info().hits == 2
+    resolver.seed({'deutschland': 'DD'}, {})
+    assert resolver.resolve('Deutschland').alpha_2 == 'DD'
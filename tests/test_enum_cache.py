@@ -0,0 +1,53 @@
+import threading
+import time
+
+from mets2handle.enum_cache import EnumCache
+
+
+def test_fetch_does_not_block_cached_lookups():
+    cache = EnumCache(cache_dir=None, base_url='http://127.0.0.1:9/objects/')
+    cache.seed({'cached': ['Value']})
+    started, release = threading.Event(), threading.Event()
+
+    def slow_revalidate(datatype, entry):
+        started.set()
+        release.wait(10)
+        return {'datatype': datatype, 'enum': ['Fetched'], 'fetched_at': 0}
+
+    cache._revalidate = slow_revalidate
+    fetch = threading.Thread(target=cache.get, args=('missing',))
+    fetch.start()
+    try:
+        assert started.wait(10)
+        lookup = threading.Thread(target=cache.get, args=('cached',))
+        lookup.start()
+        lookup.join(5)
+        assert not lookup.is_alive()
+    finally:
+        release.set()
+        fetch.join(10)
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_outage_is_not_retried_on_every_lookup(monkeypatch):
+    import urllib.request
+    from urllib.error import URLError
+
+    requests = []
+
+    def unreachable(request, timeout=None):
+        requests.append(request.full_url)
+        raise URLError('connection refused')
+
+    monkeypatch.setattr(urllib.request, 'urlopen', unreachable)
+    cache = EnumCache(cache_dir=None, ttl=60, retry_after=0.5)
+    cache.seed({'expired': ['Stale']}, fetched_at=0)
+    assert cache.get('expired') == ['Stale']
+    assert cache.get('expired') == ['Stale']
+    assert len(requests) == 1
+    # Revalidated again once retry_after has passed
+    time.sleep(0.6)
+    assert cache.get('expired') == ['Stale']
+    assert cache.get('expired') == ['Stale']
+    assert len(requests) == 2
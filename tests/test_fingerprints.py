@@ -0,0 +1,49 @@
+import json
+
+from lxml import etree as ET
+
+from mets2handle import xpaths as xp
+from mets2handle.fingerprints import fingerprint
+from mets2handle.metstohandle import m2h
+
+from conftest import dmdsecs, handle_pids
+
+
+def puts(server) -> int:
+    return sum(count for request, count in server.stats.items() if request.startswith('PUT '))
+
+
+def test_fingerprint_ignores_attribution_date():
+    source = {'sourceAttribution': {'attributionDate': '2023-05-01T10:00:00Z', 'attributionType': 'Created'}}
+    later = {'sourceAttribution': {'attributionType': 'Created', 'attributionDate': '2024-01-01T00:00:00Z'}}
+    assert fingerprint('work', source) == fingerprint('work', later)
+    assert fingerprint('work', source) != fingerprint('version', source)
+
+
+def test_refresh_skips_unchanged_records(handle_server, write_mets, tmp_path):
+    path = write_mets(works=2)
+    store = str(tmp_path / 'fingerprints.sqlite')
+    m2h(path, credentials=handle_server.credentials, dumpjsons=False, fingerprints=store)
+    registered = puts(handle_server)
+
+    m2h(path, credentials=handle_server.credentials, dumpjsons=False, fingerprints=store, refresh=True)
+    assert puts(handle_server) == registered
+
+    # Only the work whose title changed is sent again
+    tree = ET.parse(path)
+    work = [dmdsec for dmdsec in tree.getroot().iter('{http://www.loc.gov/METS/}dmdSec')
+            if dmdsec.get('ID').startswith('DMD_WORK')][0]
+    xp.first(xp.DC_TITLES, work).text = 'Changed title'
+    tree.write(path, xml_declaration=True, encoding='utf-8')
+    m2h(path, credentials=handle_server.credentials, dumpjsons=False, fingerprints=store, refresh=True)
+    assert puts(handle_server) == registered + 1
+    work_pid = handle_pids(dmdsecs(path, 'work')[0])[0]
+    assert 'Changed title' in json.dumps(handle_server.records[work_pid])
+
+
+def test_refresh_without_store_sends_all_records(handle_server, write_mets):
+    path = write_mets()
+    m2h(path, credentials=handle_server.credentials, dumpjsons=False)
+    registered = puts(handle_server)
+    m2h(path, credentials=handle_server.credentials, dumpjsons=False, refresh=True)
+    assert puts(handle_server) == 2 * registered
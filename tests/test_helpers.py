@@ -0,0 +1,47 @@
+import pickle
+import time
+
+import pytest
+
+from mets2handle import helpers
+from mets2handle.countries import country_resolver
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES, enum_cache
+from mets2handle.snapshot import SNAPSHOT_FORMAT
+
+
+def write_snapshot(tmp_path, monkeypatch, created: float):
+    snapshot = {'format': SNAPSHOT_FORMAT, 'created': created, 'vocab_map': {},
+                'enums': {datatype: ['Value'] for datatype in KNOWN_ENUM_TYPES.values()},
+                'countries': {'deutschland': 'DE'}, 'subdivisions': {}}
+    path = tmp_path / 'snapshot.pickle'
+    path.write_bytes(pickle.dumps(snapshot))
+    monkeypatch.setenv('METS2HANDLE_SNAPSHOT', str(path))
+    # Nothing listens there, every request to the DTR fails
+    monkeypatch.setattr(enum_cache, 'base_url', 'http://127.0.0.1:9/objects/')
+    monkeypatch.setattr(enum_cache, 'cache_dir', None)
+    monkeypatch.setattr(enum_cache, '_entries', {})
+    monkeypatch.setattr(enum_cache, 'misses', 0)
+    monkeypatch.setattr(country_resolver, '_names', None)
+    monkeypatch.setattr(country_resolver, '_subdivisions', None)
+    helpers.load_reference_data.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_reference_data():
+    yield
+    helpers.load_reference_data.cache_clear()
+
+
+def test_warm_up_uses_snapshot(tmp_path, monkeypatch):
+    write_snapshot(tmp_path, monkeypatch, created=time.time())
+    helpers.warm_up()
+    assert enum_cache.misses == 0
+    assert country_resolver.names == {'deutschland': 'DE'}
+
+
+def test_old_snapshot_is_revalidated(tmp_path, monkeypatch):
+    write_snapshot(tmp_path, monkeypatch, created=time.time() - 2 * enum_cache.ttl)
+    helpers.warm_up()
+    # The DTR is requested, and the snapshot used since it cannot be reached
+    assert enum_cache.misses == len(KNOWN_ENUM_TYPES)
+    assert helpers.getEnumFromType(KNOWN_ENUM_TYPES['genre']) == ['Value']
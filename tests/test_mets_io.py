@@ -0,0 +1,44 @@
+import gzip
+import mmap
+
+import pytest
+
+from mets2handle import mets_io
+
+from conftest import register
+
+
+def compress(path: str, compression: str) -> str:
+    suffix = {'gzip': '.gz', 'zstd': '.zst'}[compression]
+    with open(path, 'rb') as f:
+        data = f.read()
+    if compression == 'gzip':
+        data = gzip.compress(data)
+    else:
+        data = pytest.importorskip('zstandard').ZstdCompressor().compress(data)
+    with open(path + suffix, 'wb') as f:
+        f.write(data)
+    return path + suffix
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+@pytest.mark.parametrize('options', [{}, {'streaming': True}, {'patch': True}], ids=['full', 'streaming', 'patch'])
+def test_compressed_round_trip(handle_server, write_mets, tmp_path, monkeypatch, compression, options):
+    source = write_mets(works=2, data_objects=2)
+    compressed = compress(source, compression)
+    expected = register(handle_server, source, str(tmp_path / 'plain.xml'), monkeypatch)
+    # Written with the compression of the input it replaces
+    out_file = str(tmp_path / 'out.xml')
+    with open(out_file, 'wb') as f:
+        f.write(open(compressed, 'rb').read())
+    assert register(handle_server, compressed, out_file, monkeypatch, **options) == expected
+    assert mets_io.input_compression(out_file) == compression
+
+
+def test_plain_input_is_memory_mapped(write_mets):
+    path = write_mets()
+    with mets_io.open_input(path) as f:
+        assert isinstance(f, mmap.mmap)
+        assert f.read(5) == b'<?xml'
+    with mets_io.open_input(compress(path, 'gzip')) as f:
+        assert f.read(5) == b'<?xml'
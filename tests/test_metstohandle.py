@@ -0,0 +1,24 @@
+import re
+
+from mets2handle import helpers
+from mets2handle.metstohandle import m2h
+
+from conftest import dmdsecs, handle_pids
+
+
+def test_data_objects_share_one_version_record(handle_server, write_mets, capsys):
+    path = write_mets(works=3, data_objects=2)
+    m2h(path, credentials=handle_server.credentials, dumpjsons=False)
+
+    version_pid = handle_pids(dmdsecs(path, 'version')[0])[0]
+    data_object_pids = [handle_pids(dmdsec)[0] for dmdsec in dmdsecs(path, 'dataobject')]
+    details = helpers.read_credentials(handle_server.credentials)
+    assert helpers.getDAtaObejctPidsFrom_Versionhandle(version_pid, details['url'], details['user'],
+                                                       details['password']) == data_object_pids
+    # 3 works, 1 version, 2 data objects, each sent once
+    assert handle_server.stats['PUT 201'] == 6
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 6
+    for line in lines:
+        assert re.fullmatch(r'PID for (work|version|data object): \S+/[0-9a-f-]{36}', line), line
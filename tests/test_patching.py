@@ -0,0 +1,55 @@
+import gzip
+
+import pytest
+from lxml import etree as ET
+
+from mets2handle.metstohandle import m2h
+
+from conftest import register
+
+MODES = {
+    'streaming': {'streaming': True},
+    'patch': {'patch': True},
+    'streaming_patch': {'streaming': True, 'patch': True},
+}
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_outputs_are_equivalent(handle_server, write_mets, tmp_path, monkeypatch, mode):
+    source = write_mets(works=3, data_objects=2)
+    full = register(handle_server, source, str(tmp_path / 'full.xml'), monkeypatch)
+    other = register(handle_server, source, str(tmp_path / f'{mode}.xml'), monkeypatch, **MODES[mode])
+    assert other == full
+
+
+def test_patch_of_compressed_mets(handle_server, write_mets, tmp_path, monkeypatch):
+    source = write_mets(works=2)
+    compressed = str(tmp_path / 'mets.xml.gz')
+    with open(source, 'rb') as f, gzip.open(compressed, 'wb') as out:
+        out.write(f.read())
+    full = register(handle_server, source, str(tmp_path / 'full.xml'), monkeypatch)
+    out_file = str(tmp_path / 'patched.xml.gz')
+    register(handle_server, compressed, out_file, monkeypatch, patch=True)
+    with gzip.open(out_file, 'rb') as f:
+        assert ET.tostring(ET.fromstring(f.read()).getroottree(), method='c14n') == full
+
+
+def test_patch_keeps_untouched_bytes(handle_server, write_mets, tmp_path, monkeypatch):
+    source = write_mets()
+    original = open(source, 'rb').read()
+    out_file = str(tmp_path / 'patched.xml')
+    register(handle_server, source, out_file, monkeypatch, patch=True)
+    patched = open(out_file, 'rb').read()
+    assert len(patched) > len(original)
+    first_dmdsec = original.index(b'<mets:dmdSec')
+    assert patched[:first_dmdsec] == original[:first_dmdsec]
+
+
+def test_patch_refuses_other_encodings(handle_server, write_mets, tmp_path):
+    tree = ET.parse(write_mets())
+    source = str(tmp_path / 'latin1.xml')
+    tree.write(source, xml_declaration=True, encoding='iso-8859-1')
+    with pytest.raises(ValueError):
+        m2h(source, out_file=str(tmp_path / 'out.xml'), credentials=handle_server.credentials,
+            dumpjsons=False, patch=True)
+    assert not handle_server.records
@@ -0,0 +1,39 @@
+import random
+
+from mets2handle import session
+
+
+def test_pool_grows_to_concurrency(monkeypatch):
+    monkeypatch.delenv('METS2HANDLE_HTTP_POOLSIZE', raising=False)
+    monkeypatch.setattr(session, '_session', None)
+    monkeypatch.setattr(session, '_settings', {})
+    assert session.get_session().pool_maxsize == session.DEFAULT_POOL_MAXSIZE
+    first = session.get_session(4)
+    assert session.get_session(32).pool_maxsize == 32
+    assert session.get_session(4) is session.get_session(32)
+    assert first.pool_maxsize == session.DEFAULT_POOL_MAXSIZE
+
+
+def test_pool_size_from_environment_takes_precedence(monkeypatch):
+    monkeypatch.setenv('METS2HANDLE_HTTP_POOLSIZE', '5')
+    monkeypatch.setattr(session, '_session', None)
+    monkeypatch.setattr(session, '_settings', {})
+    assert session.get_session(32).pool_maxsize == 5
+
+
+def test_transient_errors_are_retried(handle_server, write_mets, monkeypatch):
+    from mets2handle.metstohandle import m2h
+
+    monkeypatch.setattr(session, '_session', None)
+    monkeypatch.setattr(session, '_settings', {})
+    session.configure(retries=20, backoff_factor=0)
+    handle_server.error_rate = 0.5
+    handle_server.random = random.Random(1)
+    try:
+        path = write_mets(works=2, data_objects=2)
+        m2h(path, credentials=handle_server.credentials, dumpjsons=False)
+    finally:
+        session.configure()
+    assert handle_server.stats['PUT 503'] > 0
+    assert handle_server.stats['PUT 201'] == 5
+    assert len(handle_server.records) == 5
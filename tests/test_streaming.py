@@ -0,0 +1,27 @@
+from lxml import etree as ET
+
+from mets2handle.metstohandle import m2h
+from mets2handle.streaming import parse_skeleton
+
+from conftest import dmdsecs, handle_pids
+
+METS = '{http://www.loc.gov/METS/}'
+
+
+def test_skeleton_keeps_only_dmdsecs_and_structmap(write_mets):
+    path = write_mets(works=2, tech_kb=64)
+    root = parse_skeleton(path).getroot()
+    assert [child.tag for child in root] == [METS + 'dmdSec'] * 4 + [METS + 'structMap']
+    assert len(ET.tostring(root)) < 64 * 1024
+
+
+def test_streaming_keeps_the_other_sections(handle_server, write_mets, tmp_path):
+    path = write_mets(tech_kb=64)
+    out_file = str(tmp_path / 'out.xml')
+    m2h(path, out_file=out_file, credentials=handle_server.credentials, dumpjsons=False, streaming=True)
+    original, written = ET.parse(path).getroot(), ET.parse(out_file).getroot()
+    for section in ('amdSec', 'fileSec', 'structMap'):
+        assert ET.tostring(written.find(METS + section), method='c14n') == \
+            ET.tostring(original.find(METS + section), method='c14n')
+    for kind in ('work', 'version', 'dataobject'):
+        assert all(handle_pids(dmdsec) for dmdsec in dmdsecs(out_file, kind))
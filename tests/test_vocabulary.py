@@ -0,0 +1,57 @@
+import pytest
+from lxml import etree as ET
+
+from mets2handle import db_version_to_handle, db_works_to_handle, helpers
+from mets2handle.enum_cache import KNOWN_ENUM_TYPES
+from mets2handle.vocabulary import vocabularies
+
+ENUMS = {
+    KNOWN_ENUM_TYPES['titleType']: ['Original Title'],
+    KNOWN_ENUM_TYPES['creditRole']: ['Director', 'Set Designer'],
+    KNOWN_ENUM_TYPES['genre']: ['Fiction'],
+}
+VOCAB_MAP = {'Originaltitel': 'Original Title', 'Arbeitstitel': 'Working Title', 'Spielfilm': 'Feature'}
+
+DMDSEC = b'''<mets:dmdSec xmlns:mets="http://www.loc.gov/METS/" xmlns:ebucore="urn:ebu:metadata-schema:ebucore"
+    xmlns:dc="http://purl.org/dc/elements/1.1/" ID="DMD_WORK_1">
+  <ebucore:title typeLabel="Originaltitel"><dc:title>Menschen am Sonntag</dc:title></ebucore:title>
+  <ebucore:title typeLabel="Arbeitstitel"><dc:title>Sonntag</dc:title></ebucore:title>
+  <ebucore:title typeLabel="Unbekannt"><dc:title>Unknown</dc:title></ebucore:title>
+  <ebucore:contributor>
+    <ebucore:contactDetails><ebucore:name>Siodmak, Robert</ebucore:name></ebucore:contactDetails>
+    <ebucore:role typeLabel="director"/>
+  </ebucore:contributor>
+  <ebucore:contributor>
+    <ebucore:contactDetails contactId="http://d-nb.info/gnd/1"><ebucore:name>Family, Given</ebucore:name>
+    </ebucore:contactDetails>
+    <ebucore:role typeLabel="set designer"/>
+  </ebucore:contributor>
+  <ebucore:type><ebucore:genre typeLabel="Spielfilm"/><ebucore:genre typeLabel="fiction"/></ebucore:type>
+</mets:dmdSec>'''
+
+
+@pytest.fixture
+def dmdsec(monkeypatch):
+    monkeypatch.setattr(helpers, 'getEnumFromType', lambda datatype: ENUMS[datatype])
+    monkeypatch.setattr(helpers, 'get_vocab_map', lambda: VOCAB_MAP)
+    vocabularies.clear()
+    yield ET.fromstring(DMDSEC)
+    vocabularies.clear()
+
+
+def test_titles_keep_targets_that_are_no_enum_value(dmdsec, caplog):
+    expected = [{'titleValue': 'Menschen am Sonntag', 'titleType': 'Original Title'},
+                {'titleValue': 'Sonntag', 'titleType': 'Working Title'}]
+    assert db_works_to_handle.get_title(dmdsec, None) == expected
+    assert db_version_to_handle.get_titles(dmdsec, None) == expected
+    assert '"Arbeitstitel" is mapped to "Working Title"' in caplog.text
+
+
+def test_genres_keep_targets_that_are_no_enum_value(dmdsec):
+    assert db_works_to_handle.get_genre(dmdsec, None) == ['Feature', 'Fiction']
+
+
+def test_credit_roles_are_spelled_as_in_the_enum(dmdsec):
+    roles = [credit['role'] for credit in db_works_to_handle.get_credits(dmdsec, None)]
+    # Not 'Set designer', as capitalize() made of the METS label
+    assert roles == ['Director', 'Set Designer']
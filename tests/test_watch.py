@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+
+import pytest
+
+from mets2handle.watch import Debouncer, matches, watch
+
+from conftest import dmdsecs, handle_pids
+
+
+def test_debouncer_waits_until_files_settle(tmp_path):
+    path = tmp_path / 'mets.xml'
+    path.write_bytes(b'<mets')
+    debouncer = Debouncer(settle=2)
+    debouncer.touch(str(path), 0)
+    assert debouncer.ready(0) == []
+    # Still being written
+    path.write_bytes(b'<mets></mets>')
+    assert debouncer.ready(1.5) == []
+    assert debouncer.ready(3) == []
+    assert debouncer.ready(3.5) == [str(path)]
+    assert len(debouncer) == 0
+
+
+def test_matches():
+    assert matches('/hot/mets.xml', '*.xml')
+    assert matches('/hot/mets.xml.gz', '*.xml')
+    assert not matches('/hot/.mets.xml', '*.xml')
+    assert not matches('/hot/mets.xml.part', '*.xml')
+
+
+@pytest.mark.parametrize('polling', [True, False], ids=['polling', 'inotify'])
+def test_watch_registers_dropped_files(handle_server, write_mets, tmp_path, polling):
+    hot = tmp_path / 'hot'
+    hot.mkdir()
+    results = []
+    stop = threading.Event()
+
+    def on_result(result):
+        results.append(result)
+        if len(results) == 2:
+            stop.set()
+
+    thread = threading.Thread(target=watch, args=(str(hot), handle_server.credentials),
+                              kwargs={'settle': 0.2, 'interval': 0.05, 'polling': polling,
+                                      'stop': stop, 'on_result': on_result})
+    thread.start()
+    try:
+        time.sleep(0.2)
+        os.replace(write_mets('incoming/mets.xml'), hot / 'mets.xml')
+        (hot / 'broken.xml').write_bytes(b'<mets:mets')
+        thread.join(30)
+    finally:
+        stop.set()
+        thread.join(5)
+    assert sorted(result['ok'] for result in results) == [False, True]
+    done = hot / 'done' / 'mets.xml'
+    assert all(handle_pids(dmdsec) for dmdsec in dmdsecs(str(done), 'work'))
+    assert (hot / 'failed' / 'broken.xml').exists()
+    assert (hot / 'failed' / 'broken.xml.error').read_text()
+    assert not (hot / 'mets.xml').exists()